@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+    Memory and latency of the in-process catalog snapshot against the ORM.
+
+    python benchmarks/catalog_snapshot.py --webshop 1 [--settings simpleAPI.settings] [-n 200] [--page-size 50]
+
+    Measures the memory of one snapshot against the same products as model
+    instances (Python 3, tracemalloc) and the latency of the product list
+    view served by each, in-process through the Django test client against
+    the configured (migrated, populated) database.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def allocated(func):
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def run(client, url, requests, webshop):
+    timings = []
+    for _ in range(requests):
+        started = time.time()
+        client.get(url, HTTP_X_WEBSHOP='{}'.format(webshop))
+        timings.append((time.time() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', default='simpleAPI.settings')
+    parser.add_argument('--webshop', type=int, required=True)
+    parser.add_argument('-n', '--requests', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.core.urlresolvers import reverse
+    from django.test import Client
+
+    from webshops import snapshot
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.WEBSHOPS_SNAPSHOT_REFRESH_SECONDS = 60
+
+    catalog = snapshot.CatalogSnapshot(args.webshop)
+    if sys.version_info[0] >= 3:
+        products, orm_size = allocated(
+            lambda: list(catalog.get_product_queryset()))
+        _, snapshot_size = allocated(catalog.load)
+        print('{} products: ORM {:.1f} MB, snapshot {:.1f} MB'.format(
+            len(products), orm_size / 2.0 ** 20, snapshot_size / 2.0 ** 20))
+        del products
+
+    url = '{}?page_size={}'.format(reverse('webshops:api_product-list'), args.page_size)
+    client = Client()
+    for label, max_rows in (('ORM', 0), ('snapshot', 10 ** 9)):
+        settings.WEBSHOPS_SNAPSHOT_MAX_ROWS = max_rows
+        run(client, url, 1, args.webshop)  # loads the snapshot
+        timings = run(client, url, args.requests, args.webshop)
+        print('{:<9} p50 {:7.2f} ms  p90 {:7.2f} ms  p99 {:7.2f} ms'.format(
+            label, percentile(timings, 50), percentile(timings, 90),
+            percentile(timings, 99)))
+
+
+if __name__ == '__main__':
+    main()
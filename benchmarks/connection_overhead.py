@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+    Request latency with and without persistent database connections.
+
+    python benchmarks/connection_overhead.py [--settings simpleAPI.settings_production] [-n 500] [--url /webshops/api/category/]
+
+    Runs the requests in-process through the Django test client against the
+    configured (migrated) database, once with CONN_MAX_AGE=0 and once with
+    the configured max age, and prints p50/p90/p99 in milliseconds.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def run(client, url, requests):
+    timings = []
+    for _ in range(requests):
+        started = time.time()
+        client.get(url)
+        timings.append((time.time() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', default='simpleAPI.settings_production')
+    parser.add_argument('-n', '--requests', type=int, default=500)
+    parser.add_argument('--url', default='/webshops/api/category/')
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    client = Client()
+    max_age = connection.settings_dict.get('CONN_MAX_AGE') or 600
+    for label, age in (('CONN_MAX_AGE=0', 0), ('CONN_MAX_AGE={}'.format(max_age), max_age)):
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = age
+        timings = run(client, args.url, args.requests)
+        print('{:<20} p50 {:7.2f}ms  p90 {:7.2f}ms  p99 {:7.2f}ms'.format(
+            label, percentile(timings, 50), percentile(timings, 90),
+            percentile(timings, 99)))
+
+
+if __name__ == '__main__':
+    main()
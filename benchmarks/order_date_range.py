@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+    Date range queries over a large order table.
+
+    python benchmarks/order_date_range.py [--settings simpleAPI.settings] [--populate 10000000] [--webshop 1]
+
+    --populate bulk inserts that many orders spread over five years into the
+    configured (migrated) database first; use a scratch database. Then times
+    one month, one week and one day counts and listings (shop-wide, paid,
+    one webshop) and prints the query plan of each, which should be a
+    range scan of one of the date indexes instead of a full table scan.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH_SIZE = 10000
+
+
+def populate(count, webshop_ids):
+    from django.db import transaction
+    from django.utils import timezone
+
+    from webshops.models import Order
+
+    end = timezone.now()
+    span = int(datetime.timedelta(days=5 * 365).total_seconds())
+    # spread the dates instead of stamping them with now
+    Order._meta.get_field('date').auto_now_add = False
+    for offset in range(0, count, BATCH_SIZE):
+        with transaction.atomic():
+            Order.objects.bulk_create([
+                Order(webshop_id=random.choice(webshop_ids), subtotal=10, vat=1, total=11,
+                      paid=random.random() < .8, shipped=random.random() < .7,
+                      date=end - datetime.timedelta(seconds=random.randrange(span)))
+                for _ in range(min(BATCH_SIZE, count - offset))])
+        print('{} orders'.format(min(offset + BATCH_SIZE, count)), end='\r')
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', default='simpleAPI.settings')
+    parser.add_argument('--populate', type=int, default=0)
+    parser.add_argument('--webshop', type=int, action='append')
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.utils import timezone
+
+    from webshops.models import Order
+
+    webshop_ids = args.webshop or [None]
+    if args.populate:
+        populate(args.populate, webshop_ids)
+
+    end = timezone.now() - datetime.timedelta(days=400)
+    for label, days in (('month', 30), ('week', 7), ('day', 1)):
+        start = end - datetime.timedelta(days=days)
+        querysets = (
+            ('all', Order.objects.placed_between(start, end)),
+            ('paid', Order.objects.placed_between(start, end).filter(paid=True)),
+            ('webshop', Order.objects.placed_between(start, end).filter(
+                webshop=webshop_ids[0])),
+        )
+        for name, queryset in querysets:
+            started = time.time()
+            count = queryset.count()
+            list(queryset.order_by('-date')[:50])
+            elapsed = (time.time() - started) * 1000
+            print('{:<6} {:<8} {:9d} orders {:9.2f} ms'.format(label, name, count, elapsed))
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+                cursor.execute(explain + sql, params)
+                for row in cursor.fetchall():
+                    print('    {}'.format(row[-1]))
+
+
+if __name__ == '__main__':
+    main()
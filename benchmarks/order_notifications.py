@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+    CPU time of rendering order status notifications: one pair of
+    render_to_string calls per order against webshops.notifications.
+
+    python benchmarks/order_notifications.py [-n 10000] [--webshops 10]
+
+    Works on unsaved orders and webshops, no database is needed.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--orders', type=int, default=10000)
+    parser.add_argument('--webshops', type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'simpleAPI.settings')
+    import django
+    django.setup()
+
+    from django.template.loader import render_to_string
+    from django.utils import timezone
+
+    from webshops import notifications
+    from webshops.models import Order, Webshop
+
+    webshops = [
+        Webshop(pk=_i + 1, name='Shop {}'.format(_i), modified_at=timezone.now())
+        for _i in range(args.webshops)]
+    orders = [
+        Order(pk=_i + 1, webshop=webshops[_i % len(webshops)],
+              paid=_i % 3 == 1, shipped=_i % 3 == 2, email='customer@example.com')
+        for _i in range(args.orders)]
+
+    def per_call():
+        for order in orders:
+            status = notifications.get_status(order)
+            context = {'order': order, 'subject': 'Order #{}'.format(order.pk),
+                       'status': status, 'webshop': order.webshop}
+            render_to_string('emails/order_{}.html'.format(status), context)
+            render_to_string('emails/order_{}.txt'.format(status), context)
+
+    def batched():
+        for _ in notifications.render_batch(orders):
+            pass
+
+    for label, func in (('render_to_string', per_call), ('notifications', batched)):
+        started = time.time()
+        func()
+        elapsed = time.time() - started
+        print('{:<17} {:8.3f} s  {:7.1f} us/order'.format(
+            label, elapsed, elapsed * 10 ** 6 / len(orders)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+    CPU time of the per-product pricing accessors (get_price, get_vat,
+    get_price_wtihout_vat, vat_amount) as called while serializing and
+    pricing one product, with and without the memoized Product.get_pricing.
+
+    python benchmarks/product_pricing.py [-n 100000]
+
+    Works on unsaved instances, no database is needed.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import decimal
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def accessors(product):
+    product.get_price()
+    product.get_vat()
+    product.get_price_wtihout_vat()
+    product.vat_amount()
+    product.get_price()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--products', type=int, default=100000)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'simpleAPI.settings')
+    import django
+    django.setup()
+
+    from webshops.models import Product
+
+    parent = Product(pk=1, price=decimal.Decimal('12.50'), vat=Product.VAT_HIGH)
+    products = [
+        Product(pk=_i + 2, parent=parent, structure=Product.CHILD)
+        if _i % 2 else Product(pk=_i + 2, price=decimal.Decimal('9.99'))
+        for _i in range(args.products)]
+
+    def resolve_every_call(product):
+        for _accessor in (product.get_price, product.get_vat,
+                          product.get_price_wtihout_vat, product.vat_amount,
+                          product.get_price):
+            product.__dict__.pop('_pricing', None)
+            _accessor()
+
+    for label, func in (('per call', resolve_every_call), ('memoized', accessors)):
+        for _product in products:
+            _product.__dict__.pop('_pricing', None)
+        started = time.time()
+        for _product in products:
+            func(_product)
+        elapsed = time.time() - started
+        print('{:<9} {:8.3f} s  {:6.2f} us/product'.format(
+            label, elapsed, elapsed * 10 ** 6 / len(products)))
+
+
+if __name__ == '__main__':
+    main()
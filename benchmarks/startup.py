@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+    Cold start time of the WSGI, Celery worker and manage.py entry points.
+
+    python benchmarks/startup.py [-n 5] [--top 10]
+
+    Every entry point is started -n times in a fresh interpreter; the median
+    wall time is printed. On Python 3.7+ the slowest imports reported by
+    ``python -X importtime`` (cumulative microseconds) are listed as well.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = (
+    ('wsgi', 'simpleAPI.settings', [
+        '-c', 'import simpleAPI.wsgi']),
+    ('celery', 'simpleAPI.settings_worker', [
+        '-c', 'from simpleAPI.celery_init import app; '
+              'import django; django.setup(); '
+              'app.loader.import_default_modules()']),
+    ('manage.py', 'simpleAPI.settings', [
+        'manage.py', 'check']),
+)
+
+HAS_IMPORTTIME = sys.version_info >= (3, 7)
+
+
+def run(settings, args):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings)
+    command = [sys.executable] + (['-X', 'importtime'] if HAS_IMPORTTIME else []) + args
+    started = time.time()
+    process = subprocess.Popen(
+        command, cwd=ROOT, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+    return time.time() - started, stderr.decode('utf-8', 'replace')
+
+
+def slowest_imports(stderr, top):
+    """ (cumulative us, module) of the slowest top level imports """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nested imports are indented, only keep the top level ones
+        if name.startswith(' ') and not name.startswith('  '):
+            try:
+                imports.append((int(cumulative), name.strip()))
+            except ValueError:
+                pass
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    for name, settings, command in ENTRY_POINTS:
+        timings, stderr = [], ''
+        for _ in range(args.runs):
+            seconds, stderr = run(settings, command)
+            timings.append(seconds)
+        print('{:<10} median {:7.1f}ms'.format(
+            name, sorted(timings)[len(timings) // 2] * 1000))
+        for cumulative, module in slowest_imports(stderr, args.top):
+            print('    {:8.1f}ms  {}'.format(cumulative / 1000.0, module))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+    Requests per second of the storefront home payload with sequential and
+    with concurrent (thread pool) ORM reads.
+
+    python benchmarks/storefront_rps.py --webshop 1 [--settings simpleAPI.settings] [--clients 4] [--seconds 10]
+
+    The view is called in-process through the Django test client from
+    --clients threads against the configured (migrated, populated) database.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure(url, clients, seconds):
+    from django.db import connection
+    from django.test import Client
+
+    done = []
+    deadline = time.time() + seconds
+
+    def _worker():
+        client, count = Client(), 0
+        while time.time() < deadline:
+            client.get(url)
+            count += 1
+        connection.close()
+        done.append(count)
+
+    threads = [threading.Thread(target=_worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(done) / float(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', default='simpleAPI.settings')
+    parser.add_argument('--webshop', type=int, required=True)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.core.urlresolvers import reverse
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    url = reverse('webshops:api_webshop-home', kwargs=dict(pk=args.webshop))
+    workers = settings.WEBSHOPS_FANOUT_WORKERS or 8
+    for label, value in (('sequential', 0), ('fan-out x{}'.format(workers), workers)):
+        settings.WEBSHOPS_FANOUT_WORKERS = value
+        print('{:<16} {:8.1f} req/s'.format(
+            label, measure(url, args.clients, args.seconds)))
+
+
+if __name__ == '__main__':
+    main()
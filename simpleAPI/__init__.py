@@ -1,7 +1,6 @@
 from __future__ import absolute_import, unicode_literals
 
-# This will make sure the app is always imported when
-# Django starts so that shared_task will use this app.
-from .celery_init import app as celery_app
-
-__all__ = ('celery_app',)
+# The Celery app (simpleAPI.celery_init) is not imported here, so plain
+# Django processes (WSGI, manage.py) don't pay for loading Celery at start
+# up. webshops.tasks imports it when a task is first used; workers load it
+# with: celery -A simpleAPI.celery_init worker
@@ -1,6 +1,7 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery import signals
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'simpleAPI.settings')
@@ -12,7 +13,27 @@ app = Celery('simpleAPI')
 # Using a string here means the worker will not have to
 # pickle the object when using Windows.
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
+# only apps which have tasks; the lookup runs when the worker imports
+# the task modules, not when this module is imported
+app.autodiscover_tasks(lambda: settings.TASK_APPS)
+
+
+@signals.worker_process_init.connect
+def _close_inherited_connections(**kwargs):
+    from simpleAPI import db
+    db.close_inherited_connections()
+
+
+@signals.task_prerun.connect
+def _prepare_task_connections(**kwargs):
+    from simpleAPI import db
+    db.prepare_task_connections()
+
+
+@signals.task_postrun.connect
+def _release_task_connections(**kwargs):
+    from simpleAPI import db
+    db.release_task_connections()
 
 
 @app.task(bind=True)
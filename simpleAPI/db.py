@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+    Persistent database connection management:
+
+    - health checks of reused connections (at most once per
+      ``CONN_HEALTH_CHECK_SECONDS``) at request and task start
+    - Celery workers drop connections inherited from the parent process and
+      reuse their own connection across tasks up to ``CONN_MAX_AGE``
+    - per-endpoint statement timeouts (PostgreSQL only)
+"""
+from __future__ import absolute_import, unicode_literals
+
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections, connection, connections
+
+
+def check_connections(**kwargs):
+    """ Closes reused connections which don't answer anymore """
+    interval = getattr(settings, 'CONN_HEALTH_CHECK_SECONDS', None)
+    if interval is None:
+        return
+    now = time.time()
+    for conn in connections.all():
+        if conn.connection is None:
+            continue
+        if now - getattr(conn, 'health_checked_at', 0) < interval:
+            continue
+        conn.health_checked_at = now
+        if not conn.is_usable():
+            conn.close()
+
+
+# runs after django.db.close_old_connections, which is connected first
+request_started.connect(check_connections)
+
+
+def close_inherited_connections(**kwargs):
+    """ A forked worker process must not share the parent's sockets """
+    for conn in connections.all():
+        conn.close()
+
+
+def prepare_task_connections(**kwargs):
+    close_old_connections()
+    check_connections()
+
+
+def release_task_connections(**kwargs):
+    # closes the connection only when it's older than CONN_MAX_AGE or broken
+    close_old_connections()
+
+
+class StatementTimeoutMiddleware(object):
+    """
+        Sets the PostgreSQL statement_timeout for the resolved endpoint from
+        ``settings.STATEMENT_TIMEOUTS`` ({url name: milliseconds}), falling
+        back to ``STATEMENT_TIMEOUTS['default']``
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timeouts = getattr(settings, 'STATEMENT_TIMEOUTS', None)
+        if not timeouts or connection.vendor != 'postgresql':
+            return None
+        match = request.resolver_match
+        name = match and match.view_name
+        timeout = timeouts.get(name, timeouts.get('default', 0))
+        with connection.cursor() as cursor:
+            # the session setting survives on persistent connections, so it is
+            # set on every request
+            cursor.execute('SET statement_timeout = %s', [int(timeout)])
+        return None
@@ -0,0 +1,57 @@
+"""
+Production settings profile for simpleAPI.
+
+    DJANGO_SETTINGS_MODULE=simpleAPI.settings_production
+
+Database connections are kept open between requests (and between Celery
+tasks in a worker process) for DATABASE_CONN_MAX_AGE seconds and checked
+with a ping at most every CONN_HEALTH_CHECK_SECONDS, see simpleAPI/db.py.
+Each web worker thread and each Celery worker process holds one
+connection, so size the database (or pgbouncer) pool for
+web threads + Celery concurrency.
+"""
+import os
+
+from simpleAPI.settings import *  # noqa
+
+DEBUG = False
+TEMPLATES[0]['OPTIONS']['debug'] = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '').split()
+
+if os.environ.get('DATABASE_NAME'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['DATABASE_NAME'],
+        'USER': os.environ.get('DATABASE_USER', ''),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+        'HOST': os.environ.get('DATABASE_HOST', ''),
+        'PORT': os.environ.get('DATABASE_PORT', ''),
+        'OPTIONS': {
+            'connect_timeout': 5,
+        },
+    }
+
+for _alias in DATABASES:
+    DATABASES[_alias]['CONN_MAX_AGE'] = int(
+        os.environ.get('DATABASE_CONN_MAX_AGE', 600))
+
+CONN_HEALTH_CHECK_SECONDS = 30
+
+# milliseconds per url name, PostgreSQL only
+STATEMENT_TIMEOUTS = {
+    'default': 5000,
+    'webshops:api_product-list': 2000,
+    'webshops:api_category-list': 2000,
+    'webshops:api_product-batch': 2000,
+    'webshops:api_product-inventory': 30000,
+    'webshops:api_cart-price': 3000,
+}
+
+WEBSHOPS_THROTTLE_RATES = {
+    'catalog': (120, 20),
+}
+
+# Celery workers keep their connection between tasks, see simpleAPI/db.py
+CELERY_WORKER_MAX_TASKS_PER_CHILD = 1000
@@ -0,0 +1,22 @@
+"""
+Settings for Celery worker processes.
+
+    DJANGO_SETTINGS_MODULE=simpleAPI.settings_worker celery -A simpleAPI.celery_init worker
+
+Workers don't serve requests, so the admin, sessions, messages and static
+files apps and all middleware are left out to keep start up short.
+"""
+from simpleAPI.settings_production import *  # noqa
+
+INSTALLED_APPS = [
+    _app for _app in INSTALLED_APPS if _app not in (
+        'django.contrib.admin',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+        'django.contrib.staticfiles',
+        'django_filters',
+        'rest_framework',
+    )
+]
+
+MIDDLEWARE = []
@@ -1,12 +1,146 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import json
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.db.models.functions import Coalesce
+from django.utils import six
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext_lazy as _
 
 from webshops import models as wmodels
 
-admin.site.register(wmodels.Webshop)
-admin.site.register(wmodels.Category)
-admin.site.register(wmodels.Product)
-admin.site.register(wmodels.Order)
-admin.site.register(wmodels.OrderProduct)
+
+def _where_sql(queryset):
+    compiler = queryset.query.get_compiler(queryset.db)
+    return compiler.compile(queryset.query.where)
+
+
+def is_unfiltered(queryset):
+    """
+        Whether the queryset has no filters besides the ones of the model's
+        default manager (soft delete, tenant scope)
+    """
+    try:
+        return _where_sql(queryset) == _where_sql(queryset.model._default_manager.all())
+    except EmptyResultSet:
+        return False
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+        Counts at most settings.WEBSHOPS_ADMIN_COUNT_LIMIT rows instead of a
+        full table COUNT(*); unfiltered changelists (the default manager's
+        rows) on PostgreSQL bigger than that report the planner's row estimate
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.WEBSHOPS_ADMIN_COUNT_LIMIT
+        queryset = self.object_list.order_by()
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and is_unfiltered(queryset):
+            sql, params = queryset.values('pk').query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, six.string_types):
+                plan = json.loads(plan)
+            estimate = plan[0]['Plan']['Plan Rows']
+            if estimate > limit:
+                return int(estimate)
+        return queryset.values('pk')[:limit].count()
+
+
+class BigTableAdmin(admin.ModelAdmin):
+    """ changelists of tables too big for exact counts """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+def _count_subquery(queryset, field):
+    """ COUNT(*) of the queryset rows pointing to the outer row """
+    return Coalesce(models.Subquery(
+        queryset.filter(**{field: models.OuterRef('pk')}).order_by().values(
+            field).annotate(_count=models.Count('pk')).values('_count'),
+        output_field=models.IntegerField()), 0)
+
+
+@admin.register(wmodels.Webshop)
+class WebshopAdmin(admin.ModelAdmin):
+    list_display = ('name', 'active', 'num_products', 'num_categories', 'added_at')
+    list_filter = ('active',)
+    search_fields = ('name',)
+
+    def get_queryset(self, request):
+        return super(WebshopAdmin, self).get_queryset(request).annotate(
+            _num_products=_count_subquery(
+                wmodels.Product._base_manager.filter(deleted_at__isnull=True),
+                'webshop'),
+            _num_categories=_count_subquery(
+                wmodels.Category._base_manager.filter(deleted_at__isnull=True),
+                'webshop'))
+
+    def num_products(self, obj):
+        return obj._num_products
+    num_products.short_description = _("Products")
+    num_products.admin_order_field = '_num_products'
+
+    def num_categories(self, obj):
+        return obj._num_categories
+    num_categories.short_description = _("Categories")
+    num_categories.admin_order_field = '_num_categories'
+
+
+@admin.register(wmodels.Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'webshop', 'parent', 'active')
+    list_select_related = ('webshop', 'parent')
+    list_filter = ('active', 'webshop')
+    raw_id_fields = ('parent',)
+    search_fields = ('name',)
+
+
+@admin.register(wmodels.Product)
+class ProductAdmin(BigTableAdmin):
+    list_display = (
+        'name', 'webshop', 'category', 'parent', 'structure', 'active',
+        'price', 'pcs_in_stock')
+    list_select_related = ('webshop', 'category', 'parent')
+    list_filter = ('active', 'structure', 'webshop')
+    raw_id_fields = ('webshop', 'category', 'parent')
+
+
+@admin.register(wmodels.Order)
+class OrderAdmin(BigTableAdmin):
+    list_display = ('id', 'webshop', 'customer', 'date', 'paid', 'shipped', 'total')
+    list_select_related = ('webshop', 'customer')
+    list_filter = ('paid', 'shipped')
+    raw_id_fields = ('webshop',)
+
+
+@admin.register(wmodels.OrderProduct)
+class OrderProductAdmin(BigTableAdmin):
+    list_display = ('id', 'order', 'name', 'quantity', 'price')
+    raw_id_fields = ('order', 'product')
+
+
+@admin.register(wmodels.Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'webshop', 'kind', 'value', 'active', 'starts_at', 'ends_at')
+    list_select_related = ('webshop',)
+    list_filter = ('active', 'kind')
+    raw_id_fields = ('webshop', 'category', 'product')
+
+
+@admin.register(wmodels.EmailDelivery)
+class EmailDeliveryAdmin(BigTableAdmin):
+    list_display = ('key', 'status', 'attempts', 'modified_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('=key',)
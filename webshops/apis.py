@@ -1,31 +1,250 @@
 import rest_framework.decorators
+import rest_framework.exceptions
 import rest_framework.mixins
+import rest_framework.permissions
+import rest_framework.response
 import rest_framework.viewsets
 
 from django_filters.rest_framework import DjangoFilterBackend
 
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
 
-from webshops.models import Category, Product, Order
-from webshops.pagination import ProductPagination
+from webshops.models import Category, Product, Order, Webshop
+from webshops.pagination import OrderHistoryPagination, ProductPagination
+from webshops import coalescing
+from webshops import concurrency
+from webshops import feeds
+from webshops import inventory
+from webshops import pricing
+from webshops import promotions
+from webshops import routers
 from webshops import serializers
+from webshops import snapshot
+from webshops import storefront
+from webshops import tenancy
+from webshops import throttling
 
 
-class CategoryViewSet(rest_framework.viewsets.ReadOnlyModelViewSet):
+class ChangeFeedMixin(object):
+    """
+        Adds ``changes`` list route: upserts and soft-deletions of one webshop
+        since the given cursor, ordered by (modified_at, pk)
+    """
+    feed_select_related = ()
+
+    def get_feed_queryset(self):
+        return self.model.objects.with_deleted().select_related(
+            *self.feed_select_related)
+
+    @rest_framework.decorators.action(detail=False, methods=['get'])
+    def changes(self, request, *args, **kwargs):
+        params = serializers.ChangeFeedSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        queryset = self.get_feed_queryset().filter(
+            webshop=params.validated_data['webshop'])
+        try:
+            upserts, deletions, cursor, has_more = feeds.get_changes(
+                queryset, params.validated_data.get('cursor'),
+                params.validated_data['limit'])
+        except ValueError:
+            raise rest_framework.exceptions.ValidationError(
+                {'cursor': ['Invalid cursor.']})
+
+        return rest_framework.response.Response({
+            'cursor': cursor,
+            'has_more': has_more,
+            'upserts': self.get_serializer(upserts, many=True).data,
+            'deletions': deletions,
+        })
+
+
+class TenantScopedMixin(object):
+    """
+        Scopes the class level queryset (built at import time, outside of any
+        request) to the webshop of the current request
+    """
+
+    tenant_field = 'webshop'
+
+    def get_queryset(self):
+        return tenancy.scope_queryset(
+            super(TenantScopedMixin, self).get_queryset(), self.tenant_field)
+
+
+class SnapshotMixin(object):
+    """
+        Serves list and retrieve from the in-process catalog snapshot of the
+        current webshop (webshops.snapshot) when it's enabled and the request
+        could read from a replica as well, i.e. may be slightly stale
+    """
+    snapshot_params = ()
+
+    def get_snapshot(self):
+        if set(self.request.query_params) - set(self.snapshot_params):
+            return None
+        if not routers.replica_reads_allowed():
+            return None
+        return snapshot.get_snapshot(tenancy.get_current_webshop_id())
+
+    def get_snapshot_pk(self):
+        try:
+            return int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except (KeyError, ValueError):
+            return None
+
+    def list(self, request, *args, **kwargs):
+        catalog = self.get_snapshot()
+        response = catalog and self.snapshot_list(catalog)
+        if response is None:
+            return super(SnapshotMixin, self).list(request, *args, **kwargs)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        catalog = self.get_snapshot()
+        response = catalog and self.snapshot_retrieve(catalog, self.get_snapshot_pk())
+        if response is None:
+            return super(SnapshotMixin, self).retrieve(request, *args, **kwargs)
+        return response
+
+
+class CoalescedListMixin(object):
+    """
+        Identical concurrent list requests (same URL, webshop and replica
+        routing) share one computation, see webshops.coalescing
+    """
+
+    def get_list_data(self, request, *args, **kwargs):
+        response = super(CoalescedListMixin, self).list(request, *args, **kwargs)
+        return response.data, response.status_code
+
+    def list(self, request, *args, **kwargs):
+        key = (
+            self.__class__.__name__, request.build_absolute_uri(),
+            tenancy.get_current_webshop_id(), routers.replica_reads_allowed())
+        data, status = coalescing.group.do(
+            key, lambda: self.get_list_data(request, *args, **kwargs))
+        return rest_framework.response.Response(data, status=status)
+
+
+class WebshopViewSet(TenantScopedMixin, rest_framework.viewsets.ReadOnlyModelViewSet):
+    serializer_class = serializers.WebshopSerializer
+    throttle_classes = (throttling.CatalogThrottle,)
+    model = Webshop
+    queryset = model.objects.all()
+    tenant_field = 'pk'
+
+    def get_home_data(self, webshop, compiled_promotions):
+        context = self.get_serializer_context()
+        context['promotions'] = {webshop.pk: compiled_promotions}
+        data = concurrency.fan_out(
+            categories=lambda: storefront.build_tree(
+                webshop.get_categories().active().values_list('pk', 'name', 'parent')),
+            featured=lambda: serializers.ProductSerializer(
+                webshop.get_products().featured().select_related(
+                    'category', 'parent').with_display_values()[
+                        :settings.WEBSHOPS_HOME_FEATURED],
+                many=True, context=context).data,
+            num_products=lambda: webshop.get_products().count(),
+        )
+        # the categories the tree shows
+        data['num_categories'] = storefront.count_nodes(data['categories'])
+        data['webshop'] = self.get_serializer(webshop).data
+        return data
+
+    @rest_framework.decorators.action(detail=True, methods=['get'])
+    def home(self, request, *args, **kwargs):
+        """
+            Storefront front page: shop, active category tree, featured
+            products and counts. Built from a fixed number of queries and
+            cached until the next catalog change of the shop or the next
+            start/end of one of its promotions
+        """
+        webshop = self.get_object()
+        key = storefront.cache_key('home', webshop.pk)
+        data = cache.get(key)
+        if data is None:
+            # concurrent misses build the payload once
+            try:
+                data = coalescing.group.do(
+                    key, lambda: self.build_home_data(webshop, key))
+            except concurrency.FanOutTimeout:
+                return rest_framework.response.Response(
+                    {'detail': 'The storefront is busy, try again later.'},
+                    status=503, headers={'Retry-After': '5'})
+        return rest_framework.response.Response(data)
+
+    def build_home_data(self, webshop, key):
+        compiled = promotions.get_promotions(webshop.pk)
+        data = self.get_home_data(webshop, compiled)
+        timeout = storefront.cache_timeout()
+        if compiled.valid_until is not None:
+            timeout = min(timeout, max(1, int(
+                (compiled.valid_until - timezone.now()).total_seconds())))
+        cache.set(key, data, timeout)
+        return data
+
+
+class CategoryViewSet(
+    TenantScopedMixin, CoalescedListMixin, SnapshotMixin, ChangeFeedMixin,
+    rest_framework.viewsets.ReadOnlyModelViewSet
+):
     serializer_class = serializers.LightCategorySerializer
+    throttle_classes = (throttling.CatalogThrottle,)
     model = Category
     queryset = model.objects.select_related('parent').all()
     filter_backends = (DjangoFilterBackend,)
     filter_fields = ('webshop', 'parent', 'active')
+    feed_select_related = ('parent',)
+    snapshot_params = filter_fields
 
     def get_serializer_class(self):
         if self.action in ('retrieve',):
             return serializers.CategoryDetailSerializer
         return self.serializer_class
 
+    def filter_snapshot(self, catalog):
+        """
+            filter_fields applied to the snapshot records, None for values
+            the filter backend should validate
+        """
+        params = self.request.query_params
+        records = catalog.category_list
+        if 'webshop' in params and params['webshop'] != '{}'.format(catalog.webshop_id):
+            return None
+        if 'parent' in params:
+            try:
+                parent_id = int(params['parent'])
+            except ValueError:
+                return None
+            if parent_id not in catalog.categories:
+                return None
+            records = [_record for _record in records if _record.parent_id == parent_id]
+        # NullBooleanSelect values, anything else doesn't filter
+        active = {'2': True, 'True': True, 'true': True,
+                  '3': False, 'False': False, 'false': False}.get(params.get('active'))
+        if active is not None:
+            records = [_record for _record in records if _record.active == active]
+        return records
+
+    def snapshot_list(self, catalog):
+        records = self.filter_snapshot(catalog)
+        if records is None:
+            return None
+        return rest_framework.response.Response(
+            [_record.light_data() for _record in records])
+
+    def snapshot_retrieve(self, catalog, pk):
+        record = catalog.categories.get(pk)
+        return record and rest_framework.response.Response(record.detail_data())
+
 
-class ProductIdOnlyViewSet(rest_framework.viewsets.ModelViewSet):
+class ProductIdOnlyViewSet(TenantScopedMixin, rest_framework.viewsets.ModelViewSet):
     serializer_class = serializers.ProductIdOnlySerializer
+    throttle_classes = (throttling.CatalogThrottle,)
     model = Product
     queryset = model.objects.select_related(
         'webshop', 'category', 'category__parent',
@@ -35,30 +254,171 @@ class ProductIdOnlyViewSet(rest_framework.viewsets.ModelViewSet):
     fields = ('active', 'parent', 'webshop', 'structure', 'category')
 
 
-class ProductViewSet(ProductIdOnlyViewSet):
+class ProductViewSet(
+    CoalescedListMixin, SnapshotMixin, ChangeFeedMixin, ProductIdOnlyViewSet
+):
+    batch_max_ids = 300
+    snapshot_params = ('page', 'page_size')
+
     serializer_class = serializers.ProductSerializer
     queryset = Product.objects.select_related(
         'webshop', 'category', 'category__parent',
         'webshop', 'webshop',
         'parent'
-    ).annotate(
-        parent_qty_in_stock=models.F('parent__pcs_in_stock'),
-    ).all()
+    ).with_display_values()
     pagination_class = ProductPagination
+    feed_select_related = ('webshop', 'category', 'parent')
 
     def get_serializer_class(self):
-        if self.action in ('retrieve', ):
+        if self.action in ('retrieve', 'batch'):
             return serializers.ProductDetailSerializer
         elif self.action in ('create', 'partial_update', 'update'):
             return serializers.ProductDetailSerializer
         return self.serializer_class
 
+    def snapshot_list(self, catalog):
+        compiled = promotions.get_promotions(catalog.webshop_id)
+        records = catalog.product_list
+        page = self.paginate_queryset(records)
+        data = [
+            catalog.product_data(_record, compiled)
+            for _record in (records if page is None else page)]
+        if page is None:
+            return rest_framework.response.Response(data)
+        return self.get_paginated_response(data)
+
+    def snapshot_retrieve(self, catalog, pk):
+        record = catalog.products.get(pk)
+        data = record and catalog.product_detail_data(
+            record, promotions.get_promotions(catalog.webshop_id))
+        return data and rest_framework.response.Response(data)
+
+    def get_batch_ids(self, request):
+        if request.method == 'POST':
+            data = request.data
+        else:
+            ids = request.query_params.get('ids', '')
+            data = {'ids': ids.split(',') if ids else []}
+        serializer = serializers.ProductBatchSerializer(
+            data=data, context={'max_ids': self.batch_max_ids})
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['ids']
+
+    @rest_framework.decorators.action(detail=False, methods=['get', 'post'])
+    def batch(self, request, *args, **kwargs):
+        """ Products by ``ids`` in the request order plus the missing ids """
+        ids = self.get_batch_ids(request)
+        objects = self.filter_queryset(self.get_queryset()).in_bulk(ids)
+        parent_ids = set(Product.objects.filter(
+            parent__in=list(objects)).values_list('parent', flat=True))
 
-class OrderViewSet(rest_framework.viewsets.ModelViewSet):
+        context = self.get_serializer_context()
+        context['parent_ids'] = parent_ids
+        serializer = self.get_serializer_class()(
+            [objects[_id] for _id in ids if _id in objects],
+            many=True, context=context)
+        return rest_framework.response.Response({
+            'results': serializer.data,
+            'missing': [_id for _id in ids if _id not in objects],
+        })
+
+    @rest_framework.decorators.action(detail=False, methods=['post'])
+    def inventory(self, request, *args, **kwargs):
+        """ Bulk stock update, see webshops.inventory """
+        serializer = serializers.InventoryUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        updated, conflicts = inventory.apply_stock_updates(
+            serializer.validated_data['items'])
+        return rest_framework.response.Response({
+            'updated': len(updated),
+            'conflicts': conflicts,
+        })
+
+    @rest_framework.decorators.action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        """ One operation over many products, see serializers.ProductBulkSerializer """
+        serializer = serializers.ProductBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        ids = data['ids']
+        operations = {
+            serializer.DELETE: lambda _qs: _qs.soft_delete(),
+            serializer.ACTIVATE: lambda _qs: _qs.set_active(True),
+            serializer.DEACTIVATE: lambda _qs: _qs.set_active(False),
+            serializer.SET_CATEGORY: lambda _qs: _qs.set_category(data['category']),
+            serializer.SET_FEATURED: lambda _qs: _qs.set_featured(data['featured']),
+        }
+
+        with transaction.atomic():
+            found = set(self.filter_queryset(self.get_queryset()).filter(
+                pk__in=ids).values_list('pk', flat=True))
+            updated = operations[data['operation']](
+                Product.objects.filter(pk__in=list(found))) if found else 0
+        return rest_framework.response.Response({
+            'updated': updated,
+            'missing': [_id for _id in ids if _id not in found],
+        })
+
+
+class OrderViewSet(TenantScopedMixin, rest_framework.viewsets.ModelViewSet):
     model = Order
     serializer_class = serializers.OrderSerializer
     queryset = model.objects.all()
     #filter_backends = (DjangoFilterBackend,)
     #filter_fields = ('paid', 'shipped', 'customer', 'company')
     filter_backends = (DjangoFilterBackend,)
-    filter_fields = ('customer',)
+    # date ranges (date__gte, date__lt) are range scans of the date indexes
+    filter_fields = {
+        'customer': ['exact'],
+        'paid': ['exact'],
+        'shipped': ['exact'],
+        'date': ['gte', 'lt'],
+    }
+
+    def get_history_customer(self, request):
+        """ the current user, only staff may ask for another ``customer`` """
+        customer = request.query_params.get('customer')
+        if customer is None:
+            return request.user.pk
+        try:
+            customer = int(customer)
+        except ValueError:
+            raise rest_framework.exceptions.ValidationError(
+                {'customer': ['A valid integer is required.']})
+        if customer != request.user.pk and not request.user.is_staff:
+            raise rest_framework.exceptions.PermissionDenied()
+        return customer
+
+    @rest_framework.decorators.action(
+        detail=False, methods=['get'],
+        permission_classes=[rest_framework.permissions.IsAuthenticated])
+    def history(self, request, *args, **kwargs):
+        """
+            Orders of the current user (staff: of ``customer``), newest first
+            with their lines; every page costs two queries
+        """
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            customer=self.get_history_customer(request),
+            deleted_at__isnull=True,
+        ).prefetch_related('orderproduct_set')
+        paginator = OrderHistoryPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = serializers.OrderDetailSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+
+class CartViewSet(rest_framework.viewsets.ViewSet):
+
+    @rest_framework.decorators.action(detail=False, methods=['post'])
+    def price(self, request, *args, **kwargs):
+        """ Prices the whole cart with one query """
+        serializer = serializers.CartSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = pricing.price_cart(
+            ((_line['product'], _line['quantity'])
+             for _line in serializer.validated_data['lines']),
+            get_promotions=promotions.get_promotions)
+        return rest_framework.response.Response(
+            serializers.PricedCartSerializer(result).data)
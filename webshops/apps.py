@@ -6,3 +6,6 @@ from django.apps import AppConfig
 
 class WebshopsConfig(AppConfig):
     name = 'webshops'
+
+    def ready(self):
+        import webshops.signals  # noqa
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+    Purges soft-deleted rows out of the hot tables in small batches,
+    each batch in its own short transaction.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import time
+
+from django.core import serializers
+from django.db import transaction
+from django.utils import timezone
+
+from webshops.models import ArchivedObject, Category, Order, OrderProduct, Product
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def get_purgeable_products(cutoff):
+    """
+        Products deleted before the cutoff which are not referenced by order
+        lines or promotions and have no children rows left
+    """
+    return Product.objects.with_deleted().filter(
+        deleted_at__lt=cutoff,
+        orderproduct__isnull=True,
+        promotions__isnull=True,
+        children__isnull=True,
+    ).order_by('pk').values_list('pk', flat=True).distinct()
+
+
+def get_purgeable_categories(cutoff):
+    """
+        Categories deleted before the cutoff without products, promotions and
+        subcategories left (a delete would CASCADE to them)
+    """
+    return Category.objects.with_deleted().filter(
+        deleted_at__lt=cutoff,
+        products__isnull=True,
+        promotions__isnull=True,
+        children__isnull=True,
+    ).order_by('pk').values_list('pk', flat=True).distinct()
+
+
+def get_purgeable_orders(cutoff):
+    return Order.objects.filter(
+        deleted_at__lt=cutoff).order_by('pk').values_list('pk', flat=True)
+
+
+def _archive_products(pks):
+    return [
+        ArchivedObject(
+            model='webshops.product', object_id=_obj.pk,
+            webshop_id=_obj.webshop_id, deleted_at=_obj.deleted_at,
+            data=serializers.serialize('json', [_obj]))
+        for _obj in Product.objects.with_deleted().filter(pk__in=pks)
+    ]
+
+
+def _archive_categories(pks):
+    return [
+        ArchivedObject(
+            model='webshops.category', object_id=_obj.pk,
+            webshop_id=_obj.webshop_id, deleted_at=_obj.deleted_at,
+            data=serializers.serialize('json', [_obj]))
+        for _obj in Category.objects.with_deleted().filter(pk__in=pks)
+    ]
+
+
+def _archive_orders(pks):
+    _lines = {}
+    for _line in OrderProduct.objects.filter(order__in=pks):
+        _lines.setdefault(_line.order_id, []).append(_line)
+    return [
+        ArchivedObject(
+            model='webshops.order', object_id=_obj.pk,
+            webshop_id=_obj.webshop_id, deleted_at=_obj.deleted_at,
+            data=serializers.serialize('json', [_obj] + _lines.get(_obj.pk, [])))
+        for _obj in Order.objects.filter(pk__in=pks)
+    ]
+
+
+PURGERS = (
+    ('webshops.product', get_purgeable_products, _archive_products,
+     lambda pks: Product.objects.with_deleted().filter(pk__in=pks)),
+    # after the products, which would keep their categories
+    ('webshops.category', get_purgeable_categories, _archive_categories,
+     lambda pks: Category.objects.with_deleted().filter(pk__in=pks)),
+    ('webshops.order', get_purgeable_orders, _archive_orders,
+     lambda pks: Order.objects.filter(pk__in=pks)),
+)
+
+
+def purge_deleted(days, batch_size=DEFAULT_BATCH_SIZE, archive=True, pause=0):
+    """
+        Moves rows soft-deleted more than ``days`` ago into ArchivedObject
+        (or just deletes them when ``archive`` is False).
+
+        :returns: list of (model, rows, seconds) per purged model
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    stats = []
+    for name, get_pks, make_archive, get_queryset in PURGERS:
+        rows, started = 0, time.time()
+        while True:
+            pks = list(get_pks(cutoff)[:batch_size])
+            if not pks:
+                break
+            with transaction.atomic():
+                if archive:
+                    ArchivedObject.objects.bulk_create(make_archive(pks))
+                get_queryset(pks).delete()
+            rows += len(pks)
+            if pause:
+                time.sleep(pause)
+        stats.append((name, rows, time.time() - started))
+    return stats
+
+
+def format_stats(stats):
+    return [
+        '{}: {} rows in {:.2f}s ({:.0f} rows/s)'.format(
+            name, rows, seconds, rows / seconds if seconds else 0)
+        for name, rows, seconds in stats
+    ]
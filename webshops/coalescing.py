@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+    Single-flight request coalescing: concurrent identical calls in one
+    process share the result of the first (leader) call instead of running
+    the same expensive queries once per request.
+"""
+from __future__ import unicode_literals
+
+import threading
+
+from django.conf import settings
+
+
+class _Call(object):
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """
+            Runs func once for all concurrent callers of the key; followers
+            waiting longer than ``settings.WEBSHOPS_COALESCE_TIMEOUT`` run it
+            themselves. Exceptions of the leader are raised in the followers.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.event.wait(settings.WEBSHOPS_COALESCE_TIMEOUT):
+                return func()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+group = SingleFlight()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+    Runs independent ORM reads of one request concurrently on a bounded,
+    process wide thread pool (``settings.WEBSHOPS_FANOUT_WORKERS`` threads).
+
+    Worker threads get the tenant and replica routing state of the calling
+    request and keep their own database connection, closed like request
+    connections according to CONN_MAX_AGE.
+"""
+from __future__ import unicode_literals
+
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from webshops import routers
+from webshops import tenancy
+
+_executor = None
+_lock = threading.Lock()
+
+
+class FanOutTimeout(Exception):
+    """ Not all calls finished within settings.WEBSHOPS_FANOUT_TIMEOUT """
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.WEBSHOPS_FANOUT_WORKERS)
+    return _executor
+
+
+def _call(func, webshop_id, replica_allowed):
+    close_old_connections()
+    routers.allow_replica_reads(replica_allowed)
+    try:
+        with tenancy.scoped(webshop_id):
+            return func()
+    finally:
+        routers.reset()
+        close_old_connections()
+
+
+def _shares_database():
+    """ False for in-memory SQLite, every connection gets a database of its own """
+    return not (connection.vendor == 'sqlite' and connection.is_in_memory_db())
+
+
+def fan_out(**calls):
+    """
+        Runs the callables concurrently and returns {name: result}.
+
+        :raises FanOutTimeout: when they take longer than
+            settings.WEBSHOPS_FANOUT_TIMEOUT (seconds, for all of them)
+
+        Falls back to running them one after another without worker threads,
+        inside a transaction, whose uncommitted rows other connections can't
+        see, or on an in-memory SQLite database (e.g. the test database).
+    """
+    if (
+        not settings.WEBSHOPS_FANOUT_WORKERS or len(calls) < 2 or
+        connection.in_atomic_block or not _shares_database()
+    ):
+        return dict((name, func()) for name, func in calls.items())
+
+    webshop_id = tenancy.get_current_webshop_id()
+    replica_allowed = routers.replica_reads_allowed()
+    futures = dict(
+        (name, get_executor().submit(_call, func, webshop_id, replica_allowed))
+        for name, func in calls.items())
+    _, not_done = wait(futures.values(), timeout=settings.WEBSHOPS_FANOUT_TIMEOUT)
+    if not_done:
+        for future in not_done:
+            future.cancel()
+        raise FanOutTimeout(', '.join(sorted(
+            name for name, future in futures.items() if future in not_done)))
+    return dict((name, future.result()) for name, future in futures.items())
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+    Delivery bookkeeping of webshops.tasks.send_email: idempotency keys,
+    exponential backoff, a cap on concurrent SMTP sessions and the dead-letter
+    store (webshops.EmailDelivery rows in the FAILED state).
+
+    The concurrency cap counts the deliveries in the SENDING state, so it
+    covers all workers sharing the database. A claim which finds more of them
+    than allowed (workers claiming at the same time) is given back.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import random
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from webshops.models import EmailDelivery
+
+
+class Busy(Exception):
+    """ WEBSHOPS_EMAIL_CONCURRENCY messages are being sent right now """
+
+
+def order_key(order, status):
+    """ idempotency key of an order status notification """
+    return 'order:{}:{}'.format(order.pk, status)
+
+
+def backoff(retries):
+    """ seconds before the next attempt: exponential, capped, with jitter """
+    countdown = min(
+        settings.WEBSHOPS_EMAIL_RETRY_BASE_SECONDS * 2 ** retries,
+        settings.WEBSHOPS_EMAIL_RETRY_MAX_SECONDS)
+    return countdown + random.uniform(0, countdown / 10.0)
+
+
+def _stale():
+    """ deliveries SENDING since before were claimed by a worker which died """
+    return timezone.now() - datetime.timedelta(
+        seconds=settings.WEBSHOPS_EMAIL_SLOT_SECONDS)
+
+
+def sending_count():
+    return EmailDelivery.objects.filter(
+        status=EmailDelivery.SENDING, modified_at__gte=_stale()).count()
+
+
+def claim(key, **message):
+    """
+        Creates the delivery of the key and marks it as being sent.
+
+        :returns: the delivery or None when it was sent already or another
+            worker is sending it right now
+        :raises Busy: when WEBSHOPS_EMAIL_CONCURRENCY messages are being sent
+    """
+    if sending_count() >= settings.WEBSHOPS_EMAIL_CONCURRENCY:
+        raise Busy()
+    delivery, _ = EmailDelivery.objects.get_or_create(key=key, defaults=message)
+    claimed = EmailDelivery.objects.filter(pk=delivery.pk).filter(
+        models.Q(status__in=(EmailDelivery.PENDING, EmailDelivery.FAILED)) |
+        models.Q(status=EmailDelivery.SENDING, modified_at__lt=_stale())
+    ).update(
+        status=EmailDelivery.SENDING, attempts=models.F('attempts') + 1,
+        modified_at=timezone.now())
+    if not claimed:
+        return None
+    if sending_count() > settings.WEBSHOPS_EMAIL_CONCURRENCY:
+        # other workers claimed at the same time, this attempt doesn't count
+        EmailDelivery.objects.filter(pk=delivery.pk).update(
+            status=EmailDelivery.PENDING, attempts=models.F('attempts') - 1,
+            modified_at=timezone.now())
+        raise Busy()
+    return delivery
+
+
+def was_sent(key):
+    return EmailDelivery.objects.filter(key=key, status=EmailDelivery.SENT).exists()
+
+
+def mark_sent(delivery):
+    EmailDelivery.objects.filter(pk=delivery.pk).update(
+        status=EmailDelivery.SENT, sent_at=timezone.now(), error='',
+        modified_at=timezone.now())
+
+
+def mark_failed(delivery, error, final=False):
+    """ back to PENDING for the next retry or FAILED (dead letter) if final """
+    EmailDelivery.objects.filter(pk=delivery.pk).update(
+        status=EmailDelivery.FAILED if final else EmailDelivery.PENDING,
+        error='{}'.format(error), modified_at=timezone.now())
+
+
+def replay(deliveries):
+    """ Queues the dead letters again under their keys, returns their count """
+    from webshops.tasks import send_email
+
+    count = 0
+    for delivery in deliveries.filter(status=EmailDelivery.FAILED):
+        # a replay gets the full number of retries again
+        EmailDelivery.objects.filter(pk=delivery.pk).update(
+            status=EmailDelivery.PENDING, attempts=0, modified_at=timezone.now())
+        send_email.delay(
+            delivery.subject, delivery.text_content,
+            delivery.recipients.splitlines(),
+            html_content=delivery.html_content or None,
+            reply_to=delivery.reply_to or None,
+            idempotency_key=delivery.key)
+        count += 1
+    return count
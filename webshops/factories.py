@@ -85,3 +85,13 @@ class OrderProductFactory(factory.DjangoModelFactory):
 
     class Meta:
         model = models.OrderProduct
+
+
+class PromotionFactory(factory.DjangoModelFactory):
+    webshop = factory.SubFactory(WebshopFactory)
+    name = factory.LazyAttribute(
+        lambda o: ''.join(random.choice(string.letters) for _ in range(100)))
+    value = decimal.Decimal(10)
+
+    class Meta:
+        model = models.Promotion
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import calendar
+import datetime
+
+from django.utils import timezone
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+#: pks of a cursor must fit into a (signed) bigint column
+MAX_PK = 2 ** 63
+
+
+def to_micros(value):
+    """ aware datetime -> microseconds since the epoch """
+    return calendar.timegm(value.utctimetuple()) * 10 ** 6 + value.microsecond
+
+
+def encode_cursor(obj):
+    """
+        Returns an opaque cursor "<modified_at in microseconds>:<pk>"
+        pointing right after the given object
+    """
+    return '{}:{}'.format(to_micros(obj.modified_at), obj.pk)
+
+
+def decode_cursor(value):
+    """
+        Reverse of encode_cursor, returns (modified_at, pk)
+
+        :raises ValueError: on malformed cursor
+    """
+    try:
+        _ts, _pk = value.split(':')
+        _modified_at = datetime.datetime(1970, 1, 1) + datetime.timedelta(
+            microseconds=int(_ts))
+        _pk = int(_pk)
+    except (ValueError, OverflowError, TypeError):
+        raise ValueError('Invalid cursor: {!r}'.format(value))
+    if not 0 <= _pk < MAX_PK:
+        raise ValueError('Invalid cursor: {!r}'.format(value))
+    return timezone.make_aware(_modified_at, timezone.utc), _pk
+
+
+def get_changes(queryset, cursor=None, limit=DEFAULT_LIMIT):
+    """
+        Reads one page of the change feed from the queryset.
+        The queryset must include soft-deleted rows
+        (``Manager.with_deleted()``).
+
+        :returns: (upserts, deletions, next cursor, has more)
+    """
+    _modified_at, _pk = decode_cursor(cursor) if cursor else (None, None)
+    _rows = list(queryset.changed_since(_modified_at, _pk)[:limit + 1])
+    _has_more = len(_rows) > limit
+    _rows = _rows[:limit]
+
+    upserts = [_obj for _obj in _rows if _obj.deleted_at is None]
+    deletions = [_obj.pk for _obj in _rows if _obj.deleted_at is not None]
+    next_cursor = encode_cursor(_rows[-1]) if _rows else cursor
+    return upserts, deletions, next_cursor, _has_more
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+    Catalog wide checks of the parent/child product rules of
+    Product.clean(). Every check is one queryset over the (not deleted)
+    products, so a scan is one grouped COUNT per check instead of a clean()
+    and a parent lookup per product. Some violations have an unambiguous
+    repair which fix() applies with one UPDATE each.
+"""
+from __future__ import unicode_literals
+
+import time
+from collections import OrderedDict
+
+from django.db import models, transaction
+
+from webshops.models import Product
+
+CHILD_WITHOUT_PARENT = 'child_without_parent'
+CHILD_OF_NON_PARENT = 'child_of_non_parent'
+CHILD_WITH_CATEGORY = 'child_with_category'
+NON_CHILD_WITH_PARENT = 'non_child_with_parent'
+STANDALONE_WITH_CHILDREN = 'standalone_with_children'
+PARENT_WITHOUT_CHILDREN = 'parent_without_children'
+PARENT_WITH_STOCK = 'parent_with_stock'
+
+CHECKS = (
+    CHILD_WITHOUT_PARENT, CHILD_OF_NON_PARENT, CHILD_WITH_CATEGORY,
+    NON_CHILD_WITH_PARENT, STANDALONE_WITH_CHILDREN, PARENT_WITHOUT_CHILDREN,
+    PARENT_WITH_STOCK,
+)
+
+#: check -> update() values, in the order they are applied: the structure
+#: is repaired first because it decides which of the other rules apply
+FIXES = OrderedDict((
+    (STANDALONE_WITH_CHILDREN, dict(structure=Product.PARENT)),
+    (PARENT_WITHOUT_CHILDREN, dict(structure=Product.STANDALONE)),
+    (CHILD_WITH_CATEGORY, dict(category=None)),
+    (PARENT_WITH_STOCK, dict(pcs_in_stock=None, is_low_stock=False)),
+))
+
+
+def get_violations(queryset=None):
+    """
+        :param queryset: products to check, defaults to all of them
+        :returns: OrderedDict of check -> queryset of the violating products
+    """
+    products = Product.objects.all() if queryset is None else queryset
+    _children = Product.objects.filter(
+        parent__isnull=False).order_by().values('parent')
+    _children_of_deleted = models.Q(
+        parent__isnull=False, parent__deleted_at__isnull=False)
+    return OrderedDict((
+        (CHILD_WITHOUT_PARENT, products.filter(
+            models.Q(parent__isnull=True) | _children_of_deleted,
+            structure=Product.CHILD)),
+        (CHILD_OF_NON_PARENT, products.filter(
+            structure=Product.CHILD, parent__deleted_at__isnull=True,
+        ).exclude(parent__isnull=True).exclude(parent__structure=Product.PARENT)),
+        (CHILD_WITH_CATEGORY, products.filter(
+            structure=Product.CHILD, category__isnull=False)),
+        (NON_CHILD_WITH_PARENT, products.exclude(
+            structure=Product.CHILD).filter(parent__isnull=False)),
+        (STANDALONE_WITH_CHILDREN, products.filter(
+            structure=Product.STANDALONE, pk__in=_children)),
+        (PARENT_WITHOUT_CHILDREN, products.filter(
+            structure=Product.PARENT).exclude(pk__in=_children)),
+        (PARENT_WITH_STOCK, products.filter(
+            structure=Product.PARENT, pcs_in_stock__gt=0)),
+    ))
+
+
+def scan(queryset=None):
+    """
+        :returns: list of (check, {webshop id: violations}, seconds), one
+            grouped query per check
+    """
+    stats = []
+    for check, violations in get_violations(queryset).items():
+        started = time.time()
+        counts = dict(violations.order_by().values_list('webshop').annotate(
+            models.Count('pk')))
+        stats.append((check, counts, time.time() - started))
+    return stats
+
+
+def fix(queryset=None):
+    """
+        Repairs the violations of FIXES, the others need a decision about
+        the product and are left alone
+
+        :returns: OrderedDict of check -> number of repaired products
+    """
+    fixed = OrderedDict()
+    with transaction.atomic():
+        for check, values in FIXES.items():
+            # evaluated again per check, earlier fixes change the structure
+            fixed[check] = get_violations(queryset)[check].update_catalog(**values)
+    return fixed
+
+
+def format_stats(stats):
+    return [
+        '{}: {} products in {} webshops ({:.2f}s)'.format(
+            check, sum(counts.values()), len(counts), seconds)
+        for check, counts, seconds in stats
+    ]
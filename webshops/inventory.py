@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+    Bulk stock updates with set-based UPDATEs. Items without a version are
+    grouped by value (one UPDATE per distinct quantity or delta); items with a
+    version are guarded by ``modified_at`` (optimistic concurrency).
+"""
+from __future__ import unicode_literals
+
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from webshops.models import Product
+from webshops import storefront
+
+MAX_ITEMS = 10000
+
+NOT_FOUND = 'not_found'
+AMBIGUOUS = 'ambiguous_barcode'
+DUPLICATE = 'duplicate'
+INSUFFICIENT = 'insufficient_stock'
+VERSION = 'version_conflict'
+
+
+def parse_item(item):
+    """
+        Validates one item: ``id`` or ``barcode``, ``qty`` (absolute) or
+        ``delta`` and an optional ``version`` (modified_at)
+
+        :raises ValueError:
+    """
+    if not isinstance(item, dict):
+        raise ValueError('An object is required.')
+    if ('id' in item) == ('barcode' in item):
+        raise ValueError('Either id or barcode is required.')
+    if ('qty' in item) == ('delta' in item):
+        raise ValueError('Either qty or delta is required.')
+
+    parsed = {
+        'id': int(item['id']) if 'id' in item else None,
+        'barcode': item.get('barcode'),
+        'qty': int(item['qty']) if 'qty' in item else None,
+        'delta': int(item['delta']) if 'delta' in item else None,
+        'version': None,
+    }
+    if parsed['qty'] is not None and parsed['qty'] < 0:
+        raise ValueError('qty must be positive.')
+    if item.get('version'):
+        parsed['version'] = parse_datetime(item['version'])
+        if parsed['version'] is None:
+            raise ValueError('Invalid version.')
+    return parsed
+
+
+def _resolve_ids(items, queryset, conflicts):
+    barcodes = set(_item['barcode'] for _item in items if _item['barcode'])
+    by_barcode = {}
+    for barcode, pk in queryset.filter(
+            barcode__in=barcodes).values_list('barcode', 'pk'):
+        by_barcode.setdefault(barcode, []).append(pk)
+    existing = set(queryset.filter(
+        pk__in=[_item['id'] for _item in items if _item['id']]
+    ).values_list('pk', flat=True))
+
+    resolved, seen = [], set()
+    for index, item in enumerate(items):
+        if item['barcode']:
+            pks = by_barcode.get(item['barcode'], [])
+            if len(pks) > 1:
+                conflicts.append(dict(index=index, reason=AMBIGUOUS))
+                continue
+            item['id'] = pks[0] if pks else None
+        elif item['id'] not in existing:
+            item['id'] = None
+        if item['id'] is None:
+            conflicts.append(dict(index=index, reason=NOT_FOUND))
+        elif item['id'] in seen:
+            conflicts.append(dict(index=index, id=item['id'], reason=DUPLICATE))
+        else:
+            seen.add(item['id'])
+            resolved.append((index, item))
+    return resolved
+
+
+def _stock_after(delta):
+    return Coalesce(models.F('pcs_in_stock'), 0) + delta
+
+
+def apply_stock_updates(items, queryset=None):
+    """
+        :param items: parsed items (see parse_item)
+        :param queryset: products the items may touch, defaults to all
+        :returns: (ids of updated products, conflicts)
+    """
+    queryset = Product.objects.all() if queryset is None else queryset
+    conflicts = []
+    updated = set()
+    now = timezone.now()
+
+    with transaction.atomic():
+        resolved = _resolve_ids(items, queryset, conflicts)
+
+        absolute, deltas = {}, {}
+        for index, item in resolved:
+            if item['version'] is not None:
+                continue
+            if item['qty'] is not None:
+                absolute.setdefault(item['qty'], []).append(item['id'])
+            else:
+                deltas.setdefault(item['delta'], []).append((index, item['id']))
+
+        for qty, pks in absolute.items():
+            queryset.filter(pk__in=pks).update(pcs_in_stock=qty, modified_at=now)
+            updated.update(pks)
+
+        for delta, indexed in deltas.items():
+            pks = [_pk for _, _pk in indexed]
+            _qs = queryset.filter(pk__in=pks)
+            if delta < 0:
+                short = set(_qs.filter(
+                    models.Q(pcs_in_stock__lt=-delta) |
+                    models.Q(pcs_in_stock__isnull=True)
+                ).values_list('pk', flat=True))
+                conflicts.extend(
+                    dict(index=index, id=pk, reason=INSUFFICIENT)
+                    for index, pk in indexed if pk in short)
+                pks = [_pk for _pk in pks if _pk not in short]
+                _qs = queryset.filter(pk__in=pks, pcs_in_stock__gte=-delta)
+            count = _qs.update(pcs_in_stock=_stock_after(delta), modified_at=now)
+            if count != len(pks):
+                # stock taken concurrently between the check and the guarded
+                # UPDATE: the updated rows are the ones stamped with now
+                done = set(queryset.filter(
+                    pk__in=pks, modified_at=now).values_list('pk', flat=True))
+                conflicts.extend(
+                    dict(index=index, id=pk, reason=INSUFFICIENT)
+                    for index, pk in indexed if pk in set(pks) - done)
+                pks = [_pk for _pk in pks if _pk in done]
+            updated.update(pks)
+
+        for index, item in resolved:
+            if item['version'] is None:
+                continue
+            _qs = queryset.filter(pk=item['id'], modified_at=item['version'])
+            if item['qty'] is not None:
+                count = _qs.update(pcs_in_stock=item['qty'], modified_at=now)
+            else:
+                if item['delta'] < 0:
+                    _qs = _qs.filter(pcs_in_stock__gte=-item['delta'])
+                count = _qs.update(
+                    pcs_in_stock=_stock_after(item['delta']), modified_at=now)
+            if count:
+                updated.add(item['id'])
+            else:
+                conflicts.append(dict(index=index, id=item['id'], reason=VERSION))
+
+        Product.refresh_low_stock(updated)
+        if updated:
+            storefront.invalidate(*Product._base_manager.filter(
+                pk__in=list(updated)).order_by().values_list('webshop', flat=True).distinct())
+
+    conflicts.sort(key=lambda _conflict: _conflict['index'])
+    return updated, conflicts
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from webshops import integrity
+from webshops.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Checks the parent/child structure of all products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--webshop', type=int, action='append', dest='webshops',
+            help='Check only the products of this webshop (repeatable)')
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Repair the violations which have an unambiguous fix')
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['webshops']:
+            products = products.filter(webshop__in=options['webshops'])
+
+        stats = integrity.scan(products)
+        for line in integrity.format_stats(stats):
+            self.stdout.write(line)
+        if options['fix']:
+            for check, count in integrity.fix(products).items():
+                self.stdout.write('fixed {}: {} products'.format(check, count))
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from webshops import archival
+
+
+class Command(BaseCommand):
+    help = 'Archives (or hard-deletes) rows soft-deleted more than N days ago'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.WEBSHOPS_PURGE_AFTER_DAYS)
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.WEBSHOPS_PURGE_BATCH_SIZE)
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Seconds to sleep between batches')
+        parser.add_argument(
+            '--no-archive', action='store_false', dest='archive',
+            help='Delete rows without keeping an archived copy')
+
+    def handle(self, *args, **options):
+        stats = archival.purge_deleted(
+            options['days'], batch_size=options['batch_size'],
+            archive=options['archive'], pause=options['pause'])
+        for line in archival.format_stats(stats):
+            self.stdout.write(line)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from webshops import deliveries
+from webshops.models import EmailDelivery
+
+
+class Command(BaseCommand):
+    help = 'Queues failed emails (dead letters) again'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'ids', nargs='*', type=int,
+            help='Deliveries to replay, all failed ones by default')
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Replay at most this many, oldest first')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only list the failed deliveries')
+
+    def handle(self, *args, **options):
+        failed = EmailDelivery.objects.filter(
+            status=EmailDelivery.FAILED).order_by('added_at')
+        if options['ids']:
+            failed = failed.filter(pk__in=options['ids'])
+        if options['limit']:
+            failed = failed.filter(pk__in=list(
+                failed.values_list('pk', flat=True)[:options['limit']]))
+
+        if options['dry_run']:
+            for delivery in failed:
+                self.stdout.write('{} {} ({} attempts): {}'.format(
+                    delivery.pk, delivery.key, delivery.attempts, delivery.error))
+            return
+        self.stdout.write('replayed {} emails'.format(deliveries.replay(failed)))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.http import HttpResponseBadRequest
+
+from webshops import routers
+from webshops import tenancy
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PrimaryReplicaMiddleware(object):
+    """
+        Allows replica reads for safe requests only and pins the client to the
+        primary for ``settings.PRIMARY_PIN_SECONDS`` after its own write, so
+        the client always reads what it has written
+    """
+    cookie_name = 'pin_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(self.cookie_name, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def __call__(self, request):
+        routers.allow_replica_reads(
+            request.method in SAFE_METHODS and not self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.reset()
+
+        if wrote:
+            _seconds = settings.PRIMARY_PIN_SECONDS
+            response.set_cookie(
+                self.cookie_name, '{:.3f}'.format(time.time() + _seconds),
+                max_age=_seconds, httponly=True)
+        return response
+
+
+class TenantMiddleware(object):
+    """
+        Resolves the current webshop from the ``X-Webshop`` header or from the
+        request host (the only active webshop of the matching site) and scopes
+        all webshop managers to it for the duration of the request
+    """
+    header = 'HTTP_X_WEBSHOP'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def get_webshop_id_for_host(self, host):
+        key = tenancy.host_cache_key(host)
+        webshop_id = cache.get(key)
+        if webshop_id is None:
+            _ids = list(Site.objects.filter(
+                domain=host,
+                webshops__active=True,
+                webshops__deleted_at__isnull=True,
+            ).values_list('webshops', flat=True)[:2])
+            # 0 caches "no single webshop for this host"
+            webshop_id = _ids[0] if len(_ids) == 1 else 0
+            cache.set(key, webshop_id, settings.TENANT_HOST_CACHE_SECONDS)
+        return webshop_id or None
+
+    def __call__(self, request):
+        if self.header in request.META:
+            try:
+                webshop_id = int(request.META[self.header])
+            except ValueError:
+                return HttpResponseBadRequest('Invalid X-Webshop header.')
+        else:
+            webshop_id = self.get_webshop_id_for_host(request.get_host())
+
+        request.webshop_id = webshop_id
+        with tenancy.scoped(webshop_id):
+            return self.get_response(request)
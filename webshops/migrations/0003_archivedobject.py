@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webshops', '0002_change_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedObject',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.PositiveIntegerField()),
+                ('webshop_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.TextField()),
+            ],
+            options={
+                'ordering': ('-archived_at',),
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='archivedobject',
+            index_together=set([('model', 'object_id')]),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webshops', '0003_archivedobject'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField(verbose_name='Name')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(0, 'Percentage off'), (1, 'Fixed amount off'), (2, 'Buy X get Y free')], default=0, verbose_name='Kind')),
+                ('value', models.DecimalField(decimal_places=2, default=0, help_text='Percentage or amount off a single item.', max_digits=8, verbose_name='Value')),
+                ('buy_quantity', models.PositiveIntegerField(default=0, verbose_name='Buy X')),
+                ('get_quantity', models.PositiveIntegerField(default=0, verbose_name='Get Y free')),
+                ('active', models.BooleanField(default=True, verbose_name='Active')),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promotions', to='webshops.Category')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promotions', to='webshops.Product')),
+                ('webshop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promotions', to='webshops.Webshop')),
+            ],
+            options={
+                'ordering': ('webshop', 'name'),
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webshops', '0010_deleted_at_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CascadeCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=100)),
+                ('product_id', models.PositiveIntegerField()),
+                ('requested', models.PositiveIntegerField(default=0)),
+                ('started', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='cascadecounter',
+            unique_together=set([('task', 'product_id')]),
+        ),
+    ]
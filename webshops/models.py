@@ -1,21 +1,63 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import collections
 import decimal
 
 from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.template.loader import render_to_string
+from django.db import models, transaction
 from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import pgettext_lazy
 
-from webshops.tasks import send_email
-
-from webshops.querysets import CategoryManager
+from webshops.querysets import CategoryManager, OrderManager
 from webshops.querysets import ProductManager, WebshopManager
+from webshops import storefront
+
+
+#: effective pricing of a product, see Product.get_pricing
+Pricing = collections.namedtuple(
+    'Pricing', ('price', 'price_excl_vat', 'vat', 'vat_amount'))
+
+
+def schedule_cascade(task_name, product_id):
+    """
+        Queues a product cascade task of webshops.tasks once the transaction
+        commits (nothing is queued on rollback); settings.WEBSHOPS_SYNC_CASCADES
+        runs the task in-process instead. Bursts are coalesced by the task,
+        see start_cascade.
+    """
+    # tasks (and Celery) are imported on first use, not at Django start up
+    from webshops import tasks
+
+    task = getattr(tasks, task_name)
+    if settings.WEBSHOPS_SYNC_CASCADES:
+        task(product_id)
+        return
+    # counted in the same transaction as the changes to cascade
+    counter, _ = CascadeCounter.objects.get_or_create(
+        task=task_name, product_id=product_id)
+    CascadeCounter.objects.filter(pk=counter.pk).update(
+        requested=models.F('requested') + 1)
+    token = CascadeCounter.objects.values_list('requested', flat=True).get(pk=counter.pk)
+    transaction.on_commit(lambda: task.delay(product_id, token))
+
+
+def start_cascade(task_name, product_id, token=None):
+    """
+        Called by a cascade task before it runs: False when a run of the
+        same cascade started after the request with the token committed,
+        that run has already seen its changes. Tasks without a token always
+        run.
+    """
+    counter, _ = CascadeCounter.objects.get_or_create(
+        task=task_name, product_id=product_id)
+    _qs = CascadeCounter.objects.filter(pk=counter.pk)
+    if token is not None:
+        _qs = _qs.filter(started__lt=token)
+    return bool(_qs.update(started=models.F('requested')))
 
 
 @python_2_unicode_compatible
@@ -63,6 +105,10 @@ class Category(models.Model):
     name = models.TextField(verbose_name=_("Name"))
     description = models.TextField(verbose_name=_("Description"), blank=True)
     active = models.BooleanField(verbose_name=_("Active"), default=True)
+    reorder_threshold = models.PositiveIntegerField(
+        _("Reorder threshold"), null=True, blank=True,
+        help_text=_("Products of this category with less pieces in stock "
+                    "are reported as low on stock."))
 
     objects = CategoryManager()
 
@@ -72,10 +118,59 @@ class Category(models.Model):
 
     class Meta:
         ordering = ('name', '-pk', '-added_at')
+        indexes = [
+            models.Index(
+                fields=['webshop', 'modified_at', 'id'],
+                name='category_change_feed_idx'),
+            # purges of soft-deleted rows, see webshops.archival
+            models.Index(fields=['deleted_at'], name='category_deleted_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        _threshold_changed = False
+        if self.pk:
+            _old = self.__class__.objects.filter(
+                pk=self.pk).values_list('reorder_threshold', flat=True)
+            _threshold_changed = list(_old) != [self.reorder_threshold]
+
+        super(Category, self).save(*args, **kwargs)
+
+        if _threshold_changed:
+            Product.refresh_low_stock(Product.objects.filter(
+                models.Q(category=self) | models.Q(parent__category=self)
+            ).values_list('pk', flat=True))
+
+    def delete(self, *args, **kwargs):
+        """
+        Soft-deletes the category with its subcategories and their products
+        (the rows a hard delete would CASCADE to), so the removals show up in
+        the change feeds. Returns the number of deleted rows like
+        Model.delete().
+        """
+        _now = timezone.now()
+        _ids, _level = [self.pk], [self.pk]
+        while _level:
+            _level = list(Category.objects.filter(parent__in=_level).exclude(
+                pk__in=_ids).values_list('pk', flat=True))
+            _ids.extend(_level)
+
+        _categories = Category.objects.filter(pk__in=_ids[1:]).update(
+            deleted_at=_now, modified_at=_now)
+        _products = Product.objects.filter(
+            models.Q(category__in=_ids) | models.Q(parent__category__in=_ids)
+        ).soft_delete()
+        # nothing to save when the row is gone already (e.g. with its webshop)
+        if Category.objects.filter(pk=self.pk).exists():
+            self.deleted_at = _now
+            # modified_at is bumped as well so the deletion shows up in the change feed
+            self.save(update_fields=('deleted_at', 'modified_at'))
+            _categories += 1
+        return _categories + _products, {
+            Category._meta.label: _categories, Product._meta.label: _products}
+
     def get_children(self):
         return self.children.filter(active=True)
 
@@ -181,6 +276,12 @@ class Product(models.Model):
         help_text=_("Price excluding VAT."), null=True, blank=True)
     vat = models.PositiveIntegerField(
         verbose_name=_("VAT rate"), default=VAT_LOW, choices=VAT_CHOICES)
+    reorder_threshold = models.PositiveIntegerField(
+        _("Reorder threshold"), null=True, blank=True,
+        help_text=_("Less pieces in stock are reported as low on stock. "
+                    "Defaults to the category threshold."))
+    #: maintained on every stock update, see refresh_low_stock
+    is_low_stock = models.BooleanField(default=False, editable=False)
 
     added_at = models.DateTimeField(
         _("Date created"), auto_now_add=True, editable=False)
@@ -203,6 +304,21 @@ class Product(models.Model):
         ordering = '-added_at', 'name', 'pk'
         verbose_name = _('Product')
         verbose_name_plural = _('Products')
+        indexes = [
+            models.Index(
+                fields=['webshop', 'modified_at', 'id'],
+                name='product_change_feed_idx'),
+            models.Index(
+                fields=['is_low_stock', 'webshop'],
+                name='product_low_stock_idx'),
+            # admin changelist ordering and filters
+            models.Index(fields=['added_at'], name='product_added_idx'),
+            models.Index(
+                fields=['webshop', 'active', 'structure'],
+                name='product_filter_idx'),
+            # purges of soft-deleted rows, see webshops.archival
+            models.Index(fields=['deleted_at'], name='product_deleted_idx'),
+        ]
 
     def __str__(self):
         if self.name:
@@ -281,32 +397,118 @@ class Product(models.Model):
             _name_changed = _old and _old.name != self.name
 
         self.calculate_prices()
+        self.is_low_stock = self.get_low_stock()
 
         super(Product, self).save(*args, **kwargs)
 
         if _name_changed and self.children.exists():
-            self.children.update(name=self.name)
+            schedule_cascade('propagate_product_name', self.pk)
 
     def calculate_prices(self):
-        _vat = self.get_vat()
+        _vat = decimal.Decimal(100 + self.get_vat())
         if self.price_excl_vat:
-            self.price = round(
-                decimal.Decimal(self.price_excl_vat) * decimal.Decimal(100 + _vat) / 100, 2)
+            self.price = round(decimal.Decimal(self.price_excl_vat) * _vat / 100, 2)
         elif self.price:
-            self.price_excl_vat = round(
-                100 * decimal.Decimal(self.price) / decimal.Decimal(100 + _vat), 2)
+            self.price_excl_vat = round(100 * decimal.Decimal(self.price) / _vat, 2)
 
     def delete(self, *args, **kwargs):
         self.deleted_at = timezone.now()
-        self.save(update_fields=('deleted_at',))
+        # modified_at is bumped as well so the deletion shows up in the change feed
+        self.save(update_fields=('deleted_at', 'modified_at'))
 
-        if self.parent and self.parent.has_children() is False:
-                self.parent.structure = self.STANDALONE
-                self.parent.save(update_fields=('structure',))
+        if self.parent_id:
+            schedule_cascade('update_product_structure', self.parent_id)
 
     def has_children(self):
         return self.children.all().exists()
 
+    def get_reorder_threshold(self):
+        if self.reorder_threshold is not None:
+            return self.reorder_threshold
+        # the own category first like refresh_low_stock, a child without its
+        # parent row must still save
+        threshold = self.category.reorder_threshold if self.category_id else None
+        if threshold is None and self.parent_id:
+            category = self.parent.category
+            threshold = category and category.reorder_threshold
+        return threshold
+
+    def get_low_stock(self):
+        if self.pcs_in_stock is None:
+            return False
+        threshold = self.get_reorder_threshold()
+        return threshold is not None and self.pcs_in_stock < threshold
+
+    @classmethod
+    def refresh_low_stock(cls, product_ids):
+        """
+        Recomputes is_low_stock of the given products with one SELECT and at
+        most two UPDATEs, used after set-based stock updates.
+        """
+        low, not_low = [], []
+        for pk, stock, threshold, category_threshold, parent_category_threshold in \
+                cls._base_manager.filter(pk__in=list(product_ids)).values_list(
+                    'pk', 'pcs_in_stock', 'reorder_threshold',
+                    'category__reorder_threshold',
+                    'parent__category__reorder_threshold'):
+            if threshold is None:
+                threshold = category_threshold
+            if threshold is None:
+                threshold = parent_category_threshold
+            if stock is not None and threshold is not None and stock < threshold:
+                low.append(pk)
+            else:
+                not_low.append(pk)
+
+        # modified_at is bumped so the change feed (and snapshots) see the flag
+        now = timezone.now()
+        cls._base_manager.filter(pk__in=low, is_low_stock=False).update(
+            is_low_stock=True, modified_at=now)
+        cls._base_manager.filter(pk__in=not_low, is_low_stock=True).update(
+            is_low_stock=False, modified_at=now)
+
+    @classmethod
+    def propagate_name(cls, product_id, batch_size=500):
+        """
+        Copies the product name to its children in batches. Only children with
+        a different name are touched, so running it twice is harmless.
+        """
+        row = cls.objects.with_deleted().filter(
+            pk=product_id).values_list('name', 'webshop').first()
+        if row is None:
+            return 0
+        name, webshop_id = row
+
+        updated = 0
+        _children = cls.objects.filter(parent_id=product_id).exclude(name=name)
+        while True:
+            pks = list(_children.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                if updated:
+                    storefront.invalidate(webshop_id)
+                return updated
+            updated += cls.objects.filter(pk__in=pks).update(
+                name=name, modified_at=timezone.now())
+
+    @classmethod
+    def update_structure(cls, product_id):
+        """
+        Turns a product without (not deleted) children into a stand-alone one.
+        """
+        return cls.update_structures([product_id])
+
+    @classmethod
+    def update_structures(cls, product_ids):
+        """
+        Set-based update_structure: turns the products without (not deleted)
+        children into stand-alone ones with one UPDATE.
+        """
+        return cls.objects.with_deleted().filter(pk__in=list(product_ids)).exclude(
+            structure=cls.STANDALONE
+        ).exclude(
+            pk__in=cls.objects.filter(parent__in=list(product_ids)).values('parent')
+        ).update_catalog(structure=cls.STANDALONE)
+
     # Properties
 
     @property
@@ -371,27 +573,46 @@ class Product(models.Model):
         return self.category
     get_category.short_description = _("Category")
 
+    def get_pricing(self):
+        """
+        Effective price, price excl VAT, VAT rate and VAT amount, resolved
+        once per instance. They are kept with the price and VAT of the product
+        and its parent they were computed from and resolved again when one of
+        those differs.
+        """
+        _parent = self.parent if self.parent_id else None
+        _key = (self.price, self.vat, self.parent_id,
+                _parent and (_parent.price, _parent.vat))
+        _memo = self.__dict__.get('_pricing')
+        if _memo is not None and _memo[0] == _key:
+            return _memo[1]
+
+        _price = _parent and _parent.price or self.price
+        _vat = _parent and _parent.vat or self.vat
+        _price_excl_vat, _vat_amount = _price, None
+        if _price:
+            _decimal_price = decimal.Decimal(_price)
+            if _vat:
+                _price_excl_vat = round(
+                    100 * _decimal_price / decimal.Decimal(100 + _vat), 2)
+            if _vat != 0:
+                _vat_amount = round(_decimal_price * _vat / 100, 2)
+
+        pricing = Pricing(_price, _price_excl_vat, _vat, _vat_amount)
+        self.__dict__['_pricing'] = (_key, pricing)
+        return pricing
+
     def get_price(self):
-        return self.parent and self.parent.price or self.price
+        return self.get_pricing().price
 
     def get_price_wtihout_vat(self):
-        _price = self.get_price()
-        _vat = self.get_vat()
-        if _vat and _price:
-            return round(
-                100 * decimal.Decimal(_price) / decimal.Decimal(100 + _vat), 2)
-        return _price
+        return self.get_pricing().price_excl_vat
 
     def get_vat(self):
-        return self.parent and self.parent.vat or self.vat
+        return self.get_pricing().vat
 
     def vat_amount(self):
-        _price = self.get_price()
-        _vat = self.get_vat()
-        if _vat == 0 or not _price:
-            return None
-
-        return round(decimal.Decimal(_price) * _vat / 100, 2)
+        return self.get_pricing().vat_amount
 
     def get_children_prices(self):
         return [_ch.get_price() or 0 for _ch in self.children.active()]
@@ -426,6 +647,19 @@ class Order(models.Model):
 
     deleted_at = models.DateTimeField(blank=True, null=True)
 
+    objects = OrderManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['customer', 'date', 'id'], name='order_history_idx'),
+            models.Index(fields=['webshop', 'date'], name='order_date_idx'),
+            models.Index(fields=['paid', 'date'], name='order_paid_idx'),
+            models.Index(fields=['shipped', 'date'], name='order_shipped_idx'),
+            # purges of soft-deleted rows, see webshops.archival
+            models.Index(fields=['deleted_at'], name='order_deleted_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         #_price = self.get_discount_price() or self.total
         #self.total_wd = _price
@@ -438,26 +672,13 @@ class Order(models.Model):
         self.save(update_fields=('deleted_at',))
 
     def send_status_changed_email(self, title=None):
-        subject = "Order #{}".format(self.pk)
-        context = {
-            'order': self,
-            'subject': title or subject,
-        }
-
-        if self.paid:
-            _html = 'emails/order_paid.html'
-            _txt = 'emails/order_paid.txt'
-        elif self.shipped:
-            _html = 'emails/order_shipped.html'
-            _txt = 'emails/order_shipped.txt'
-        else:
-            _html = 'emails/order_created.html'
-            _txt = 'emails/order_created.txt'
+        from webshops import deliveries, notifications
+        from webshops.tasks import send_email
 
-        html_content = render_to_string(_html, context)
-        text_content = render_to_string(_txt, context)
+        subject, text_content, html_content = notifications.render(self, title)
         send_email.delay(
-            subject, text_content, [self.email], html_content=html_content
+            subject, text_content, [self.email], html_content=html_content,
+            idempotency_key=deliveries.order_key(self, notifications.get_status(self))
         )
 
     def get_webshop(self):
@@ -489,3 +710,119 @@ class OrderProduct(models.Model):
                 100 * decimal.Decimal(_price) / decimal.Decimal(100 + _vat), 2
             )
         return _price
+
+
+@python_2_unicode_compatible
+class Promotion(models.Model):
+    """
+    Discount rule of a webshop. A rule without product and category applies
+    to the whole shop; a category rule applies to the category subtree.
+    """
+    PERCENTAGE, FIXED, BUY_X_GET_Y = 0, 1, 2
+    KIND_CHOICES = (
+        (PERCENTAGE, _('Percentage off')),
+        (FIXED, _('Fixed amount off')),
+        (BUY_X_GET_Y, _('Buy X get Y free')),
+    )
+
+    webshop = models.ForeignKey(Webshop, related_name="promotions")
+    name = models.TextField(verbose_name=_("Name"))
+    kind = models.PositiveSmallIntegerField(
+        _("Kind"), choices=KIND_CHOICES, default=PERCENTAGE)
+    value = models.DecimalField(
+        decimal_places=2, max_digits=8, verbose_name=_("Value"), default=0,
+        help_text=_("Percentage or amount off a single item."))
+    buy_quantity = models.PositiveIntegerField(_("Buy X"), default=0)
+    get_quantity = models.PositiveIntegerField(_("Get Y free"), default=0)
+    category = models.ForeignKey(
+        Category, related_name="promotions", null=True, blank=True)
+    product = models.ForeignKey(
+        Product, related_name="promotions", null=True, blank=True)
+    active = models.BooleanField(verbose_name=_("Active"), default=True)
+    starts_at = models.DateTimeField(blank=True, null=True)
+    ends_at = models.DateTimeField(blank=True, null=True)
+
+    added_at = models.DateTimeField(auto_now_add=True, editable=False)
+    modified_at = models.DateTimeField(auto_now=True, editable=False)
+
+    class Meta:
+        ordering = ('webshop', 'name')
+
+    def __str__(self):
+        return self.name
+
+
+class ArchivedObject(models.Model):
+    """
+    Soft-deleted row moved out of the hot tables by webshops.archival
+    """
+    model = models.CharField(max_length=100)
+    object_id = models.PositiveIntegerField()
+    webshop_id = models.PositiveIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True, editable=False)
+    #: django.core.serializers json dump of the row (an order with its lines)
+    data = models.TextField()
+
+    class Meta:
+        ordering = ('-archived_at',)
+        index_together = (('model', 'object_id'),)
+
+
+@python_2_unicode_compatible
+class EmailDelivery(models.Model):
+    """
+    Delivery bookkeeping of webshops.tasks.send_email: one row per
+    idempotency key, failed rows are the dead letters (see the
+    replay_emails command)
+    """
+    PENDING, SENDING, SENT, FAILED = 0, 1, 2, 3
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (SENDING, _('Sending')),
+        (SENT, _('Sent')),
+        (FAILED, _('Failed')),
+    )
+
+    key = models.CharField(max_length=100, unique=True)
+    subject = models.TextField()
+    text_content = models.TextField(blank=True)
+    html_content = models.TextField(blank=True)
+    #: one address per line
+    recipients = models.TextField()
+    reply_to = models.TextField(blank=True)
+    status = models.PositiveSmallIntegerField(
+        choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    added_at = models.DateTimeField(auto_now_add=True, editable=False)
+    modified_at = models.DateTimeField(auto_now=True, editable=False)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ('-added_at',)
+        verbose_name_plural = _('Email deliveries')
+
+    def __str__(self):
+        return self.key
+
+
+@python_2_unicode_compatible
+class CascadeCounter(models.Model):
+    """
+    Coalesces the product cascades of webshops.tasks: every request
+    increments ``requested`` and passes the new value to its task as a
+    token, every run first sets ``started`` to ``requested``. Both are
+    counters in the database, so workers and web servers agree on the order
+    whatever their clocks and caches.
+    """
+    task = models.CharField(max_length=100)
+    product_id = models.PositiveIntegerField()
+    requested = models.PositiveIntegerField(default=0)
+    started = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('task', 'product_id'),)
+
+    def __str__(self):
+        return '{}:{}'.format(self.task, self.product_id)
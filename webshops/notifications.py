@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+    Order status notifications. Templates are loaded (compiled) once per
+    process and the parts shared by all orders of a webshop and status are
+    cached template fragments (``{% cache %}`` in emails/order_*), so bulk
+    notifications mostly render the order specific nodes.
+"""
+from __future__ import unicode_literals
+
+import time
+
+from django.template.loader import get_template
+
+CREATED, PAID, SHIPPED = 'created', 'paid', 'shipped'
+
+_templates = {}
+
+
+def get_status(order):
+    if order.paid:
+        return PAID
+    elif order.shipped:
+        return SHIPPED
+    return CREATED
+
+
+def get_templates(status):
+    """ compiled (html, txt) templates of the status """
+    templates = _templates.get(status)
+    if templates is None:
+        templates = _templates[status] = (
+            get_template('emails/order_{}.html'.format(status)),
+            get_template('emails/order_{}.txt'.format(status)))
+    return templates
+
+
+def render(order, title=None):
+    """ :returns: (subject, text content, html content) """
+    status = get_status(order)
+    subject = "Order #{}".format(order.pk)
+    context = {
+        'order': order,
+        'subject': title or subject,
+        'status': status,
+        'webshop': order.webshop,
+    }
+    html_template, text_template = get_templates(status)
+    return subject, text_template.render(context), html_template.render(context)
+
+
+def render_batch(orders, title=None):
+    """
+        Renders the notifications of the orders (select_related('webshop')
+        avoids a query per order)
+
+        :returns: iterator of (order, subject, text, html, render seconds)
+    """
+    for order in orders:
+        started = time.time()
+        subject, text_content, html_content = render(order, title)
+        yield order, subject, text_content, html_content, time.time() - started
@@ -7,3 +7,12 @@ from rest_framework import pagination
 class ProductPagination(pagination.PageNumberPagination):
     page_size = 9
     page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class OrderHistoryPagination(pagination.CursorPagination):
+    """ newest first, stable for orders placed while paging """
+    ordering = ('-date', '-pk')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
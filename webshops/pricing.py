@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+    Prices whole carts from one query. Per-line rounding follows
+    Product.calculate_prices: prices include VAT, the price excluding VAT is
+    derived and rounded to cents.
+"""
+from __future__ import unicode_literals
+
+import decimal
+
+from webshops.models import Product
+
+CENT = decimal.Decimal('0.01')
+ZERO = decimal.Decimal('0.00')
+
+
+def quantize(value):
+    return decimal.Decimal(value).quantize(CENT, rounding=decimal.ROUND_HALF_EVEN)
+
+
+def excl_vat(price, vat):
+    return quantize(100 * decimal.Decimal(price) / decimal.Decimal(100 + vat))
+
+
+def load_prices(product_ids):
+    """
+        Effective (price, vat, is_discountable, webshop, parent, category) per
+        product id, resolved like Product.get_price, get_vat,
+        get_is_discountable and get_category
+    """
+    rows = Product.objects.filter(pk__in=product_ids).values_list(
+        'pk', 'structure', 'price', 'vat', 'is_discountable', 'webshop_id',
+        'parent_id', 'category_id',
+        'parent__price', 'parent__vat', 'parent__is_discountable',
+        'parent__category_id')
+    prices = {}
+    for (pk, structure, price, vat, discountable, webshop_id, parent_id,
+         category_id, parent_price, parent_vat, parent_discountable,
+         parent_category_id) in rows:
+        if structure == Product.CHILD:
+            discountable = parent_discountable
+            category_id = parent_category_id
+        prices[pk] = (
+            parent_price or price, parent_vat or vat, discountable,
+            webshop_id, parent_id, category_id)
+    return prices
+
+
+def price_cart(lines, get_promotions=None):
+    """
+        :param lines: iterable of (product id, quantity)
+        :param get_promotions: webshop id -> compiled promotions
+            (webshops.promotions.get_promotions), the only source of
+            discounts; they apply to discountable lines only
+        :returns: dict with per-line results, aggregates and the ids of
+            missing or unpriced products
+    """
+    lines = list(lines)
+    prices = load_prices(set(_id for _id, _ in lines))
+    compiled = {}
+
+    result = dict(
+        lines=[], missing=[],
+        subtotal=ZERO, vat=ZERO, discount=ZERO, total=ZERO)
+    for product_id, quantity in lines:
+        price, vat, discountable, webshop_id, parent_id, category_id = prices.get(
+            product_id, (None, ) * 6)
+        if not price:
+            result['missing'].append(product_id)
+            continue
+
+        gross = quantize(price * quantity)
+        discount = ZERO
+        if discountable and get_promotions is not None:
+            if webshop_id not in compiled:
+                compiled[webshop_id] = get_promotions(webshop_id)
+            discount = compiled[webshop_id].line_discount(
+                price, quantity, product_id, parent_id, category_id)
+        total = gross - discount
+        subtotal = excl_vat(total, vat) if vat else total
+        line = dict(
+            product=product_id, quantity=quantity, unit_price=quantize(price),
+            vat=vat, discountable=discountable, discount=discount,
+            subtotal=subtotal, vat_amount=total - subtotal, total=total)
+        result['lines'].append(line)
+
+        result['subtotal'] += subtotal
+        result['vat'] += line['vat_amount']
+        result['discount'] += discount
+        result['total'] += total
+    return result
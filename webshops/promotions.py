@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+    Promotions of a webshop compiled into per-product and per-category lookup
+    tables. Compiled rules are kept in process memory and recompiled when the
+    next start/end of a promotion is reached or the shop's version changes.
+
+    The version is read from the database (counts and latest modified_at of
+    the shop's promotions and categories), so changes made by any process
+    show up in all of them: at once in the process which saved them (see
+    webshops.signals) and within settings.WEBSHOPS_PROMOTIONS_CHECK_SECONDS
+    in the others.
+"""
+from __future__ import unicode_literals
+
+import time
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from webshops import pricing
+from webshops.models import Category, Promotion
+
+_compiled = {}  # webshop id -> CompiledPromotions
+_checked = {}  # webshop id -> time of the last version check
+
+
+class Rule(object):
+    __slots__ = ('kind', 'value', 'buy_quantity', 'get_quantity')
+
+    def __init__(self, promotion):
+        self.kind = promotion.kind
+        self.value = promotion.value
+        self.buy_quantity = promotion.buy_quantity
+        self.get_quantity = promotion.get_quantity
+
+    def unit_discount(self, price):
+        if self.kind == Promotion.PERCENTAGE:
+            return pricing.quantize(price * self.value / 100)
+        if self.kind == Promotion.FIXED:
+            return min(self.value, price)
+        return pricing.ZERO
+
+    def line_discount(self, price, quantity):
+        if self.kind == Promotion.BUY_X_GET_Y:
+            bundle = self.buy_quantity + self.get_quantity
+            if not self.get_quantity:
+                return pricing.ZERO
+            return pricing.quantize(price * (quantity // bundle) * self.get_quantity)
+        return self.unit_discount(price) * quantity
+
+
+class CompiledPromotions(object):
+
+    def __init__(self, version, valid_until=None):
+        self.version = version
+        self.valid_until = valid_until
+        self.shop_wide = []
+        self.by_product = {}
+        self.by_category = {}
+
+    def is_valid(self, version):
+        return self.version == version and (
+            self.valid_until is None or timezone.now() < self.valid_until)
+
+    def rules_for(self, product_id, parent_id=None, category_id=None):
+        return (
+            self.shop_wide +
+            self.by_product.get(product_id, []) +
+            self.by_product.get(parent_id, []) +
+            self.by_category.get(category_id, []))
+
+    def discount_price(self, price, product_id, parent_id=None, category_id=None):
+        """ Best single-item price or None when no rule applies """
+        discounts = [
+            _rule.unit_discount(price)
+            for _rule in self.rules_for(product_id, parent_id, category_id)
+            if _rule.kind != Promotion.BUY_X_GET_Y]
+        if not discounts:
+            return None
+        return max(price - max(discounts), pricing.ZERO)
+
+    def line_discount(self, price, quantity, product_id, parent_id=None, category_id=None):
+        discounts = [
+            _rule.line_discount(price, quantity)
+            for _rule in self.rules_for(product_id, parent_id, category_id)]
+        return min(max(discounts or [pricing.ZERO]), price * quantity)
+
+
+def get_version(webshop_id):
+    """ changes with every saved or deleted promotion or category of the shop """
+    _aggregates = dict(count=models.Count('pk'), modified_at=models.Max('modified_at'))
+    _promotions = Promotion._base_manager.filter(
+        webshop_id=webshop_id).aggregate(**_aggregates)
+    _categories = Category._base_manager.filter(
+        webshop_id=webshop_id).aggregate(**_aggregates)
+    return (
+        _promotions['count'], _promotions['modified_at'],
+        _categories['count'], _categories['modified_at'])
+
+
+def invalidate(webshop_id):
+    """ the next get_promotions of this process checks the version """
+    _checked.pop(webshop_id, None)
+
+
+def get_subtrees(webshop_id):
+    """ category id -> ids of the category and all its descendants """
+    children = {}
+    for pk, parent_id in Category.objects.filter(
+            webshop_id=webshop_id).values_list('pk', 'parent_id'):
+        children.setdefault(parent_id, []).append(pk)
+
+    def _walk(pk):
+        result = [pk]
+        for _child in children.get(pk, ()):
+            result.extend(_walk(_child))
+        return result
+    return dict((pk, _walk(pk)) for pks in children.values() for pk in pks)
+
+
+def compile_promotions(webshop_id, version):
+    now = timezone.now()
+    compiled = CompiledPromotions(version)
+    subtrees = None
+    for promotion in Promotion.objects.filter(webshop_id=webshop_id, active=True):
+        # the next start or end invalidates the compiled rules
+        for _boundary in (promotion.starts_at, promotion.ends_at):
+            if _boundary and _boundary > now and (
+                    compiled.valid_until is None or _boundary < compiled.valid_until):
+                compiled.valid_until = _boundary
+        if (promotion.starts_at and promotion.starts_at > now or
+                promotion.ends_at and promotion.ends_at <= now):
+            continue
+
+        rule = Rule(promotion)
+        if promotion.product_id:
+            compiled.by_product.setdefault(promotion.product_id, []).append(rule)
+        elif promotion.category_id:
+            if subtrees is None:
+                subtrees = get_subtrees(webshop_id)
+            for _pk in subtrees.get(promotion.category_id, [promotion.category_id]):
+                compiled.by_category.setdefault(_pk, []).append(rule)
+        else:
+            compiled.shop_wide.append(rule)
+    return compiled
+
+
+def get_promotions(webshop_id):
+    """ Compiled promotions of the webshop, recompiled when outdated """
+    compiled = _compiled.get(webshop_id)
+    now = time.time()
+    if compiled is not None and compiled.is_valid(compiled.version) and \
+            now - _checked.get(webshop_id, 0) < settings.WEBSHOPS_PROMOTIONS_CHECK_SECONDS:
+        return compiled
+
+    version = get_version(webshop_id)
+    _checked[webshop_id] = now
+    if compiled is None or not compiled.is_valid(version):
+        compiled = _compiled[webshop_id] = compile_promotions(webshop_id, version)
+    return compiled
+
+
+def get_discount_price(product, compiled=None):
+    """ Discounted price of a Product instance or None """
+    if product.is_child and not product.parent_id:
+        # an orphaned child has no parent to inherit from
+        return None
+    price = product.get_price()
+    if not price or not product.get_is_discountable():
+        return None
+    compiled = compiled or get_promotions(product.webshop_id)
+    category_id = product.parent.category_id if product.is_child else product.category_id
+    return compiled.discount_price(
+        price, product.pk, product.parent_id, category_id)
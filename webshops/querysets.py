@@ -1,6 +1,23 @@
 from __future__ import unicode_literals
 
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from webshops import storefront
+from webshops import tenancy
+
+
+class ChangeFeedQuerySetMixin(object):
+    """ keyset scan over (modified_at, pk) used by the change feed """
+
+    def changed_since(self, modified_at=None, pk=None):
+        _qs = self
+        if modified_at is not None:
+            _qs = _qs.filter(
+                models.Q(modified_at__gt=modified_at) |
+                models.Q(modified_at=modified_at, pk__gt=pk or 0))
+        return _qs.order_by('modified_at', 'pk')
 
 
 class WebshopQuerySet(models.QuerySet):
@@ -17,10 +34,10 @@ class WebshopManager(models.Manager):
 
     def get_queryset(self):
         _qs = WebshopQuerySet(self.model, using=self._db).filter(deleted_at__isnull=True)
-        return _qs
+        return tenancy.scope_queryset(_qs, field='pk')
 
 
-class CategoryQuerySet(models.QuerySet):
+class CategoryQuerySet(ChangeFeedQuerySetMixin, models.QuerySet):
     """ queryset manager for models.Category """
 
     def active(self):
@@ -32,12 +49,15 @@ class CategoryManager(models.Manager):
     def active(self):
         return self.get_queryset().active()
 
+    def with_deleted(self):
+        return tenancy.scope_queryset(CategoryQuerySet(self.model, using=self._db))
+
     def get_queryset(self):
-        _qs = CategoryQuerySet(self.model, using=self._db).filter(deleted_at__isnull=True)
+        _qs = self.with_deleted().filter(deleted_at__isnull=True)
         return _qs
 
 
-class ProductQuerySet(models.QuerySet):
+class ProductQuerySet(ChangeFeedQuerySetMixin, models.QuerySet):
     """ queryset manager for models.Product """
 
     def active(self):
@@ -50,6 +70,89 @@ class ProductQuerySet(models.QuerySet):
     def featured(self):
         return self.filter(featured=True)
 
+    # Bulk operations: single UPDATEs which bump modified_at (change feed)
+    # and the storefront version instead of a save() per product
+
+    def _webshop_ids(self):
+        return list(self.order_by().values_list('webshop', flat=True).distinct())
+
+    def update_catalog(self, **values):
+        """ update() of catalog fields, returns the number of updated rows """
+        webshop_ids = self._webshop_ids()
+        updated = self.update(modified_at=timezone.now(), **values)
+        if updated:
+            storefront.invalidate(*webshop_ids)
+        return updated
+
+    def soft_delete(self):
+        """
+            Set-based Product.delete: marks the products deleted and turns
+            their parents without remaining children into stand-alone ones
+        """
+        _qs = self.filter(deleted_at__isnull=True)
+        parent_ids = list(_qs.exclude(parent__isnull=True).order_by().values_list(
+            'parent', flat=True).distinct())
+        updated = _qs.update_catalog(deleted_at=timezone.now())
+        if parent_ids:
+            self.model.update_structures(parent_ids)
+        return updated
+
+    def set_active(self, active):
+        return self.exclude(active=active).update_catalog(active=active)
+
+    def set_featured(self, featured):
+        return self.exclude(featured=featured).update_catalog(featured=featured)
+
+    def set_category(self, category):
+        """
+            Moves the products of the category's webshop into it, children
+            are skipped (they use the category of their parent)
+        """
+        _qs = self.filter(webshop_id=category.webshop_id).exclude(
+            structure=self.model.CHILD).exclude(category=category)
+        pks = list(_qs.values_list('pk', flat=True))
+        if not pks:
+            return 0
+        updated = self.model.objects.with_deleted().filter(
+            pk__in=pks).update_catalog(category=category)
+        # reorder thresholds may come from the new category
+        self.model.refresh_low_stock(
+            pks + list(self.model._base_manager.filter(
+                parent__in=pks).values_list('pk', flat=True)))
+        return updated
+
+    def with_display_values(self):
+        """
+            Annotates effective_price (parent price fallback like
+            Product.get_price), showing_price (lowest active child price for
+            parents) and effective_stock (parent stock for children)
+        """
+        _decimal = models.DecimalField(max_digits=8, decimal_places=2)
+        _min_child_price = self.model._base_manager.filter(
+            parent=models.OuterRef('pk'), active=True, deleted_at__isnull=True,
+        ).order_by().values('parent').annotate(
+            min_price=models.Min('price')).values('min_price')
+        _effective_price = models.Case(
+            models.When(parent__price__gt=0, then=models.F('parent__price')),
+            default=models.F('price'), output_field=_decimal)
+        return self.annotate(
+            effective_price=_effective_price,
+            showing_price=models.Case(
+                models.When(
+                    structure=self.model.PARENT,
+                    then=Coalesce(
+                        models.Subquery(_min_child_price, output_field=_decimal),
+                        models.F('price'))),
+                default=_effective_price, output_field=_decimal),
+            effective_stock=models.Case(
+                models.When(
+                    structure=self.model.CHILD,
+                    parent__pcs_in_stock__isnull=False,
+                    then=models.F('parent__pcs_in_stock')),
+                default=models.F('pcs_in_stock'),
+                output_field=models.PositiveIntegerField()),
+        )
+
 
 class ProductManager(models.Manager):
 
@@ -62,6 +165,34 @@ class ProductManager(models.Manager):
     def featured(self):
         return self.get_queryset().featured()
 
+    def with_display_values(self):
+        return self.get_queryset().with_display_values()
+
+    def with_deleted(self):
+        return tenancy.scope_queryset(ProductQuerySet(self.model, using=self._db))
+
     def get_queryset(self):
-        _qs = ProductQuerySet(self.model, using=self._db).filter(deleted_at__isnull=True)
+        _qs = self.with_deleted().filter(deleted_at__isnull=True)
         return _qs
+
+
+class OrderQuerySet(models.QuerySet):
+    """ queryset manager for models.Order """
+
+    def placed_between(self, start=None, end=None):
+        """ orders of the half-open [start, end) date range, an index range scan """
+        _qs = self
+        if start is not None:
+            _qs = _qs.filter(date__gte=start)
+        if end is not None:
+            _qs = _qs.filter(date__lt=end)
+        return _qs
+
+
+class OrderManager(models.Manager):
+
+    def placed_between(self, start=None, end=None):
+        return self.get_queryset().placed_between(start, end)
+
+    def get_queryset(self):
+        return OrderQuerySet(self.model, using=self._db)
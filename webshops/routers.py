@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+#: models which may be read from a replica; everything else (orders) always
+#: goes to the primary
+CATALOG_MODELS = ('webshop', 'category', 'product')
+
+
+def allow_replica_reads(allowed):
+    """ Set by the middleware for safe requests of unpinned clients """
+    _state.replica_allowed = allowed
+    _state.wrote = False
+
+
+def replica_reads_allowed():
+    return getattr(_state, 'replica_allowed', False) and not getattr(_state, 'wrote', False)
+
+
+def reset():
+    """ Returns True if the primary was written during the request """
+    wrote = getattr(_state, 'wrote', False)
+    _state.replica_allowed = False
+    _state.wrote = False
+    return wrote
+
+
+class PrimaryReplicaRouter(object):
+    """
+        Sends catalog reads of safe requests to one of
+        ``settings.DATABASE_REPLICAS``, everything else to the primary
+    """
+
+    def _is_catalog(self, model):
+        return (
+            model._meta.app_label == 'webshops' and
+            model._meta.model_name in CATALOG_MODELS)
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if (
+            replicas and getattr(_state, 'replica_allowed', False) and
+            not getattr(_state, 'wrote', False) and
+            self._is_catalog(model) and
+            not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in getattr(settings, 'DATABASE_REPLICAS', ()):
+            return False
+        return None
@@ -1,6 +1,9 @@
 import rest_framework.serializers
 
-from webshops.models import Category, Product, Webshop, Order
+from webshops import feeds
+from webshops import inventory
+from webshops import promotions
+from webshops.models import Category, Product, Webshop, Order, OrderProduct
 
 
 class LightCategorySerializer(rest_framework.serializers.ModelSerializer):
@@ -33,10 +36,31 @@ class ProductIdOnlySerializer(rest_framework.serializers.ModelSerializer):
 
 
 class ProductSerializer(rest_framework.serializers.ModelSerializer):
-    showing_price = rest_framework.serializers.ReadOnlyField()
-    discount_price = rest_framework.serializers.ReadOnlyField()
+    showing_price = rest_framework.serializers.SerializerMethodField()
+    discount_price = rest_framework.serializers.SerializerMethodField()
+    available_qty_in_stock = rest_framework.serializers.SerializerMethodField()
+
+    def get_showing_price(self, obj):
+        # annotated by ProductQuerySet.with_display_values
+        if hasattr(obj, 'showing_price'):
+            price = obj.showing_price
+        elif obj.is_parent:
+            price = obj.get_children_min_price() or obj.price
+        else:
+            price = obj.get_price()
+        return None if price is None else '{:.2f}'.format(price)
+
+    def get_discount_price(self, obj):
+        # compiled promotions are shared by all objects of the response
+        compiled = self.context.setdefault('promotions', {})
+        if obj.webshop_id not in compiled:
+            compiled[obj.webshop_id] = promotions.get_promotions(obj.webshop_id)
+        price = promotions.get_discount_price(obj, compiled[obj.webshop_id])
+        return None if price is None else '{:.2f}'.format(price)
 
     def get_available_qty_in_stock(self, obj):
+        if hasattr(obj, 'effective_stock'):
+            return obj.effective_stock
         if obj and obj.is_child and getattr(obj, 'parent_qty_in_stock', None) is not None:
             return obj.parent_qty_in_stock
         return obj and obj.pcs_in_stock
@@ -47,15 +71,100 @@ class ProductSerializer(rest_framework.serializers.ModelSerializer):
 
 
 class ProductDetailSerializer(ProductSerializer):
-    has_children = rest_framework.serializers.ReadOnlyField()
+    has_children = rest_framework.serializers.SerializerMethodField()
     has_options = rest_framework.serializers.ReadOnlyField()
     category = LightCategorySerializer(read_only=True)
 
+    def get_has_children(self, obj):
+        # batch views resolve it for all objects at once
+        parent_ids = self.context.get('parent_ids')
+        if parent_ids is not None:
+            return obj.pk in parent_ids
+        return obj.has_children()
+
     class Meta:
         model = Product
         fields = '__all__'
 
 
+class InventoryItemSerializer(rest_framework.serializers.Serializer):
+    """ One stock level, validated data is a webshops.inventory.parse_item result """
+    id = rest_framework.serializers.IntegerField(required=False)
+    barcode = rest_framework.serializers.CharField(required=False)
+    qty = rest_framework.serializers.IntegerField(required=False)
+    delta = rest_framework.serializers.IntegerField(required=False)
+    version = rest_framework.serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        try:
+            return inventory.parse_item(attrs)
+        except ValueError as e:
+            raise rest_framework.serializers.ValidationError('{}'.format(e))
+
+
+class InventoryUpdateSerializer(rest_framework.serializers.Serializer):
+    """ Stock levels pushed by warehouse systems """
+    items = rest_framework.serializers.ListField(
+        child=InventoryItemSerializer(), max_length=inventory.MAX_ITEMS)
+
+
+class ChangeFeedSerializer(rest_framework.serializers.Serializer):
+    """ Query parameters of the change feed, see webshops.apis.ChangeFeedMixin """
+    webshop = rest_framework.serializers.IntegerField(min_value=1)
+    cursor = rest_framework.serializers.CharField(required=False)
+    limit = rest_framework.serializers.IntegerField(
+        min_value=1, max_value=feeds.MAX_LIMIT, default=feeds.DEFAULT_LIMIT)
+
+
+class ProductBatchSerializer(rest_framework.serializers.Serializer):
+    """
+        Ids of the batch retrieve, at most ``context['max_ids']`` of them;
+        returns them in the request order without duplicates
+    """
+    ids = rest_framework.serializers.ListField(
+        child=rest_framework.serializers.IntegerField())
+
+    def validate_ids(self, value):
+        max_ids = self.context.get('max_ids')
+        if max_ids is not None and len(value) > max_ids:
+            raise rest_framework.serializers.ValidationError(
+                'Ensure there are no more than {} ids.'.format(max_ids))
+        seen = set()
+        return [_id for _id in value if not (_id in seen or seen.add(_id))]
+
+
+class ProductBulkSerializer(rest_framework.serializers.Serializer):
+    """
+        One operation applied to many products with set-based UPDATEs, see
+        the bulk methods of webshops.querysets.ProductQuerySet
+    """
+    MAX_IDS = 10000
+    DELETE, ACTIVATE, DEACTIVATE = 'delete', 'activate', 'deactivate'
+    SET_CATEGORY, SET_FEATURED = 'set_category', 'set_featured'
+    OPERATIONS = (DELETE, ACTIVATE, DEACTIVATE, SET_CATEGORY, SET_FEATURED)
+
+    ids = rest_framework.serializers.ListField(
+        child=rest_framework.serializers.IntegerField(), max_length=MAX_IDS)
+    operation = rest_framework.serializers.ChoiceField(choices=OPERATIONS)
+    category = rest_framework.serializers.IntegerField(required=False)
+    featured = rest_framework.serializers.BooleanField(required=False)
+
+    def validate_category(self, value):
+        # looked up per request, Category.objects is scoped to the tenant
+        category = Category.objects.filter(pk=value).first()
+        if category is None:
+            raise rest_framework.serializers.ValidationError('Unknown category.')
+        return category
+
+    def validate(self, attrs):
+        required = {self.SET_CATEGORY: 'category', self.SET_FEATURED: 'featured'}.get(
+            attrs['operation'])
+        if required and required not in attrs:
+            raise rest_framework.serializers.ValidationError(
+                {required: ['This field is required.']})
+        return attrs
+
+
 class WebshopSerializer(rest_framework.serializers.ModelSerializer):
     """
         Webshop serializer of the company one for the chat contacts list and others
@@ -75,3 +184,67 @@ class OrderSerializer(rest_framework.serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ('id', 'paid', 'shipped',)
+
+
+class OrderLineSerializer(rest_framework.serializers.ModelSerializer):
+    total = rest_framework.serializers.SerializerMethodField()
+
+    def get_total(self, obj):
+        return '{:.2f}'.format(obj.price * obj.quantity)
+
+    class Meta:
+        model = OrderProduct
+        fields = (
+            'id', 'product', 'name', 'description', 'quantity', 'price',
+            'price_excl_vat', 'total')
+
+
+class OrderDetailSerializer(rest_framework.serializers.ModelSerializer):
+    """
+        Order with its lines and totals for the order history, expects the
+        lines to be prefetched
+    """
+    lines = OrderLineSerializer(source='orderproduct_set', many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = (
+            'id', 'webshop', 'date', 'paid', 'shipped', 'address', 'email',
+            'phone', 'subtotal', 'vat', 'total', 'lines')
+
+
+class CartLineSerializer(rest_framework.serializers.Serializer):
+    product = rest_framework.serializers.IntegerField()
+    quantity = rest_framework.serializers.IntegerField(min_value=1)
+
+
+class CartSerializer(rest_framework.serializers.Serializer):
+    """
+        Cart sent for pricing
+    """
+    lines = CartLineSerializer(many=True)
+
+
+class PricedCartLineSerializer(rest_framework.serializers.Serializer):
+    product = rest_framework.serializers.IntegerField()
+    quantity = rest_framework.serializers.IntegerField()
+    unit_price = rest_framework.serializers.DecimalField(max_digits=8, decimal_places=2)
+    vat = rest_framework.serializers.IntegerField()
+    discountable = rest_framework.serializers.BooleanField()
+    discount = rest_framework.serializers.DecimalField(max_digits=14, decimal_places=2)
+    subtotal = rest_framework.serializers.DecimalField(max_digits=14, decimal_places=2)
+    vat_amount = rest_framework.serializers.DecimalField(max_digits=14, decimal_places=2)
+    total = rest_framework.serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class PricedCartSerializer(rest_framework.serializers.Serializer):
+    """
+        Result of webshops.pricing.price_cart
+    """
+    lines = PricedCartLineSerializer(many=True)
+    missing = rest_framework.serializers.ListField(
+        child=rest_framework.serializers.IntegerField())
+    subtotal = rest_framework.serializers.DecimalField(max_digits=16, decimal_places=2)
+    vat = rest_framework.serializers.DecimalField(max_digits=16, decimal_places=2)
+    discount = rest_framework.serializers.DecimalField(max_digits=16, decimal_places=2)
+    total = rest_framework.serializers.DecimalField(max_digits=16, decimal_places=2)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from webshops import promotions
+from webshops import storefront
+from webshops import tenancy
+from webshops.models import Category, Product, Promotion, Webshop
+
+
+@receiver([post_save, post_delete], sender=Webshop)
+@receiver([post_save, post_delete], sender=Promotion)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_promotions(sender, instance, **kwargs):
+    """ rule or category tree changes recompile the shop's promotions """
+    promotions.invalidate(instance.pk if sender is Webshop else instance.webshop_id)
+
+
+@receiver([post_save, post_delete], sender=Webshop)
+@receiver([post_save, post_delete], sender=Promotion)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_storefront(sender, instance, **kwargs):
+    """ catalog changes drop the shop's cached storefront payloads """
+    storefront.invalidate(instance.pk if sender is Webshop else instance.webshop_id)
+
+
+@receiver([post_save, post_delete], sender=Webshop)
+def invalidate_tenant_host(sender, instance, **kwargs):
+    """ (de)activations change which webshop the site's host resolves to """
+    for domain in Site.objects.filter(pk=instance.site_id).values_list('domain', flat=True):
+        cache.delete(tenancy.host_cache_key(domain))
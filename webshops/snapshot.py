@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+    Optional in-process catalog snapshot of a webshop: its products and
+    categories as compact ``__slots__`` records holding the already resolved
+    (serialized) values. Product and category list/retrieve views serve from
+    it instead of building model instances on every request.
+
+    A snapshot is loaded on first use in each process and then refreshed from
+    the ``modified_at`` change feed at most every
+    ``settings.WEBSHOPS_SNAPSHOT_REFRESH_SECONDS``. Hard deletes (and the
+    rows removed with them by cascades) don't show up in the feed, so every
+    ``settings.WEBSHOPS_SNAPSHOT_RECONCILE_SECONDS`` the snapshot also compares
+    its primary keys with the database.
+
+    The budget is counted in rows (products plus categories), not bytes: all
+    snapshots of a process hold at most ``settings.WEBSHOPS_SNAPSHOT_MAX_ROWS``
+    rows, least recently used shops are dropped first and bigger shops are
+    never loaded. 0 disables snapshots.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from webshops import feeds
+from webshops import serializers
+from webshops.models import Category, Product
+
+#: rows changed this long before the last refresh are read again, covering
+#: transactions which committed after a refresh with older modified_at values
+REFRESH_OVERLAP = datetime.timedelta(seconds=5)
+CHUNK_SIZE = 500
+
+_snapshots = OrderedDict()  # webshop id -> CatalogSnapshot, least recent first
+_oversized = {}  # webshop id -> time of the failed load
+_lock = threading.Lock()
+
+
+class ProductRecord(object):
+    __slots__ = (
+        'pk', 'values', 'sort_key', 'category_id', 'parent_id',
+        'promotion_category_id', 'price', 'discountable')
+
+
+class CategoryRecord(object):
+    __slots__ = ('pk', 'name', 'description', 'parent_id', 'active', 'sort_key')
+
+    def light_data(self):
+        return OrderedDict((
+            ('id', self.pk), ('name', self.name), ('parent', self.parent_id)))
+
+    def detail_data(self):
+        return OrderedDict((
+            ('id', self.pk), ('name', self.name),
+            ('description', self.description), ('parent', self.parent_id)))
+
+
+class CatalogSnapshot(object):
+
+    def __init__(self, webshop_id):
+        self.webshop_id = webshop_id
+        self.products = {}
+        self.categories = {}
+        self.product_fields = ()
+        self.product_list = []
+        self.category_list = []
+        self.parent_ids = frozenset()
+        self.cursor = None
+        self.checked_at = 0
+        self.reconciled_at = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.products) + len(self.categories)
+
+    # Loading
+
+    def get_product_queryset(self):
+        return Product.objects.filter(webshop_id=self.webshop_id).select_related(
+            'category', 'parent').with_display_values()
+
+    def get_category_queryset(self):
+        return Category.objects.filter(webshop_id=self.webshop_id)
+
+    def count_rows(self):
+        """ rows a load() reads, without reading them """
+        return (
+            self.get_category_queryset().count() +
+            Product.objects.filter(webshop_id=self.webshop_id).count())
+
+    def _product_record(self, obj, serializer):
+        data = serializer.to_representation(obj)
+        # discount prices depend on the time and are resolved per request
+        data['discount_price'] = None
+        if not self.product_fields:
+            self.product_fields = tuple(data)
+        record = ProductRecord()
+        record.pk = obj.pk
+        record.values = tuple(data[_field] for _field in self.product_fields)
+        record.sort_key = (-feeds.to_micros(obj.added_at), obj.name, obj.pk)
+        record.category_id = obj.category_id
+        record.parent_id = obj.parent_id
+        record.promotion_category_id = (
+            obj.parent.category_id if obj.parent_id else obj.category_id)
+        record.price = obj.get_price()
+        # an orphaned child has no parent to inherit from
+        record.discountable = bool(
+            obj.parent_id or not obj.is_child) and obj.get_is_discountable()
+        return record
+
+    def _category_record(self, obj):
+        record = CategoryRecord()
+        record.pk = obj.pk
+        record.name = obj.name
+        record.description = obj.description
+        record.parent_id = obj.parent_id
+        record.active = obj.active
+        record.sort_key = (obj.name, -obj.pk)
+        return record
+
+    def _load_products(self, pks=None):
+        serializer = serializers.ProductSerializer(context={'promotions': {}})
+        queryset = self.get_product_queryset()
+        if pks is None:
+            chunks = [queryset.iterator()]
+        else:
+            pks = list(pks)
+            chunks = (
+                queryset.filter(pk__in=pks[_i:_i + CHUNK_SIZE])
+                for _i in range(0, len(pks), CHUNK_SIZE))
+        loaded = set()
+        for _chunk in chunks:
+            for _obj in _chunk:
+                self.products[_obj.pk] = self._product_record(_obj, serializer)
+                loaded.add(_obj.pk)
+        return loaded
+
+    def _sort(self):
+        self.product_list = sorted(
+            self.products.values(), key=lambda _record: _record.sort_key)
+        self.category_list = sorted(
+            self.categories.values(), key=lambda _record: _record.sort_key)
+        self.parent_ids = frozenset(
+            _record.parent_id for _record in self.product_list if _record.parent_id)
+
+    def load(self):
+        started = timezone.now()
+        self.categories = dict(
+            (_obj.pk, self._category_record(_obj))
+            for _obj in self.get_category_queryset().iterator())
+        self.products = {}
+        self._load_products()
+        self._sort()
+        self.cursor = started
+        self.reconciled_at = time.time()
+
+    def reconcile(self):
+        """
+            Drops the rows which are gone from the database and loads the ones
+            missing in the snapshot, returns whether anything changed
+        """
+        category_pks = set(self.get_category_queryset().values_list('pk', flat=True))
+        product_pks = set(
+            Product.objects.filter(webshop_id=self.webshop_id).values_list('pk', flat=True))
+        self.reconciled_at = time.time()
+
+        changed = False
+        for _pk in set(self.categories) - category_pks:
+            changed = True
+            del self.categories[_pk]
+        missing = category_pks - set(self.categories)
+        if missing:
+            changed = True
+            for _obj in self.get_category_queryset().filter(pk__in=missing):
+                self.categories[_obj.pk] = self._category_record(_obj)
+
+        # parents show the lowest price of their remaining children
+        affected = product_pks - set(self.products)
+        for _pk in set(self.products) - product_pks:
+            changed = True
+            _parent_id = self.products.pop(_pk).parent_id
+            if _parent_id in product_pks:
+                affected.add(_parent_id)
+        if affected:
+            changed = True
+            self._load_products(affected)
+        return changed
+
+    def refresh(self):
+        """ Applies the rows changed since the last load or refresh """
+        started = timezone.now()
+        since = self.cursor - REFRESH_OVERLAP
+
+        changed = False
+        for _obj in Category.objects.with_deleted().filter(
+                webshop_id=self.webshop_id, modified_at__gte=since):
+            changed = True
+            if _obj.deleted_at is None:
+                self.categories[_obj.pk] = self._category_record(_obj)
+            else:
+                self.categories.pop(_obj.pk, None)
+
+        affected = set()
+        for pk, parent_id in Product.objects.with_deleted().filter(
+                webshop_id=self.webshop_id, modified_at__gte=since
+        ).values_list('pk', 'parent'):
+            # parents show the lowest child price, children the parent stock
+            affected.add(pk)
+            if parent_id:
+                affected.add(parent_id)
+        if affected:
+            changed = True
+            affected.update(
+                _record.pk for _record in self.product_list
+                if _record.parent_id in affected)
+            loaded = self._load_products(affected)
+            for _pk in affected - loaded:
+                self.products.pop(_pk, None)
+
+        if time.time() - self.reconciled_at >= settings.WEBSHOPS_SNAPSHOT_RECONCILE_SECONDS:
+            changed = self.reconcile() or changed
+
+        if changed:
+            self._sort()
+        self.cursor = started
+
+    def ensure_fresh(self):
+        if time.time() - self.checked_at < settings.WEBSHOPS_SNAPSHOT_REFRESH_SECONDS:
+            return
+        with self.lock:
+            if time.time() - self.checked_at < settings.WEBSHOPS_SNAPSHOT_REFRESH_SECONDS:
+                return
+            if self.cursor is None:
+                self.load()
+            else:
+                self.refresh()
+            self.checked_at = time.time()
+
+    # Serving
+
+    def product_data(self, record, compiled_promotions):
+        data = OrderedDict(zip(self.product_fields, record.values))
+        if record.price and record.discountable:
+            price = compiled_promotions.discount_price(
+                record.price, record.pk, record.parent_id,
+                record.promotion_category_id)
+            data['discount_price'] = None if price is None else '{:.2f}'.format(price)
+        return data
+
+    def product_detail_data(self, record, compiled_promotions):
+        """ ProductDetailSerializer data or None if the category is unknown """
+        data = self.product_data(record, compiled_promotions)
+        if record.category_id is not None:
+            category = self.categories.get(record.category_id)
+            if category is None:
+                return None
+            data['category'] = category.light_data()
+        data['has_children'] = record.pk in self.parent_ids
+        return data
+
+
+def clear():
+    with _lock:
+        _snapshots.clear()
+        _oversized.clear()
+
+
+def get_snapshot(webshop_id):
+    """
+        Fresh snapshot of the webshop or None when snapshots are disabled or
+        the webshop doesn't fit into the row budget
+    """
+    max_rows = settings.WEBSHOPS_SNAPSHOT_MAX_ROWS
+    if not max_rows or webshop_id is None:
+        return None
+    with _lock:
+        _failed_at = _oversized.get(webshop_id)
+        if _failed_at and time.time() - _failed_at < settings.WEBSHOPS_SNAPSHOT_RETRY_SECONDS:
+            return None
+        snapshot = _snapshots.pop(webshop_id, None)
+        if snapshot is not None:
+            _snapshots[webshop_id] = snapshot
+
+    if snapshot is None:
+        # counted first, an oversized shop isn't loaded only to be dropped
+        snapshot = CatalogSnapshot(webshop_id)
+        if snapshot.count_rows() > max_rows:
+            with _lock:
+                _oversized[webshop_id] = time.time()
+            return None
+        with _lock:
+            snapshot = _snapshots.setdefault(webshop_id, snapshot)
+
+    snapshot.ensure_fresh()
+
+    with _lock:
+        if len(snapshot) > max_rows:
+            _snapshots.pop(webshop_id, None)
+            _oversized[webshop_id] = time.time()
+            return None
+        _total = sum(len(_snapshot) for _snapshot in _snapshots.values())
+        for _id in list(_snapshots):
+            if _total <= max_rows or _id == webshop_id:
+                break
+            _total -= len(_snapshots.pop(_id))
+    return snapshot
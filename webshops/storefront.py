@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+    Cached storefront payloads. Each webshop has a catalog version in the
+    cache which is part of every payload key; catalog writes bump it (see
+    webshops.signals and the set-based updates of webshops.models and
+    webshops.inventory), so outdated payloads are never read again and expire.
+
+    Versions and payloads live in the default cache. With a cache shared by
+    all processes (memcached, redis) a write is visible at once and payloads
+    are kept ``settings.WEBSHOPS_HOME_CACHE_SECONDS``; with the local-memory
+    cache only the writing process sees it, so payloads are kept just
+    ``settings.WEBSHOPS_STOREFRONT_LOCAL_CACHE_SECONDS`` and the other
+    processes serve outdated ones at most that long.
+"""
+from __future__ import unicode_literals
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from webshops import tenancy
+
+
+def version_key(webshop_id):
+    return tenancy.cache_key('catalog:version', webshop_id)
+
+
+def _bump(webshop_ids):
+    cache.set_many(
+        dict((version_key(_id), uuid.uuid4().hex) for _id in webshop_ids), None)
+
+
+def invalidate(*webshop_ids):
+    """
+        Bumps the catalog version of the webshops now and again after the
+        transaction commits, so payloads rebuilt from not yet committed rows
+        by other requests are dropped as well
+    """
+    webshop_ids = set(_id for _id in webshop_ids if _id is not None)
+    if not webshop_ids:
+        return
+    _bump(webshop_ids)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(webshop_ids))
+
+
+def get_version(webshop_id):
+    version = cache.get(version_key(webshop_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        # a concurrent first request may have set it already
+        if not cache.add(version_key(webshop_id), version, None):
+            version = cache.get(version_key(webshop_id), version)
+    return version
+
+
+def cache_key(name, webshop_id):
+    """ Key of a payload, valid until the next catalog change of the webshop """
+    return tenancy.cache_key(
+        '{}:{}'.format(name, get_version(webshop_id)), webshop_id)
+
+
+def cache_timeout():
+    """ seconds a payload is kept, short when other processes can't see the versions """
+    if isinstance(caches['default'], LocMemCache):
+        return min(
+            settings.WEBSHOPS_HOME_CACHE_SECONDS,
+            settings.WEBSHOPS_STOREFRONT_LOCAL_CACHE_SECONDS)
+    return settings.WEBSHOPS_HOME_CACHE_SECONDS
+
+
+def build_tree(categories):
+    """
+        Nests (id, name, parent_id) rows into [{id, name, children}], rows
+        whose parent isn't in the list are dropped with their subtree
+    """
+    nodes, roots = {}, []
+    for pk, name, parent_id in categories:
+        nodes[pk] = dict(id=pk, name=name, children=[])
+    for pk, name, parent_id in categories:
+        if parent_id is None:
+            roots.append(nodes[pk])
+        elif parent_id in nodes:
+            nodes[parent_id]['children'].append(nodes[pk])
+    return roots
+
+
+def count_nodes(tree):
+    """ number of categories in a build_tree result """
+    return sum(1 + count_nodes(_node['children']) for _node in tree)
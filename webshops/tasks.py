@@ -1,37 +1,189 @@
+import smtplib
+import socket
+import uuid
+
 from celery.utils.log import get_task_logger
 
 from django.conf import settings
 from django.core.mail.message import EmailMultiAlternatives
+from django.template.loader import render_to_string
 
 from simpleAPI.celery_init import app
 
 logger = get_task_logger(__name__)
 
 
-@app.task(name="webshops.send_email", bind=True)
+@app.task(name="webshops.send_email", bind=True, max_retries=None)
 def send_email(
     self, subject, text_content, recipients, html_content=None,
-    attachments=None, reply_to=None
+    attachments=None, reply_to=None, idempotency_key=None
 ):
+    """
+        Sends the message once per idempotency key (the task id by default),
+        retries transient SMTP errors with exponential backoff up to
+        settings.WEBSHOPS_EMAIL_MAX_RETRIES times and then keeps it as a dead
+        letter, see webshops.deliveries. Attachments aren't kept for replays.
+        Waiting for a free SMTP slot or for another worker sending the same
+        key doesn't count as a failed attempt.
+    """
+    from webshops import deliveries
+
     logger.info("sending email '%s'..." % subject)
     if reply_to is None:
         reply_to = settings.NO_REPLY_EMAIL
 
-    _recipients = filter(None, recipients)
-    msg = EmailMultiAlternatives(
-        subject,
-        text_content,
-        settings.NO_REPLY_EMAIL,
-        _recipients,
-        reply_to=[reply_to]
-    )
-    if html_content:
-        logger.info("attaching HTML alternative")
-        msg.attach_alternative(html_content, "text/html")
-    if attachments:
-        for a in attachments:
-            logger.info("attaching file: " + a.filename)
-            msg.attach(a.filename, a.file, a.mime)
-    if _recipients:
+    _recipients = [_r for _r in recipients if _r]
+    if not _recipients:
+        return
+
+    key = idempotency_key or self.request.id or uuid.uuid4().hex
+    try:
+        delivery = deliveries.claim(
+            key, subject=subject, text_content=text_content,
+            html_content=html_content or '', recipients='\n'.join(_recipients),
+            reply_to=reply_to)
+    except deliveries.Busy:
+        # waiting for a slot isn't a failure of this message
+        raise self.retry(countdown=deliveries.backoff(0), max_retries=None)
+    if delivery is None:
+        if deliveries.was_sent(key):
+            logger.info("email %s was sent already, skipped" % key)
+            return
+        # another worker is sending it right now
+        raise self.retry(countdown=deliveries.backoff(0), max_retries=None)
+
+    try:
+        msg = EmailMultiAlternatives(
+            subject,
+            text_content,
+            settings.NO_REPLY_EMAIL,
+            _recipients,
+            reply_to=[reply_to]
+        )
+        if html_content:
+            logger.info("attaching HTML alternative")
+            msg.attach_alternative(html_content, "text/html")
+        if attachments:
+            for a in attachments:
+                logger.info("attaching file: " + a.filename)
+                msg.attach(a.filename, a.file, a.mime)
         msg.send()
-        logger.info("sent successfully")
+    except (smtplib.SMTPException, socket.error) as e:
+        # delivery.attempts was read before this attempt was claimed
+        final = delivery.attempts >= settings.WEBSHOPS_EMAIL_MAX_RETRIES
+        deliveries.mark_failed(delivery, e, final=final)
+        if final:
+            logger.error("giving up on email %s: %s" % (key, e))
+            return
+        logger.warning("sending email %s failed, retrying: %s" % (key, e))
+        raise self.retry(
+            exc=e, countdown=deliveries.backoff(delivery.attempts),
+            max_retries=None)
+    except Exception as e:
+        # not transient, keep it as a dead letter instead of SENDING
+        deliveries.mark_failed(delivery, e, final=True)
+        logger.error("sending email %s failed: %s" % (key, e))
+        raise
+    deliveries.mark_sent(delivery)
+    logger.info("sent successfully")
+
+
+@app.task(name="webshops.send_status_emails", bind=True)
+def send_status_emails(self, order_ids, title=None, batch_size=500):
+    """ Status notifications of many orders, rendered here in batches """
+    from webshops import deliveries, notifications
+    from webshops.models import Order
+
+    order_ids = list(order_ids)
+    sent, render_seconds = 0, 0.0
+    for offset in range(0, len(order_ids), batch_size):
+        orders = Order.objects.filter(
+            pk__in=order_ids[offset:offset + batch_size]).select_related('webshop')
+        for order, subject, text_content, html_content, seconds in \
+                notifications.render_batch(orders, title):
+            logger.debug("rendered order %s email in %.2f ms" % (order.pk, seconds * 1000))
+            render_seconds += seconds
+            send_email.delay(
+                subject, text_content, [order.email], html_content=html_content,
+                idempotency_key=deliveries.order_key(
+                    order, notifications.get_status(order)))
+            sent += 1
+    if sent:
+        logger.info("rendered %s order emails, %.2f ms per message" % (
+            sent, render_seconds * 1000 / sent))
+    return sent
+
+
+@app.task(name="webshops.propagate_product_name", bind=True)
+def propagate_product_name(self, product_id, token=None):
+    from webshops.models import Product, start_cascade
+
+    if not start_cascade('propagate_product_name', product_id, token):
+        return
+    updated = Product.propagate_name(
+        product_id, batch_size=settings.WEBSHOPS_CASCADE_BATCH_SIZE)
+    logger.info("renamed %s children of product %s" % (updated, product_id))
+
+
+@app.task(name="webshops.update_product_structure", bind=True)
+def update_product_structure(self, product_id, token=None):
+    from webshops.models import Product, start_cascade
+
+    if not start_cascade('update_product_structure', product_id, token):
+        return
+    Product.update_structure(product_id)
+
+
+@app.task(name="webshops.purge_deleted_rows", bind=True)
+def purge_deleted_rows(self, days=None, batch_size=None):
+    from webshops import archival
+
+    stats = archival.purge_deleted(
+        days or settings.WEBSHOPS_PURGE_AFTER_DAYS,
+        batch_size=batch_size or settings.WEBSHOPS_PURGE_BATCH_SIZE,
+        archive=settings.WEBSHOPS_PURGE_ARCHIVE)
+    for line in archival.format_stats(stats):
+        logger.info(line)
+
+
+@app.task(name="webshops.check_product_structure", bind=True)
+def check_product_structure(self, fix=None):
+    from webshops import integrity
+
+    stats = integrity.scan()
+    for line in integrity.format_stats(stats):
+        logger.info(line)
+    if any(counts for _, counts, _ in stats) and (
+            settings.WEBSHOPS_STRUCTURE_AUTOFIX if fix is None else fix):
+        for check, count in integrity.fix().items():
+            logger.warning("fixed %s products: %s" % (count, check))
+
+
+@app.task(name="webshops.send_low_stock_digest", bind=True)
+def send_low_stock_digest(self, batch_size=500):
+    """ One email per webshop (and batch) listing its products low on stock """
+    from webshops.models import Product
+
+    recipients = settings.WEBSHOPS_LOW_STOCK_RECIPIENTS
+    if not recipients:
+        return
+    products = Product.objects.filter(is_low_stock=True).select_related(
+        'webshop').order_by('webshop', 'pcs_in_stock', 'pk')
+
+    batch = []
+    for product in products.iterator():
+        if batch and (
+                batch[0].webshop_id != product.webshop_id or len(batch) == batch_size):
+            _send_low_stock_batch(batch, recipients)
+            batch = []
+        batch.append(product)
+    if batch:
+        _send_low_stock_batch(batch, recipients)
+
+
+def _send_low_stock_batch(products, recipients):
+    webshop = products[0].webshop
+    subject = "Low stock: {}".format(webshop.name)
+    text_content = render_to_string(
+        'emails/low_stock_digest.txt', {'webshop': webshop, 'products': products})
+    send_email.delay(subject, text_content, recipients)
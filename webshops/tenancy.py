@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import contextlib
+import threading
+
+_state = threading.local()
+
+
+def get_current_webshop_id():
+    """ Webshop the current request is scoped to, None means unscoped """
+    return getattr(_state, 'webshop_id', None)
+
+
+def set_current_webshop(webshop_id):
+    _state.webshop_id = webshop_id
+
+
+@contextlib.contextmanager
+def scoped(webshop_id):
+    """ Scopes all webshop managers to the given webshop inside the block """
+    _previous = get_current_webshop_id()
+    set_current_webshop(webshop_id)
+    try:
+        yield
+    finally:
+        set_current_webshop(_previous)
+
+
+def scope_queryset(queryset, field='webshop'):
+    webshop_id = get_current_webshop_id()
+    if webshop_id is None:
+        return queryset
+    return queryset.filter(**{field: webshop_id})
+
+
+def cache_key(key, webshop_id=None):
+    """ Namespaces a cache key by the given or the current webshop """
+    if webshop_id is None:
+        webshop_id = get_current_webshop_id()
+    return 'webshop:{}:{}'.format(
+        '*' if webshop_id is None else webshop_id, key)
+
+
+def host_cache_key(host):
+    """ Key of the host -> webshop resolution of TenantMiddleware """
+    return 'tenancy:host:{}'.format(host)
@@ -0,0 +1,65 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test.utils import override_settings
+
+from simpleAPI.testtools import BaseTest
+
+from webshops import admin as wadmin
+from webshops import factories, models
+
+__author__ = 'smirnov.ev'
+
+
+class AdminTestCase(BaseTest):
+
+    def setUp(self):
+        get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+
+    @transaction.atomic()
+    def test_webshop_changelist(self):
+        """ Testing webshops.admin.WebshopAdmin annotated counts """
+        webshop = factories.WebshopFactory()
+        category = factories.CategoryFactory(webshop=webshop)
+        factories.ProductFactory.create_batch(3, webshop=webshop, category=category)
+        factories.ProductFactory(webshop=webshop, category=category).delete()
+
+        response = self.client.get('/admin/webshops/webshop/')
+        self.assertEqual(response.status_code, 200)
+        obj = response.context['cl'].result_list.get(pk=webshop.pk)
+        self.assertEqual(obj._num_products, 3)
+        self.assertEqual(obj._num_categories, 1)
+
+    @transaction.atomic()
+    def test_product_changelist(self):
+        """ Testing webshops.admin.ProductAdmin changelist """
+        factories.ProductFactory.create_batch(3)
+        response = self.client.get('/admin/webshops/product/?active__exact=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertFalse(wadmin.is_unfiltered(response.context['cl'].queryset))
+
+        # the soft delete filter of the manager still counts as unfiltered
+        response = self.client.get('/admin/webshops/product/')
+        self.assertTrue(wadmin.is_unfiltered(response.context['cl'].queryset))
+
+    @transaction.atomic()
+    @override_settings(WEBSHOPS_ADMIN_COUNT_LIMIT=2)
+    def test_estimated_count_paginator(self):
+        """ Testing webshops.admin.EstimatedCountPaginator count limit """
+        factories.ProductFactory.create_batch(3)
+        paginator = wadmin.EstimatedCountPaginator(models.Product.objects.all(), 1)
+        self.assertEqual(paginator.count, 2)
+        self.assertEqual(paginator.num_pages, 2)
+
+    @transaction.atomic()
+    def test_is_unfiltered(self):
+        """ Testing webshops.admin.is_unfiltered function """
+        self.assertTrue(wadmin.is_unfiltered(models.Product.objects.all()))
+        self.assertTrue(wadmin.is_unfiltered(models.Order.objects.all()))
+        self.assertFalse(wadmin.is_unfiltered(models.Product.objects.filter(active=True)))
+        self.assertFalse(wadmin.is_unfiltered(models.Product.objects.with_deleted()))
+        self.assertFalse(wadmin.is_unfiltered(models.Product.objects.none()))
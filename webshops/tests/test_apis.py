@@ -1,5 +1,6 @@
 # coding: utf-8
 from __future__ import unicode_literals
+import datetime
 import json
 import random
 import string
@@ -15,6 +16,8 @@ from rest_framework.test import APIClient
 from simpleAPI.testtools import BaseTest
 
 import webshops.factories
+import webshops.feeds
+import webshops.models
 import webshops.serializers
 
 __author__ = 'smirnov.ev'
@@ -248,6 +251,170 @@ class ProductAPITestCase(APIBaseTestCase):
         res = self.apiclient.logout()
 
 
+    @transaction.atomic()
+    def test_api_changes_view(self):
+        ''' Testing webshops.apis.ProductViewSet changes view'''
+        url = reverse('webshops:api_product-changes')
+        res = self.apiclient.get(url)
+        self.assertEqual(res.status_code, 400)
+
+        res = self.apiclient.get(url, dict(webshop=self.webshop.pk))
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.content)
+        self.assertEqual([_obj['id'] for _obj in data['upserts']], [self.object.pk])
+        self.assertEqual(data['deletions'], [])
+        self.assertFalse(data['has_more'])
+        _cursor = data['cursor']
+
+        res = self.apiclient.get(url, dict(webshop=self.webshop.pk, cursor=_cursor))
+        data = json.loads(res.content)
+        self.assertEqual(data['upserts'], [])
+        self.assertEqual(data['cursor'], _cursor)
+
+        _obj = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category)
+        _obj.delete()
+        res = self.apiclient.get(url, dict(webshop=self.webshop.pk, cursor=_cursor))
+        data = json.loads(res.content)
+        self.assertEqual(data['upserts'], [])
+        self.assertEqual(data['deletions'], [_obj.pk])
+
+        res = self.apiclient.get(url, dict(webshop=self.webshop.pk, cursor='bad'))
+        self.assertEqual(res.status_code, 400)
+        res = self.apiclient.get(url, dict(
+            webshop=self.webshop.pk, cursor='{}:1'.format(10 ** 30)))
+        self.assertEqual(res.status_code, 400)
+        for _params in (dict(webshop='abc'), dict(limit=0), dict(limit=-5),
+                        dict(limit=webshops.feeds.MAX_LIMIT + 1)):
+            res = self.apiclient.get(url, dict(dict(webshop=self.webshop.pk), **_params))
+            self.assertEqual(res.status_code, 400)
+
+    @transaction.atomic()
+    def test_api_list_view_tenant(self):
+        ''' Testing webshops.apis.ProductViewSet list view scoped by X-Webshop'''
+        url = reverse('webshops:api_product-list')
+        _webshop = webshops.factories.WebshopFactory.create()
+        res = self.apiclient.get(url, HTTP_X_WEBSHOP='{}'.format(_webshop.pk))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.content)['results'], [])
+
+        res = self.apiclient.get(url, HTTP_X_WEBSHOP='{}'.format(self.webshop.pk))
+        data = json.loads(res.content)
+        self.assertEqual([_obj['id'] for _obj in data['results']], [self.object.pk])
+
+    @transaction.atomic()
+    def test_api_batch_view(self):
+        ''' Testing webshops.apis.ProductViewSet batch view'''
+        url = reverse('webshops:api_product-batch')
+        _obj = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category)
+        _missing = _obj.pk + 1000
+
+        res = self.apiclient.get(url, dict(ids='{},{},{}'.format(
+            _obj.pk, _missing, self.object.pk)))
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.content)
+        self.assertEqual(
+            [_item['id'] for _item in data['results']], [_obj.pk, self.object.pk])
+        self.assertFalse(data['results'][0]['has_children'])
+        self.assertEqual(data['missing'], [_missing])
+
+        res = self.apiclient.post(url, dict(ids=[self.object.pk]), format='json')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.content)
+        self.assertEqual([_item['id'] for _item in data['results']], [self.object.pk])
+
+        res = self.apiclient.get(url, dict(ids='a,b'))
+        self.assertEqual(res.status_code, 400)
+        res = self.apiclient.get(url, dict(ids=','.join(['1'] * 301)))
+        self.assertEqual(res.status_code, 400)
+        res = self.apiclient.post(url, [self.object.pk], format='json')
+        self.assertEqual(res.status_code, 400)
+        res = self.apiclient.post(url, dict(ids='1,2'), format='json')
+        self.assertEqual(res.status_code, 400)
+
+        _obj.delete()
+
+    @transaction.atomic()
+    def test_api_bulk_view(self):
+        ''' Testing webshops.apis.ProductViewSet bulk view'''
+        url = reverse('webshops:api_product-bulk')
+        _obj = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category)
+        _category = webshops.factories.CategoryFactory.create(webshop=self.webshop)
+        _missing = _obj.pk + 1000
+        ids = [self.object.pk, _obj.pk, _missing]
+
+        res = self.apiclient.post(
+            url, dict(ids=ids, operation='deactivate'), format='json')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.content)
+        self.assertEqual(data['updated'], 2)
+        self.assertEqual(data['missing'], [_missing])
+        self.assertFalse(self.obj_model.objects.filter(pk__in=ids, active=True).exists())
+
+        res = self.apiclient.post(url, dict(
+            ids=ids, operation='set_category', category=_category.pk), format='json')
+        self.assertEqual(json.loads(res.content)['updated'], 2)
+        self.assertEqual(
+            self.obj_model.objects.filter(category=_category).count(), 2)
+
+        res = self.apiclient.post(url, dict(ids=ids, operation='set_featured'), format='json')
+        self.assertEqual(res.status_code, 400)
+
+        res = self.apiclient.post(url, dict(ids=ids, operation='delete'), format='json')
+        self.assertEqual(json.loads(res.content)['updated'], 2)
+        self.assertFalse(self.obj_model.objects.filter(pk__in=ids).exists())
+
+
+class WebshopAPITestCase(APIBaseTestCase):
+
+    def setUp(self):
+        super(WebshopAPITestCase, self).setUp()
+        self.webshop = webshops.factories.WebshopFactory.create()
+        self.category = webshops.factories.CategoryFactory.create(webshop=self.webshop)
+        self.product = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category, featured=True)
+
+    @transaction.atomic()
+    def test_api_home_view(self):
+        ''' Testing webshops.apis.WebshopViewSet home view'''
+        url = reverse('webshops:api_webshop-home', kwargs=dict(pk=self.webshop.pk))
+        # inactive categories are neither in the tree nor counted
+        webshops.factories.CategoryFactory.create(webshop=self.webshop, active=False)
+        res = self.apiclient.get(url)
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.content)
+        self.assertEqual(data['webshop']['id'], self.webshop.pk)
+        self.assertEqual([_obj['id'] for _obj in data['featured']], [self.product.pk])
+        self.assertEqual(data['num_products'], 1)
+        self.assertEqual(data['num_categories'], 1)
+
+        res = self.apiclient.get(url, HTTP_X_WEBSHOP='0')
+        self.assertEqual(res.status_code, 404)
+
+    @transaction.atomic()
+    def test_api_home_view_cache(self):
+        ''' Testing webshops.apis.WebshopViewSet home view caching'''
+        child = webshops.factories.CategoryFactory.create(
+            webshop=self.webshop, parent=self.category)
+        url = reverse('webshops:api_webshop-home', kwargs=dict(pk=self.webshop.pk))
+        data = json.loads(self.apiclient.get(url).content)
+        self.assertEqual(data['categories'], [dict(
+            id=self.category.pk, name=self.category.name, children=[
+                dict(id=child.pk, name=child.name, children=[])])])
+
+        # set-based writes without signals are served from the cache
+        webshops.models.Product.objects.filter(pk=self.product.pk).update(name='Renamed')
+        data = json.loads(self.apiclient.get(url).content)
+        self.assertNotEqual(data['featured'][0]['name'], 'Renamed')
+
+        self.product.refresh_from_db()
+        self.product.save()
+        data = json.loads(self.apiclient.get(url).content)
+        self.assertEqual(data['featured'][0]['name'], 'Renamed')
+
+
 class OrderAPITestCase(APIBaseTestCase):
 
     def setUp(self):
@@ -289,6 +456,65 @@ class OrderAPITestCase(APIBaseTestCase):
 
         res = self.apiclient.logout()
 
+    @transaction.atomic()
+    def test_api_list_view_date_range(self):
+        ''' Testing webshops.apis.OrderViewSet list view date range filter'''
+        url = reverse('webshops:api_order-list')
+        _date = self.object.date
+        res = self.apiclient.get(url, {
+            'date__gte': _date.isoformat(),
+            'date__lt': (_date + datetime.timedelta(days=1)).isoformat()})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([_obj['id'] for _obj in json.loads(res.content)], [self.object.pk])
+
+        res = self.apiclient.get(url, {'date__lt': _date.isoformat()})
+        self.assertEqual(json.loads(res.content), [])
+
+    @transaction.atomic()
+    def test_api_history_view(self):
+        ''' Testing webshops.apis.OrderViewSet history view'''
+        url = reverse('webshops:api_order-history')
+        res = self.apiclient.get(url)
+        self.assertEqual(res.status_code, 403)
+
+        _orders = [self.object] + [
+            webshops.factories.OrderFactory.create(customer=self.user)
+            for _ in range(2)]
+        for _order in _orders:
+            webshops.factories.OrderProductFactory.create_batch(2, order=_order)
+        _foreign = webshops.factories.OrderFactory.create()
+
+        self.assertTrue(self.apiclient.login(
+            username=self.user.username, password=self.user_password))
+        # orders of other customers are only shown to staff
+        res = self.apiclient.get('{}?customer={}'.format(url, _foreign.customer_id))
+        self.assertEqual(res.status_code, 403)
+        res = self.apiclient.get('{}?customer=x'.format(url))
+        self.assertEqual(res.status_code, 400)
+
+        url = '{}?page_size=2'.format(url)
+        res = self.apiclient.get(url)
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.content)
+        self.assertEqual(
+            [_obj['id'] for _obj in data['results']],
+            [_orders[2].pk, _orders[1].pk])
+        self.assertEqual(len(data['results'][0]['lines']), 2)
+
+        # the session, its user, the orders page and their lines
+        with self.assertNumQueries(4):
+            res = self.apiclient.get(data['next'])
+        data = json.loads(res.content)
+        self.assertEqual([_obj['id'] for _obj in data['results']], [self.object.pk])
+        self.assertIsNone(data['next'])
+
+        self.user.is_staff = True
+        self.user.save()
+        res = self.apiclient.get('{}&customer={}'.format(url, _foreign.customer_id))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [_obj['id'] for _obj in json.loads(res.content)['results']], [_foreign.pk])
+
     @transaction.atomic()
     def test_api_create_view(self):
         ''' Testing webshops.apis.OrderViewSet create view'''
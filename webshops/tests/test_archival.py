@@ -0,0 +1,100 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import datetime
+
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from simpleAPI.testtools import BaseTest
+
+import webshops.archival
+import webshops.factories
+import webshops.models
+
+__author__ = 'smirnov.ev'
+
+
+class PurgeDeletedTestCase(BaseTest):
+
+    def setUp(self):
+        self.webshop = webshops.factories.WebshopFactory.create()
+        self.long_ago = timezone.now() - datetime.timedelta(days=100)
+
+    def _create_deleted_product(self, **kwargs):
+        _obj = webshops.factories.ProductFactory.create(webshop=self.webshop, **kwargs)
+        webshops.models.Product.objects.with_deleted().filter(
+            pk=_obj.pk).update(deleted_at=self.long_ago)
+        return _obj
+
+    @transaction.atomic()
+    def test_purge_deleted(self):
+        """ Testing webshops.archival.purge_deleted function """
+        _model = webshops.models.Product
+        _recent = webshops.factories.ProductFactory.create(webshop=self.webshop)
+        _recent.delete()
+        _purged = self._create_deleted_product()
+        _ordered = self._create_deleted_product()
+        _line = webshops.factories.OrderProductFactory.create(product=_ordered)
+        webshops.models.Order.objects.filter(
+            pk=_line.order_id).update(deleted_at=self.long_ago)
+
+        stats = webshops.archival.purge_deleted(90, batch_size=1)
+        self.assertEqual(
+            [(name, rows) for name, rows, _ in stats],
+            [('webshops.product', 1), ('webshops.category', 0), ('webshops.order', 1)])
+
+        _qs = _model.objects.with_deleted()
+        self.assertFalse(_qs.filter(pk=_purged.pk).exists())
+        self.assertTrue(_qs.filter(pk=_recent.pk).exists())
+        # referenced by an order line when the products were purged
+        self.assertTrue(_qs.filter(pk=_ordered.pk).exists())
+        self.assertFalse(webshops.models.OrderProduct.objects.filter(pk=_line.pk).exists())
+
+        _archived = webshops.models.ArchivedObject.objects.get(
+            model='webshops.product', object_id=_purged.pk)
+        self.assertEqual(_archived.webshop_id, self.webshop.pk)
+        _archived = webshops.models.ArchivedObject.objects.get(
+            model='webshops.order', object_id=_line.order_id)
+        self.assertTrue('webshops.orderproduct' in _archived.data)
+
+    @transaction.atomic()
+    def test_purge_children_before_parents(self):
+        """ Testing webshops.archival.purge_deleted with parent products """
+        _parent = self._create_deleted_product(structure=webshops.models.Product.PARENT)
+        self._create_deleted_product(parent=_parent, category=None)
+
+        stats = webshops.archival.purge_deleted(90, archive=False)
+        self.assertEqual(stats[0][1], 2)
+        self.assertFalse(webshops.models.ArchivedObject.objects.exists())
+
+    @transaction.atomic()
+    def test_purge_categories(self):
+        """ Testing webshops.archival.purge_deleted with deleted categories """
+        _model = webshops.models.Category
+        _category = webshops.factories.CategoryFactory.create(webshop=self.webshop)
+        _sub = webshops.factories.CategoryFactory.create(
+            webshop=self.webshop, parent=_category)
+        _kept = webshops.factories.CategoryFactory.create(webshop=self.webshop)
+        self._create_deleted_product(category=_sub)
+        self._create_deleted_product(category=_kept)
+        webshops.factories.PromotionFactory.create(webshop=self.webshop, category=_kept)
+        _model.objects.with_deleted().filter(
+            pk__in=(_category.pk, _sub.pk, _kept.pk)).update(deleted_at=self.long_ago)
+
+        stats = webshops.archival.purge_deleted(90)
+        self.assertEqual(stats[1][:2], ('webshops.category', 2))
+        self.assertEqual(
+            list(_model.objects.with_deleted().filter(webshop=self.webshop)), [_kept])
+        self.assertEqual(webshops.models.ArchivedObject.objects.filter(
+            model='webshops.category').count(), 2)
+
+    @transaction.atomic()
+    def test_purge_deleted_command(self):
+        """ Testing purge_deleted management command """
+        self._create_deleted_product()
+        out = StringIO()
+        call_command('purge_deleted', days=90, stdout=out)
+        self.assertTrue('webshops.product: 1 rows' in out.getvalue())
@@ -0,0 +1,95 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import json
+import threading
+import time
+
+import mock
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import override_settings
+
+from rest_framework.test import APIClient
+
+import webshops.concurrency
+import webshops.factories
+import webshops.tenancy
+
+__author__ = 'smirnov.ev'
+
+
+@override_settings(WEBSHOPS_FANOUT_WORKERS=2)
+@mock.patch('webshops.concurrency._shares_database', mock.Mock(return_value=True))
+class FanOutTestCase(SimpleTestCase):
+    """ the calls don't touch the database, so the pool runs on in-memory SQLite """
+
+    def test_fan_out(self):
+        """ Testing webshops.concurrency.fan_out function """
+        threads = set()
+
+        def _current():
+            threads.add(threading.current_thread().ident)
+            return webshops.tenancy.get_current_webshop_id()
+
+        with webshops.tenancy.scoped(7):
+            result = webshops.concurrency.fan_out(a=_current, b=_current, c=lambda: 1)
+        self.assertEqual(result, {'a': 7, 'b': 7, 'c': 1})
+        self.assertFalse(threading.current_thread().ident in threads)
+
+    @override_settings(WEBSHOPS_FANOUT_TIMEOUT=0.05)
+    def test_fan_out_timeout(self):
+        """ Testing webshops.concurrency.fan_out function timeout """
+        with self.assertRaises(webshops.concurrency.FanOutTimeout) as error:
+            webshops.concurrency.fan_out(a=lambda: 1, slow=lambda: time.sleep(0.5))
+        self.assertEqual('{}'.format(error.exception), 'slow')
+
+    @override_settings(WEBSHOPS_FANOUT_WORKERS=0)
+    def test_fan_out_sequential(self):
+        """ Testing webshops.concurrency.fan_out function without workers """
+        result = webshops.concurrency.fan_out(
+            a=lambda: threading.current_thread().ident, b=lambda: 2)
+        self.assertEqual(result, {'a': threading.current_thread().ident, 'b': 2})
+
+    def test_fan_out_in_memory_database(self):
+        """ Testing webshops.concurrency.fan_out function on in-memory SQLite """
+        with mock.patch('webshops.concurrency._shares_database', return_value=False):
+            result = webshops.concurrency.fan_out(
+                a=lambda: threading.current_thread().ident, b=lambda: 2)
+        self.assertEqual(result, {'a': threading.current_thread().ident, 'b': 2})
+
+
+@override_settings(WEBSHOPS_FANOUT_WORKERS=2)
+class HomeFanOutTestCase(TransactionTestCase):
+    """
+        committed rows, so the worker threads' connections can read them
+        (the reads run in the test thread on an in-memory SQLite database)
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.webshop = webshops.factories.WebshopFactory.create()
+        self.category = webshops.factories.CategoryFactory.create(webshop=self.webshop)
+        self.product = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category, featured=True)
+        self.url = reverse('webshops:api_webshop-home', kwargs=dict(pk=self.webshop.pk))
+
+    def test_api_home_view(self):
+        """ Testing webshops.apis.WebshopViewSet home view """
+        res = APIClient().get(self.url)
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.content)
+        self.assertEqual([_obj['id'] for _obj in data['featured']], [self.product.pk])
+        self.assertEqual(data['num_products'], 1)
+        self.assertEqual(data['num_categories'], 1)
+
+    def test_api_home_view_timeout(self):
+        """ Testing webshops.apis.WebshopViewSet home view when reads time out """
+        with mock.patch(
+                'webshops.concurrency.fan_out',
+                side_effect=webshops.concurrency.FanOutTimeout('featured')):
+            res = APIClient().get(self.url)
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], '5')
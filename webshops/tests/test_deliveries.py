@@ -0,0 +1,132 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import datetime
+import smtplib
+
+import mock
+
+from django.conf import settings
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from simpleAPI.testtools import BaseTest
+
+import webshops.deliveries
+import webshops.tasks
+from webshops.models import EmailDelivery
+
+__author__ = 'smirnov.ev'
+
+
+def _failing(times):
+    """ locmem send_messages failing the first N calls """
+    _send_messages = EmailBackend.send_messages
+    calls = []
+
+    def send_messages(backend, messages):
+        calls.append(1)
+        if len(calls) <= times:
+            raise smtplib.SMTPServerDisconnected('gone')
+        return _send_messages(backend, messages)
+    return send_messages
+
+
+def _send(key='order:1:paid', **kwargs):
+    return webshops.tasks.send_email.apply(
+        args=('Subject', 'Text', ['customer@example.com']),
+        kwargs=dict(idempotency_key=key, **kwargs))
+
+
+class DeliveriesTestCase(BaseTest):
+
+    @transaction.atomic()
+    def test_idempotency(self):
+        """ Testing webshops.tasks.send_email idempotency key """
+        _send()
+        _send()
+        self.assertEqual(len(mail.outbox), 1)
+        delivery = EmailDelivery.objects.get(key='order:1:paid')
+        self.assertEqual(delivery.status, EmailDelivery.SENT)
+        self.assertEqual(delivery.attempts, 1)
+
+        _send(key='order:1:shipped')
+        self.assertEqual(len(mail.outbox), 2)
+
+    @transaction.atomic()
+    def test_retry(self):
+        """ Testing webshops.tasks.send_email retries """
+        with mock.patch.object(EmailBackend, 'send_messages', _failing(2)):
+            _send()
+        self.assertEqual(len(mail.outbox), 1)
+        delivery = EmailDelivery.objects.get(key='order:1:paid')
+        self.assertEqual(delivery.status, EmailDelivery.SENT)
+        self.assertEqual(delivery.attempts, 3)
+
+    @transaction.atomic()
+    @override_settings(WEBSHOPS_EMAIL_MAX_RETRIES=1)
+    def test_dead_letter_replay(self):
+        """ Testing webshops.tasks.send_email dead letters and replay_emails command """
+        with mock.patch.object(EmailBackend, 'send_messages', _failing(10)):
+            _send()
+        self.assertEqual(len(mail.outbox), 0)
+        delivery = EmailDelivery.objects.get(key='order:1:paid')
+        self.assertEqual(delivery.status, EmailDelivery.FAILED)
+        self.assertEqual(delivery.attempts, 2)
+        self.assertIn('gone', delivery.error)
+
+        with mock.patch('webshops.tasks.send_email.delay') as delay_mock:
+            delay_mock.side_effect = lambda *args, **kwargs: \
+                webshops.tasks.send_email.apply(args=args, kwargs=kwargs)
+            call_command('replay_emails')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['customer@example.com'])
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, EmailDelivery.SENT)
+
+    @transaction.atomic()
+    def test_unexpected_error(self):
+        """ Testing webshops.tasks.send_email errors which aren't transient """
+        with mock.patch.object(EmailBackend, 'send_messages', side_effect=ValueError('bad')):
+            result = _send()
+        self.assertIsInstance(result.result, ValueError)
+        delivery = EmailDelivery.objects.get(key='order:1:paid')
+        self.assertEqual(delivery.status, EmailDelivery.FAILED)
+        self.assertIn('bad', delivery.error)
+
+    @transaction.atomic()
+    @override_settings(WEBSHOPS_EMAIL_CONCURRENCY=2)
+    def test_concurrency(self):
+        """ Testing webshops.deliveries.claim concurrency cap """
+        _message = dict(subject='Subject', recipients='customer@example.com')
+        self.assertTrue(webshops.deliveries.claim('a', **_message))
+        self.assertTrue(webshops.deliveries.claim('b', **_message))
+        with self.assertRaises(webshops.deliveries.Busy):
+            webshops.deliveries.claim('c', **_message)
+
+        # deliveries of workers which died don't count
+        EmailDelivery.objects.filter(key='a').update(
+            modified_at=timezone.now() - datetime.timedelta(
+                seconds=settings.WEBSHOPS_EMAIL_SLOT_SECONDS + 1))
+        self.assertTrue(webshops.deliveries.claim('c', **_message))
+
+        # a claim racing with other workers is given back
+        EmailDelivery.objects.filter(key='b').update(status=EmailDelivery.SENT)
+        with mock.patch('webshops.deliveries.sending_count', side_effect=[0, 3]):
+            with self.assertRaises(webshops.deliveries.Busy):
+                webshops.deliveries.claim('d', **_message)
+        delivery = EmailDelivery.objects.get(key='d')
+        self.assertEqual(delivery.status, EmailDelivery.PENDING)
+        self.assertEqual(delivery.attempts, 0)
+
+    @override_settings(WEBSHOPS_EMAIL_RETRY_BASE_SECONDS=10,
+                       WEBSHOPS_EMAIL_RETRY_MAX_SECONDS=60)
+    def test_backoff(self):
+        """ Testing webshops.deliveries.backoff function """
+        self.assertTrue(10 <= webshops.deliveries.backoff(0) <= 11)
+        self.assertTrue(40 <= webshops.deliveries.backoff(2) <= 44)
+        self.assertTrue(60 <= webshops.deliveries.backoff(10) <= 66)
@@ -0,0 +1,88 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from django.core.management import call_command
+from django.db import transaction
+from django.utils.six import StringIO
+
+from simpleAPI.testtools import BaseTest
+
+import webshops.factories
+import webshops.integrity
+import webshops.models
+
+__author__ = 'smirnov.ev'
+
+
+class IntegrityTestCase(BaseTest):
+
+    def setUp(self):
+        self.model = webshops.models.Product
+        self.webshop = webshops.factories.WebshopFactory.create()
+        self.category = webshops.factories.CategoryFactory.create(webshop=self.webshop)
+
+    def _create(self, **kwargs):
+        """ product forced into the given state, bypassing save() """
+        _obj = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category)
+        self.model.objects.filter(pk=_obj.pk).update(**kwargs)
+        return _obj
+
+    def _counts(self):
+        return dict(
+            (_check, sum(_counts.values()))
+            for _check, _counts, _ in webshops.integrity.scan())
+
+    @transaction.atomic()
+    def test_scan_and_fix(self):
+        """ Testing webshops.integrity scan and fix functions """
+        _parent = self._create(structure=self.model.PARENT)
+        self._create(structure=self.model.CHILD, parent=_parent, category=None)
+        self._create(structure=self.model.CHILD, parent=None, category=None)
+        _standalone = self._create()
+        _child_with_category = self._create(
+            structure=self.model.CHILD, parent=_standalone)
+        _lonely_parent = self._create(structure=self.model.PARENT, pcs_in_stock=5)
+
+        counts = self._counts()
+        self.assertEqual(counts, {
+            webshops.integrity.CHILD_WITHOUT_PARENT: 1,
+            webshops.integrity.CHILD_OF_NON_PARENT: 1,
+            webshops.integrity.CHILD_WITH_CATEGORY: 1,
+            webshops.integrity.NON_CHILD_WITH_PARENT: 0,
+            webshops.integrity.STANDALONE_WITH_CHILDREN: 1,
+            webshops.integrity.PARENT_WITHOUT_CHILDREN: 1,
+            webshops.integrity.PARENT_WITH_STOCK: 1,
+        })
+
+        fixed = webshops.integrity.fix()
+        self.assertEqual(fixed[webshops.integrity.STANDALONE_WITH_CHILDREN], 1)
+        self.assertEqual(fixed[webshops.integrity.PARENT_WITHOUT_CHILDREN], 1)
+        self.assertEqual(fixed[webshops.integrity.CHILD_WITH_CATEGORY], 1)
+        # the lonely parent became a stand-alone product and keeps its stock
+        self.assertEqual(fixed[webshops.integrity.PARENT_WITH_STOCK], 0)
+
+        _standalone.refresh_from_db()
+        _child_with_category.refresh_from_db()
+        _lonely_parent.refresh_from_db()
+        self.assertTrue(_standalone.is_parent)
+        self.assertIsNone(_child_with_category.category_id)
+        self.assertTrue(_lonely_parent.is_standalone)
+        self.assertEqual(_lonely_parent.pcs_in_stock, 5)
+
+        counts = self._counts()
+        self.assertEqual(counts[webshops.integrity.CHILD_WITHOUT_PARENT], 1)
+        self.assertEqual(sum(counts.values()), 1)
+
+    @transaction.atomic()
+    def test_check_product_structure_command(self):
+        """ Testing check_product_structure command """
+        _parent = self._create(structure=self.model.PARENT, pcs_in_stock=3)
+        self._create(structure=self.model.CHILD, parent=_parent, category=None)
+
+        out = StringIO()
+        call_command('check_product_structure', '--fix', stdout=out)
+        self.assertIn('parent_with_stock: 1 products in 1 webshops', out.getvalue())
+        self.assertIn('fixed parent_with_stock: 1 products', out.getvalue())
+        _parent.refresh_from_db()
+        self.assertIsNone(_parent.pcs_in_stock)
@@ -0,0 +1,152 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import json
+import mock
+
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.test.utils import override_settings
+
+from rest_framework.test import APIClient
+
+from simpleAPI.testtools import BaseTest
+
+import webshops.factories
+import webshops.inventory
+import webshops.models
+import webshops.tasks
+
+__author__ = 'smirnov.ev'
+
+
+class ApplyStockUpdatesTestCase(BaseTest):
+
+    def setUp(self):
+        self.obj_model = webshops.models.Product
+        self.webshop = webshops.factories.WebshopFactory.create()
+        self.product1 = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, pcs_in_stock=5, barcode='0001')
+        self.product2 = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, pcs_in_stock=5)
+
+    def _parse(self, *items):
+        return [webshops.inventory.parse_item(_item) for _item in items]
+
+    def test_parse_item(self):
+        """ Testing webshops.inventory.parse_item function """
+        for item in ({}, {'id': 1}, {'id': 1, 'barcode': 'a', 'qty': 1},
+                     {'id': 1, 'qty': 1, 'delta': 1}, {'id': 1, 'qty': -1},
+                     {'id': 1, 'qty': 1, 'version': 'yesterday'}, []):
+            with self.assertRaises(ValueError):
+                webshops.inventory.parse_item(item)
+
+    @transaction.atomic()
+    def test_apply_stock_updates(self):
+        """ Testing webshops.inventory.apply_stock_updates function """
+        updated, conflicts = webshops.inventory.apply_stock_updates(self._parse(
+            {'barcode': '0001', 'qty': 10},
+            {'id': self.product2.pk, 'delta': -2},
+            {'id': self.product2.pk, 'delta': 1},
+            {'barcode': 'missing', 'qty': 1},
+        ))
+        self.assertEqual(updated, set([self.product1.pk, self.product2.pk]))
+        self.assertEqual(
+            [(_c['index'], _c['reason']) for _c in conflicts],
+            [(2, webshops.inventory.DUPLICATE), (3, webshops.inventory.NOT_FOUND)])
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product1.pcs_in_stock, 10)
+        self.assertEqual(self.product2.pcs_in_stock, 3)
+
+        updated, conflicts = webshops.inventory.apply_stock_updates(self._parse(
+            {'id': self.product2.pk, 'delta': -4}))
+        self.assertEqual(updated, set())
+        self.assertEqual(conflicts[0]['reason'], webshops.inventory.INSUFFICIENT)
+
+    @transaction.atomic()
+    def test_apply_stock_updates_race(self):
+        """ Testing webshops.inventory.apply_stock_updates with stock taken concurrently """
+        _stock_after = webshops.inventory._stock_after
+
+        def _racing(delta):
+            # another writer between the stock check and the guarded UPDATE
+            self.obj_model.objects.filter(pk=self.product2.pk).update(pcs_in_stock=1)
+            return _stock_after(delta)
+
+        with mock.patch('webshops.inventory._stock_after', side_effect=_racing):
+            updated, conflicts = webshops.inventory.apply_stock_updates(self._parse(
+                {'id': self.product1.pk, 'delta': -2},
+                {'id': self.product2.pk, 'delta': -2}))
+        self.assertEqual(updated, set([self.product1.pk]))
+        self.assertEqual(
+            [(_c['index'], _c['id'], _c['reason']) for _c in conflicts],
+            [(1, self.product2.pk, webshops.inventory.INSUFFICIENT)])
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product2.pcs_in_stock, 1)
+
+    @transaction.atomic()
+    def test_apply_stock_updates_version(self):
+        """ Testing webshops.inventory.apply_stock_updates with versions """
+        _version = self.product1.modified_at.isoformat()
+        updated, conflicts = webshops.inventory.apply_stock_updates(self._parse(
+            {'id': self.product1.pk, 'qty': 1, 'version': _version}))
+        self.assertEqual(updated, set([self.product1.pk]))
+        self.assertEqual(conflicts, [])
+
+        # the first update bumped modified_at
+        updated, conflicts = webshops.inventory.apply_stock_updates(self._parse(
+            {'id': self.product1.pk, 'qty': 2, 'version': _version}))
+        self.assertEqual(updated, set())
+        self.assertEqual(conflicts[0]['reason'], webshops.inventory.VERSION)
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.pcs_in_stock, 1)
+
+    @transaction.atomic()
+    def test_api_inventory_view(self):
+        """ Testing webshops.apis.ProductViewSet inventory view """
+        url = reverse('webshops:api_product-inventory')
+        apiclient = APIClient()
+        for item in ({'id': self.product1.pk}, {'barcode': ['a'], 'qty': 1},
+                     {'id': self.product1.pk, 'qty': [1]},
+                     {'id': self.product1.pk, 'delta': {}}, ['a']):
+            res = apiclient.post(url, {'items': [item]}, format='json')
+            self.assertEqual(res.status_code, 400)
+
+        res = apiclient.post(
+            url, {'items': [{'id': self.product1.pk, 'delta': 3}]}, format='json')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.content)
+        self.assertEqual(data, {'updated': 1, 'conflicts': []})
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.pcs_in_stock, 8)
+
+
+class LowStockDigestTestCase(BaseTest):
+
+    def setUp(self):
+        self.webshop = webshops.factories.WebshopFactory.create()
+        self.product = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, pcs_in_stock=5, reorder_threshold=3)
+
+    @transaction.atomic()
+    def test_low_stock_after_bulk_update(self):
+        """ Testing is_low_stock after webshops.inventory.apply_stock_updates """
+        self.assertFalse(self.product.is_low_stock)
+        webshops.inventory.apply_stock_updates(
+            [webshops.inventory.parse_item({'id': self.product.pk, 'delta': -3})])
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.is_low_stock)
+
+    @override_settings(WEBSHOPS_LOW_STOCK_RECIPIENTS=['stock@example.com'])
+    @transaction.atomic()
+    def test_send_low_stock_digest(self):
+        """ Testing webshops.tasks.send_low_stock_digest task """
+        _low = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, pcs_in_stock=1, reorder_threshold=3)
+        with mock.patch('webshops.tasks.send_email.delay') as delay_mock:
+            webshops.tasks.send_low_stock_digest()
+        delay_mock.assert_called_once_with(
+            mock.ANY, mock.ANY, ['stock@example.com'])
+        self.assertTrue(_low.name in delay_mock.call_args[0][1])
+        self.assertFalse(self.product.name in delay_mock.call_args[0][1])
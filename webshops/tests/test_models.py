@@ -6,16 +6,20 @@ import mock
 import random
 import string
 
+from datetime import timedelta
 from decimal import Decimal
 from django.conf import settings
 from django.db import transaction
 from django.core.exceptions import ValidationError
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
 from django.utils.translation import ugettext_lazy as _
 
 from simpleAPI.testtools import BaseTest
 # from webshop.models import Webshop
 
 import webshops.factories
+import webshops.models
 
 __author__ = 'smirnov.ev'
 
@@ -191,6 +195,41 @@ class CategoryModelTestCase(BaseTest):
         _product2.delete()
         _cat2.delete()
 
+    @transaction.atomic()
+    def test_delete_method(self):
+        """ Testing webshop.Category model delete method """
+        _cat2 = webshops.factories.CategoryFactory.create(
+            webshop=self.webshop, parent=self.category)
+        _parent = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=_cat2,
+            structure=webshops.models.Product.PARENT)
+        _child = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, parent=_parent, category=None,
+            structure=webshops.models.Product.CHILD)
+        _cat3 = webshops.factories.CategoryFactory.create(webshop=self.webshop)
+        _other = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=_cat3)
+
+        self.assertEqual(self.category.delete(), (4, {
+            'webshops.Category': 2, 'webshops.Product': 2}))
+        self.assertEqual(
+            list(self.obj_model.objects.filter(webshop=self.webshop)), [_cat3])
+        _deleted = self.obj_model.objects.with_deleted().filter(
+            pk__in=(self.category.pk, _cat2.pk), deleted_at__isnull=False)
+        self.assertEqual(_deleted.count(), 2)
+        self.assertEqual(
+            list(webshops.models.Product.objects.filter(webshop=self.webshop)),
+            [_other])
+        self.assertEqual(webshops.models.Product.objects.with_deleted().filter(
+            pk__in=(_parent.pk, _child.pk), deleted_at__isnull=False).count(), 2)
+
+        # deleted along with its webshop
+        _webshop = webshops.factories.WebshopFactory.create()
+        _obj = webshops.factories.CategoryFactory.create(webshop=_webshop)
+        _webshop.delete()
+        self.assertEqual(_obj.delete(), (0, {
+            'webshops.Category': 0, 'webshops.Product': 0}))
+
 
 class ProductModelTestCase(BaseTest):
     def setUp(self):
@@ -265,6 +304,35 @@ class ProductModelTestCase(BaseTest):
             [self.product]
         )
 
+    @transaction.atomic()
+    def test_with_display_values_queryset(self):
+        """ Testing webshop.Product model with_display_values queryset method """
+        _parent = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category, price=None,
+            pcs_in_stock=7, structure=self.obj_model.PARENT)
+        _child1 = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=None, parent=_parent, price=Decimal('5.00'),
+            pcs_in_stock=1, structure=self.obj_model.CHILD)
+        webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=None, parent=_parent, price=Decimal('3.00'),
+            structure=self.obj_model.CHILD, active=False)
+        webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=None, parent=_parent, price=Decimal('4.00'),
+            structure=self.obj_model.CHILD)
+
+        _objs = self.obj_model.objects.with_display_values().in_bulk(
+            [_parent.pk, _child1.pk, self.product.pk])
+        self.assertEqual(_objs[_parent.pk].showing_price, Decimal('4.00'))
+        self.assertEqual(_objs[_parent.pk].effective_stock, 7)
+        self.assertEqual(_objs[_child1.pk].effective_price, _child1.get_price())
+        self.assertEqual(_objs[_child1.pk].showing_price, Decimal('5.00'))
+        self.assertEqual(_objs[_child1.pk].effective_stock, 7)
+        # the stored price, setUp assigns a float based Decimal
+        self.product.refresh_from_db()
+        self.assertEqual(_objs[self.product.pk].showing_price, self.product.get_price())
+        self.assertEqual(
+            _objs[self.product.pk].effective_stock, self.product.pcs_in_stock)
+
     @transaction.atomic()
     def test_str_method(self):
         """ Testing webshop.Product model __str__ method """
@@ -415,6 +483,7 @@ class ProductModelTestCase(BaseTest):
         _obj_child.delete()
         _obj.delete()
 
+    @override_settings(WEBSHOPS_SYNC_CASCADES=True)
     @transaction.atomic()
     def test_save_method(self):
         """ Testing webshop.Product model save method """
@@ -444,6 +513,135 @@ class ProductModelTestCase(BaseTest):
 
         _obj.delete()
 
+    @transaction.atomic()
+    def test_save_method_queues_cascade(self):
+        """ Testing webshop.Product model save method with async cascades """
+        _obj = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category, name='Parent Name')
+        _obj_child = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, name='Child Name', parent=_obj)
+
+        with mock.patch('webshops.tasks.propagate_product_name.delay') as delay_mock, \
+                mock.patch('django.db.transaction.on_commit', side_effect=lambda f: f()):
+            _obj.name = 'New Name'
+            _obj.save()
+            _obj.name = 'Newer Name'
+            _obj.save()
+        # one task per commit, coalesced when they run
+        self.assertEqual(
+            [_call[0] for _call in delay_mock.call_args_list],
+            [(_obj.pk, 1), (_obj.pk, 2)])
+
+        _obj_child.refresh_from_db()
+        self.assertEqual(_obj_child.name, 'Child Name')
+        self.assertTrue(webshops.models.start_cascade('propagate_product_name', _obj.pk, 1))
+        self.assertEqual(self.obj_model.propagate_name(_obj.pk), 1)
+        self.assertFalse(webshops.models.start_cascade('propagate_product_name', _obj.pk, 2))
+        _obj_child.refresh_from_db()
+        self.assertEqual(_obj_child.name, 'Newer Name')
+
+        # a cascade requested after the run started still runs
+        with mock.patch('webshops.tasks.propagate_product_name.delay') as delay_mock, \
+                mock.patch('django.db.transaction.on_commit', side_effect=lambda f: f()):
+            _obj.name = 'Newest Name'
+            _obj.save()
+        delay_mock.assert_called_once_with(_obj.pk, 3)
+        self.assertTrue(webshops.models.start_cascade('propagate_product_name', _obj.pk, 3))
+
+    @transaction.atomic()
+    def test_update_structure_method(self):
+        """ Testing webshop.Product model update_structure method """
+        _obj = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category,
+            structure=self.obj_model.PARENT)
+        _obj_child = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, parent=_obj, structure=self.obj_model.CHILD)
+        self.assertEqual(self.obj_model.update_structure(_obj.pk), 0)
+
+        with override_settings(WEBSHOPS_SYNC_CASCADES=True):
+            _obj_child.delete()
+        _obj.refresh_from_db()
+        self.assertTrue(_obj.is_standalone)
+
+    @transaction.atomic()
+    def test_soft_delete_queryset(self):
+        """ Testing webshop.Product queryset soft_delete method """
+        _parent = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category,
+            structure=self.obj_model.PARENT)
+        _other = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category,
+            structure=self.obj_model.PARENT)
+        _children = [
+            webshops.factories.ProductFactory.create(
+                webshop=self.webshop, parent=_parent_obj, category=None,
+                structure=self.obj_model.CHILD)
+            for _parent_obj in (_parent, _parent, _other, _other)]
+
+        with self.assertNumQueries(5):
+            updated = self.obj_model.objects.filter(
+                pk__in=[_children[0].pk, _children[1].pk, _children[2].pk]
+            ).soft_delete()
+        self.assertEqual(updated, 3)
+        self.assertEqual(self.obj_model.objects.filter(parent=_parent).count(), 0)
+        _parent.refresh_from_db()
+        _other.refresh_from_db()
+        self.assertTrue(_parent.is_standalone)
+        self.assertTrue(_other.is_parent)
+        self.assertEqual(
+            self.obj_model.objects.filter(pk__in=[_children[0].pk]).soft_delete(), 0)
+
+    @transaction.atomic()
+    def test_delete_method(self):
+        """ Testing webshop.Product model delete method """
+        _obj = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category)
+        _modified_at = _obj.modified_at
+        _obj.delete()
+
+        self.assertIsNone(self.obj_model.objects.filter(pk=_obj.pk).last())
+        _obj = self.obj_model.objects.with_deleted().get(pk=_obj.pk)
+        self.assertIsNotNone(_obj.deleted_at)
+        self.assertTrue(_obj.modified_at > _modified_at)
+        self.assertEqual(
+            list(self.obj_model.objects.with_deleted().changed_since(
+                _modified_at, _obj.pk)),
+            [_obj])
+
+    @transaction.atomic()
+    def test_low_stock(self):
+        """ Testing webshop.Product model is_low_stock maintenance """
+        _obj = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category, pcs_in_stock=3)
+        self.assertFalse(_obj.is_low_stock)
+
+        _obj.reorder_threshold = 5
+        _obj.save()
+        self.assertTrue(_obj.is_low_stock)
+
+        # category threshold is the default
+        _obj.reorder_threshold = None
+        _obj.save()
+        self.assertFalse(_obj.is_low_stock)
+        self.category.reorder_threshold = 4
+        self.category.save()
+        _obj.refresh_from_db()
+        self.assertTrue(_obj.is_low_stock)
+
+        self.obj_model.objects.filter(pk=_obj.pk).update(pcs_in_stock=10)
+        self.obj_model.refresh_low_stock([_obj.pk])
+        _obj.refresh_from_db()
+        self.assertFalse(_obj.is_low_stock)
+
+        # a child without its parent row uses its own category
+        _child = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category, pcs_in_stock=3,
+            structure=self.obj_model.CHILD)
+        self.assertTrue(_child.is_low_stock)
+
+        self.category.reorder_threshold = None
+        self.category.save()
+
     @transaction.atomic()
     def test_calculate_prices_method(self):
         """ Testing webshop.Product model calculate_prices method """
@@ -675,6 +873,31 @@ class ProductModelTestCase(BaseTest):
         self.product.vat = 0
         self.assertIsNone(self.product.vat_amount())
 
+    @transaction.atomic()
+    def test_get_pricing_method(self):
+        """ Testing webshop.Product model get_pricing method """
+        # the stored price, setUp passes a float based Decimal
+        self.product.refresh_from_db()
+        _pricing = self.product.get_pricing()
+        self.assertEqual(_pricing.price, Decimal('99.99'))
+        self.assertIs(self.product.get_pricing(), _pricing)
+        self.assertEqual(tuple(_pricing), (
+            self.product.get_price(), self.product.get_price_wtihout_vat(),
+            self.product.get_vat(), self.product.vat_amount()))
+
+        self.product.price = Decimal('21.20')
+        self.assertEqual(self.product.get_pricing().price_excl_vat, Decimal('20.00'))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.get_pricing(), _pricing)
+
+        _obj_child = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category, parent=self.product,
+            structure=self.obj_model.CHILD)
+        self.assertEqual(_obj_child.get_price(), self.product.price)
+        # changes of the parent instance are picked up
+        _obj_child.parent.vat = 21
+        self.assertEqual(_obj_child.get_vat(), 21)
+
     @transaction.atomic()
     def test_get_barcode_method(self):
         """ Testing webshop.Product model get_barcode method """
@@ -735,6 +958,16 @@ class OrderModelTestCase(BaseTest):
         self.customer.delete()
         self.assertEqual(self.obj_model.objects.count(), 1)
 
+    @transaction.atomic()
+    def test_placed_between_queryset(self):
+        """ Testing webshop.Order queryset placed_between method """
+        _date = self.object.date
+        _qs = self.obj_model.objects.filter(pk=self.object.pk)
+        self.assertEqual(_qs.placed_between(_date, _date + timedelta(days=1)).count(), 1)
+        self.assertEqual(_qs.placed_between(end=_date).count(), 0)
+        self.assertEqual(self.obj_model.objects.placed_between(
+            start=_date + timedelta(microseconds=1)).filter(pk=self.object.pk).count(), 0)
+
     @transaction.atomic()
     def test_save_method(self):
         """ Testing webshop.Order model save method """
@@ -829,3 +1062,29 @@ class OrderProductModelTestCase(BaseTest):
 
         _object.delete()
         _product.delete()
+
+
+class CascadeTestCase(TransactionTestCase):
+    """ needs real commits and rollbacks for transaction.on_commit """
+
+    def test_schedule_cascade_rollback(self):
+        """ Testing webshops.models.schedule_cascade after a rollback """
+        _model = webshops.models.CascadeCounter
+        with mock.patch('webshops.tasks.update_product_structure.delay') as delay_mock:
+            try:
+                with transaction.atomic():
+                    webshops.models.schedule_cascade('update_product_structure', 1)
+                    raise ValueError
+            except ValueError:
+                pass
+            self.assertFalse(delay_mock.called)
+            self.assertFalse(_model.objects.exists())
+
+            with transaction.atomic():
+                webshops.models.schedule_cascade('update_product_structure', 1)
+            delay_mock.assert_called_once_with(1, 1)
+
+        self.assertTrue(webshops.models.start_cascade('update_product_structure', 1, 1))
+        self.assertFalse(webshops.models.start_cascade('update_product_structure', 1, 1))
+        # tasks run without a token (replays, beat) are never skipped
+        self.assertTrue(webshops.models.start_cascade('update_product_structure', 1))
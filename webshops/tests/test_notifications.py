@@ -0,0 +1,71 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import mock
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.utils import dateformat, translation
+
+from simpleAPI.testtools import BaseTest
+
+import webshops.factories
+import webshops.notifications
+import webshops.tasks
+
+__author__ = 'smirnov.ev'
+
+
+class NotificationsTestCase(BaseTest):
+
+    def setUp(self):
+        self.webshop = webshops.factories.WebshopFactory.create(name='Shop')
+        self.order = webshops.factories.OrderFactory.create(
+            webshop=self.webshop, email='customer@example.com')
+
+    @transaction.atomic()
+    def test_render(self):
+        """ Testing webshops.notifications.render function """
+        subject, text_content, html_content = webshops.notifications.render(self.order)
+        self.assertEqual(subject, 'Order #{}'.format(self.order.pk))
+        self.assertIn('Order created', text_content)
+        self.assertIn('Thank you for shopping at Shop.', text_content)
+        self.assertIn('<p>Order created</p>', html_content)
+
+        self.order.paid = True
+        _, text_content, _ = webshops.notifications.render(self.order, title='Paid!')
+        self.assertIn('Order paid', text_content)
+        self.assertIn('Paid!', text_content)
+
+        self.order.paid, self.order.shipped = False, True
+        _, text_content, _ = webshops.notifications.render(self.order)
+        self.assertIn('Order shipped', text_content)
+
+    @transaction.atomic()
+    def test_render_cache_language(self):
+        """ Testing webshops.notifications.render footer cache per language """
+        cache.clear()
+
+        def _key(language):
+            return make_template_fragment_key('order_footer_txt', [
+                'created', language, self.webshop.pk,
+                dateformat.format(self.webshop.modified_at, 'U')])
+
+        with translation.override('de'):
+            webshops.notifications.render(self.order)
+        self.assertIsNotNone(cache.get(_key('de')))
+        self.assertIsNone(cache.get(_key('en')))
+
+    @transaction.atomic()
+    def test_send_status_emails_task(self):
+        """ Testing webshops.tasks.send_status_emails task """
+        _other = webshops.factories.OrderFactory.create(
+            webshop=self.webshop, email='other@example.com', paid=True)
+        with mock.patch('webshops.tasks.send_email.delay') as delay_mock:
+            sent = webshops.tasks.send_status_emails(
+                [self.order.pk, _other.pk], batch_size=1)
+        self.assertEqual(sent, 2)
+        self.assertEqual(
+            sorted(_call[0][2][0] for _call in delay_mock.call_args_list),
+            ['customer@example.com', 'other@example.com'])
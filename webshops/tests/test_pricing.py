@@ -0,0 +1,87 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import json
+
+from decimal import Decimal
+from django.core.urlresolvers import reverse
+from django.db import transaction
+
+from rest_framework.test import APIClient
+
+from simpleAPI.testtools import BaseTest
+
+import webshops.factories
+import webshops.models
+import webshops.pricing
+import webshops.promotions
+
+__author__ = 'smirnov.ev'
+
+
+class PriceCartTestCase(BaseTest):
+
+    def setUp(self):
+        self.webshop = webshops.factories.WebshopFactory.create()
+        self.product = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, price=Decimal('10.60'), vat=6)
+        self.parent = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, price=Decimal('12.10'), vat=21,
+            is_discountable=False, structure=webshops.models.Product.PARENT)
+        self.child = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, price=None, parent=self.parent, category=None,
+            structure=webshops.models.Product.CHILD)
+
+    def test_excl_vat(self):
+        """ Testing webshops.pricing.excl_vat function """
+        self.assertEqual(webshops.pricing.excl_vat(Decimal('1.3456'), 6), Decimal('1.27'))
+        self.assertEqual(
+            webshops.pricing.excl_vat(self.product.price, self.product.vat),
+            self.product.price_excl_vat)
+
+    @transaction.atomic()
+    def test_price_cart(self):
+        """ Testing webshops.pricing.price_cart function """
+        webshops.factories.PromotionFactory.create(
+            webshop=self.webshop, kind=webshops.models.Promotion.PERCENTAGE,
+            value=Decimal(10))
+        result = webshops.pricing.price_cart(
+            [(self.product.pk, 2), (self.child.pk, 1), (0, 1)],
+            get_promotions=webshops.promotions.get_promotions)
+
+        self.assertEqual(result['missing'], [0])
+        _line, _child_line = result['lines']
+        self.assertEqual(_line['unit_price'], Decimal('10.60'))
+        self.assertEqual(_line['discount'], Decimal('2.12'))
+        self.assertEqual(_line['total'], Decimal('19.08'))
+        self.assertEqual(_line['subtotal'], Decimal('18.00'))
+        self.assertEqual(_line['vat_amount'], Decimal('1.08'))
+
+        # child inherits price, VAT and is_discountable from the parent
+        self.assertEqual(_child_line['unit_price'], self.child.get_price())
+        self.assertEqual(_child_line['vat'], self.child.get_vat())
+        self.assertEqual(_child_line['discount'], Decimal('0.00'))
+        self.assertEqual(_child_line['subtotal'], Decimal('10.00'))
+
+        self.assertEqual(result['total'], Decimal('31.18'))
+        self.assertEqual(result['subtotal'], Decimal('28.00'))
+        self.assertEqual(result['vat'], Decimal('3.18'))
+        self.assertEqual(result['discount'], Decimal('2.12'))
+
+    @transaction.atomic()
+    def test_api_price_view(self):
+        """ Testing webshops.apis.CartViewSet price view """
+        url = reverse('webshops:api_cart-price')
+        apiclient = APIClient()
+        res = apiclient.post(url, {'lines': [{'product': self.product.pk}]}, format='json')
+        self.assertEqual(res.status_code, 400)
+
+        # discounts only come from the webshop's promotions
+        res = apiclient.post(url, {
+            'lines': [{'product': self.product.pk, 'quantity': 3}],
+            'discount_percent': 100}, format='json')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.content)
+        self.assertEqual(data['total'], '31.80')
+        self.assertEqual(data['lines'][0]['subtotal'], '30.00')
+        self.assertEqual(data['missing'], [])
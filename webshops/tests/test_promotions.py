@@ -0,0 +1,109 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import datetime
+
+from decimal import Decimal
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from simpleAPI.testtools import BaseTest
+
+import webshops.factories
+import webshops.models
+import webshops.pricing
+import webshops.promotions
+import webshops.serializers
+
+__author__ = 'smirnov.ev'
+
+
+class PromotionsTestCase(BaseTest):
+
+    def setUp(self):
+        self.obj_model = webshops.models.Promotion
+        self.webshop = webshops.factories.WebshopFactory.create()
+        self.category = webshops.factories.CategoryFactory.create(webshop=self.webshop)
+        self.subcategory = webshops.factories.CategoryFactory.create(
+            webshop=self.webshop, parent=self.category)
+        self.product = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.subcategory, price=Decimal('20.00'))
+
+    @transaction.atomic()
+    def test_get_discount_price(self):
+        """ Testing webshops.promotions.get_discount_price function """
+        self.assertIsNone(webshops.promotions.get_discount_price(self.product))
+
+        # category rules apply to the whole subtree
+        webshops.factories.PromotionFactory.create(
+            webshop=self.webshop, category=self.category,
+            kind=self.obj_model.PERCENTAGE, value=Decimal(10))
+        self.assertEqual(
+            webshops.promotions.get_discount_price(self.product), Decimal('18.00'))
+
+        _promotion = webshops.factories.PromotionFactory.create(
+            webshop=self.webshop, product=self.product,
+            kind=self.obj_model.FIXED, value=Decimal(5))
+        self.assertEqual(
+            webshops.promotions.get_discount_price(self.product), Decimal('15.00'))
+
+        # not started yet
+        _promotion.starts_at = timezone.now() + datetime.timedelta(days=1)
+        _promotion.save()
+        self.assertEqual(
+            webshops.promotions.get_discount_price(self.product), Decimal('18.00'))
+
+        self.product.is_discountable = False
+        self.assertIsNone(webshops.promotions.get_discount_price(self.product))
+
+        # a child without its parent row
+        self.product.is_discountable = True
+        self.product.structure = webshops.models.Product.CHILD
+        self.assertIsNone(webshops.promotions.get_discount_price(self.product))
+
+    @transaction.atomic()
+    def test_get_promotions_cache(self):
+        """ Testing webshops.promotions.get_promotions compiled cache """
+        _compiled = webshops.promotions.get_promotions(self.webshop.pk)
+        self.assertTrue(webshops.promotions.get_promotions(self.webshop.pk) is _compiled)
+
+        webshops.factories.PromotionFactory.create(webshop=self.webshop)
+        _recompiled = webshops.promotions.get_promotions(self.webshop.pk)
+        self.assertFalse(_recompiled is _compiled)
+        self.assertEqual(len(_recompiled.shop_wide), 1)
+
+    @transaction.atomic()
+    @override_settings(WEBSHOPS_PROMOTIONS_CHECK_SECONDS=0)
+    def test_get_promotions_other_process(self):
+        """ Testing webshops.promotions.get_promotions with changes of other processes """
+        _compiled = webshops.promotions.get_promotions(self.webshop.pk)
+        # no signals, like a save in another process
+        self.obj_model.objects.bulk_create([self.obj_model(
+            webshop=self.webshop, name='Sale', kind=self.obj_model.PERCENTAGE,
+            value=Decimal(10))])
+        _recompiled = webshops.promotions.get_promotions(self.webshop.pk)
+        self.assertFalse(_recompiled is _compiled)
+        self.assertEqual(len(_recompiled.shop_wide), 1)
+
+    @transaction.atomic()
+    def test_buy_x_get_y(self):
+        """ Testing webshops.promotions buy X get Y rule in cart pricing """
+        webshops.factories.PromotionFactory.create(
+            webshop=self.webshop, product=self.product,
+            kind=self.obj_model.BUY_X_GET_Y, buy_quantity=2, get_quantity=1)
+        self.assertIsNone(webshops.promotions.get_discount_price(self.product))
+
+        result = webshops.pricing.price_cart(
+            [(self.product.pk, 7)],
+            get_promotions=webshops.promotions.get_promotions)
+        self.assertEqual(result['discount'], Decimal('40.00'))
+        self.assertEqual(result['total'], Decimal('100.00'))
+
+    @transaction.atomic()
+    def test_serializer_discount_price(self):
+        """ Testing webshops.serializers.ProductSerializer discount_price field """
+        webshops.factories.PromotionFactory.create(
+            webshop=self.webshop, kind=self.obj_model.PERCENTAGE, value=Decimal(25))
+        data = webshops.serializers.ProductSerializer(self.product).data
+        self.assertEqual(data['discount_price'], '15.00')
@@ -0,0 +1,159 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase
+from django.test.utils import override_settings
+
+import webshops.middleware
+import webshops.models
+import webshops.routers
+
+__author__ = 'smirnov.ev'
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTestCase(SimpleTestCase):
+    """ Not a BaseTest: inside its atomic block every read goes to the primary """
+
+    def setUp(self):
+        self.router = webshops.routers.PrimaryReplicaRouter()
+
+    def tearDown(self):
+        webshops.routers.reset()
+
+    def test_db_for_read(self):
+        """ Testing webshops.routers.PrimaryReplicaRouter db_for_read method """
+        # outside of requests everything goes to the primary
+        self.assertEqual(self.router.db_for_read(webshops.models.Product), 'default')
+
+        webshops.routers.allow_replica_reads(True)
+        for model in (webshops.models.Webshop, webshops.models.Category,
+                      webshops.models.Product):
+            self.assertEqual(self.router.db_for_read(model), 'replica')
+        for model in (webshops.models.Order, webshops.models.OrderProduct):
+            self.assertEqual(self.router.db_for_read(model), 'default')
+
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(webshops.models.Product), 'default')
+
+        # read-your-writes inside of the request
+        self.assertEqual(self.router.db_for_write(webshops.models.Product), 'default')
+        self.assertEqual(self.router.db_for_read(webshops.models.Product), 'default')
+        self.assertTrue(webshops.routers.reset())
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_db_for_read_without_replicas(self):
+        """ Testing webshops.routers.PrimaryReplicaRouter without replicas """
+        webshops.routers.allow_replica_reads(True)
+        self.assertEqual(self.router.db_for_read(webshops.models.Product), 'default')
+
+    def test_allow_migrate(self):
+        """ Testing webshops.routers.PrimaryReplicaRouter allow_migrate method """
+        self.assertFalse(self.router.allow_migrate('replica', 'webshops'))
+        self.assertIsNone(self.router.allow_migrate('default', 'webshops'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], PRIMARY_PIN_SECONDS=5)
+class PrimaryReplicaMiddlewareTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = webshops.routers.PrimaryReplicaRouter()
+        self.reads = []
+
+    def view(self, request):
+        self.reads.append(self.router.db_for_read(webshops.models.Product))
+        if request.method == 'POST':
+            self.router.db_for_write(webshops.models.Product)
+        return HttpResponse()
+
+    def test_call(self):
+        """ Testing webshops.middleware.PrimaryReplicaMiddleware """
+        middleware = webshops.middleware.PrimaryReplicaMiddleware(self.view)
+        cookie_name = middleware.cookie_name
+
+        response = middleware(self.factory.get('/'))
+        self.assertFalse(cookie_name in response.cookies)
+
+        response = middleware(self.factory.post('/'))
+        self.assertTrue(cookie_name in response.cookies)
+
+        request = self.factory.get('/')
+        request.COOKIES[cookie_name] = response.cookies[cookie_name].value
+        middleware(request)
+
+        request = self.factory.get('/')
+        request.COOKIES[cookie_name] = '{}'.format(time.time() - 1)
+        middleware(request)
+
+        self.assertEqual(self.reads, ['replica', 'default', 'default', 'replica'])
+
+
+class ReplicaReadsTestCase(TransactionTestCase):
+    """
+        Reads against a second SQLite database standing in for a replica
+        which lags behind the primary. Not a BaseTest: inside its atomic
+        block every read goes to the primary.
+    """
+    replica = 'replica_test'
+
+    @classmethod
+    def setUpClass(cls):
+        super(ReplicaReadsTestCase, cls).setUpClass()
+        cls.tmpdir = tempfile.mkdtemp()
+        connections.databases[cls.replica] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.tmpdir, 'replica.sqlite3'),
+        }
+        # run_syncdb creates the tables when migrations are disabled (--nomigrations)
+        call_command('migrate', database=cls.replica, run_syncdb=True, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[cls.replica].close()
+        del connections[cls.replica]
+        del connections.databases[cls.replica]
+        shutil.rmtree(cls.tmpdir)
+        super(ReplicaReadsTestCase, cls).tearDownClass()
+
+    def test_replica_reads(self):
+        """ Testing webshops.routers.PrimaryReplicaRouter with a replica database """
+        _model = webshops.models.Webshop
+        webshop = _model.objects.create(name='primary')
+        _model.objects.using(self.replica).create(
+            pk=webshop.pk, site_id=webshop.site_id, name='replica')
+        names = []
+
+        def view(request):
+            names.append(_model.objects.get(pk=webshop.pk).name)
+            if request.method == 'POST':
+                _model.objects.filter(pk=webshop.pk).update(name='written')
+            return HttpResponse()
+
+        middleware = webshops.middleware.PrimaryReplicaMiddleware(view)
+        factory = RequestFactory()
+        with self.settings(DATABASE_REPLICAS=[self.replica], PRIMARY_PIN_SECONDS=5):
+            middleware(factory.get('/'))
+            response = middleware(factory.post('/'))
+
+            # pinned to the primary after the write
+            request = factory.get('/')
+            request.COOKIES[middleware.cookie_name] = \
+                response.cookies[middleware.cookie_name].value
+            middleware(request)
+
+            middleware(factory.get('/'))
+
+        self.assertEqual(names, ['replica', 'primary', 'written', 'replica'])
+        self.assertEqual(
+            _model.objects.using(self.replica).get(pk=webshop.pk).name, 'replica')
@@ -119,6 +119,21 @@ class ProductSerializerTestCase(BaseTest):
             self.assertEqual(
                 serializer.errors[field], [_('This field is required.')])
 
+    @transaction.atomic()
+    def test_get_showing_price_method(self):
+        """ Testing webshops.serializers.ProductSerializer serializer get_showing_price method """
+        serializer = self.serializer_class()
+        self.assertEqual(
+            serializer.get_showing_price(self.object),
+            '{:.2f}'.format(self.object.get_price()))
+
+        _obj = self.obj_model.objects.with_display_values().get(pk=self.object.pk)
+        self.assertEqual(
+            serializer.get_showing_price(_obj), '{:.2f}'.format(self.object.get_price()))
+        self.assertEqual(
+            self.serializer_class(_obj).data['available_qty_in_stock'],
+            self.object.pcs_in_stock)
+
     @transaction.atomic()
     def test_get_available_qty_in_stock_method(self):
         """ Testing webshops.serializers.ProductSerializer serializer get_available_qty_in_stock method """
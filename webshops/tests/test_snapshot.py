@@ -0,0 +1,117 @@
+# coding: utf-8
+from __future__ import unicode_literals
+import json
+
+import mock
+
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.test.utils import override_settings
+
+from rest_framework.test import APIClient
+
+from simpleAPI.testtools import BaseTest
+
+import webshops.factories
+import webshops.models
+import webshops.snapshot
+
+__author__ = 'smirnov.ev'
+
+
+@override_settings(WEBSHOPS_SNAPSHOT_MAX_ROWS=100, WEBSHOPS_SNAPSHOT_REFRESH_SECONDS=0)
+class SnapshotTestCase(BaseTest):
+
+    def setUp(self):
+        webshops.snapshot.clear()
+        self.apiclient = APIClient()
+        self.webshop = webshops.factories.WebshopFactory.create()
+        self.category = webshops.factories.CategoryFactory.create(webshop=self.webshop)
+        self.parent = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category, price=None,
+            structure=webshops.factories.ProductFactory._meta.model.PARENT)
+        self.child = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=None, parent=self.parent,
+            structure=webshops.factories.ProductFactory._meta.model.CHILD)
+
+    def tearDown(self):
+        webshops.snapshot.clear()
+
+    def _get(self, url):
+        res = self.apiclient.get(url, HTTP_X_WEBSHOP='{}'.format(self.webshop.pk))
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.content)
+
+    def _compare(self, url):
+        """ the snapshot serves the same data as the ORM """
+        data = self._get(url)
+        with override_settings(WEBSHOPS_SNAPSHOT_MAX_ROWS=0):
+            self.assertEqual(data, self._get(url))
+
+    @transaction.atomic()
+    def test_api_views(self):
+        """ Testing webshops.snapshot served list and detail views """
+        # a child without its parent row
+        _orphan = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=self.category)
+        webshops.models.Product.objects.filter(pk=_orphan.pk).update(
+            structure=webshops.models.Product.CHILD)
+        self._compare(reverse('webshops:api_product-list'))
+        self._compare(reverse('webshops:api_product-detail', kwargs=dict(pk=self.parent.pk)))
+        self._compare(reverse('webshops:api_product-detail', kwargs=dict(pk=self.child.pk)))
+        self._compare(reverse('webshops:api_category-list'))
+        self._compare(reverse('webshops:api_category-list') + '?parent={}'.format(
+            self.category.pk))
+        self._compare(reverse('webshops:api_category-detail', kwargs=dict(pk=self.category.pk)))
+        self.assertTrue(webshops.snapshot.get_snapshot(self.webshop.pk))
+
+    @transaction.atomic()
+    def test_refresh(self):
+        """ Testing webshops.snapshot.CatalogSnapshot.refresh method """
+        catalog = webshops.snapshot.get_snapshot(self.webshop.pk)
+        self.assertEqual(len(catalog), 3)
+
+        self.child.price = 10
+        self.child.price_excl_vat = None
+        self.child.save()
+        catalog = webshops.snapshot.get_snapshot(self.webshop.pk)
+        _fields = catalog.product_fields
+        _parent = dict(zip(_fields, catalog.products[self.parent.pk].values))
+        self.assertEqual(_parent['showing_price'], '10.00')
+
+        self.child.delete()
+        catalog = webshops.snapshot.get_snapshot(self.webshop.pk)
+        self.assertEqual(sorted(catalog.products), [self.parent.pk])
+
+    @transaction.atomic()
+    def test_reconcile(self):
+        """ Testing webshops.snapshot.CatalogSnapshot.reconcile method """
+        category = webshops.factories.CategoryFactory.create(webshop=self.webshop)
+        product = webshops.factories.ProductFactory.create(
+            webshop=self.webshop, category=category)
+        catalog = webshops.snapshot.get_snapshot(self.webshop.pk)
+        self.assertIn(product.pk, catalog.products)
+
+        # a hard delete cascading to the product leaves nothing in the feed
+        webshops.models.Category._base_manager.filter(pk=category.pk).delete()
+        with override_settings(WEBSHOPS_SNAPSHOT_RECONCILE_SECONDS=3600):
+            catalog = webshops.snapshot.get_snapshot(self.webshop.pk)
+        self.assertIn(product.pk, catalog.products)
+        with override_settings(WEBSHOPS_SNAPSHOT_RECONCILE_SECONDS=0):
+            catalog = webshops.snapshot.get_snapshot(self.webshop.pk)
+        self.assertNotIn(category.pk, catalog.categories)
+        self.assertEqual(sorted(catalog.products), sorted([self.parent.pk, self.child.pk]))
+        self.assertEqual(
+            [_record.pk for _record in catalog.product_list],
+            [_record.pk for _record in sorted(
+                catalog.products.values(), key=lambda _record: _record.sort_key)])
+
+    @transaction.atomic()
+    def test_row_budget(self):
+        """ Testing webshops.snapshot.get_snapshot row budget """
+        with override_settings(WEBSHOPS_SNAPSHOT_MAX_ROWS=2), mock.patch.object(
+                webshops.snapshot.CatalogSnapshot, 'load') as load:
+            self.assertIsNone(webshops.snapshot.get_snapshot(self.webshop.pk))
+        self.assertFalse(load.called)
+        with override_settings(WEBSHOPS_SNAPSHOT_RETRY_SECONDS=0):
+            self.assertTrue(webshops.snapshot.get_snapshot(self.webshop.pk))
@@ -0,0 +1,39 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+import webshops.storefront
+
+__author__ = 'smirnov.ev'
+
+
+class StorefrontTestCase(SimpleTestCase):
+
+    def test_build_tree(self):
+        """ Testing webshops.storefront.build_tree function """
+        tree = webshops.storefront.build_tree([
+            (1, 'A', None), (2, 'B', 1), (3, 'C', 2), (4, 'D', 5), (6, 'E', None)])
+        self.assertEqual(tree, [
+            dict(id=1, name='A', children=[
+                dict(id=2, name='B', children=[dict(id=3, name='C', children=[])])]),
+            dict(id=6, name='E', children=[]),
+        ])
+        self.assertEqual(webshops.storefront.count_nodes(tree), 4)
+
+    def test_cache_key(self):
+        """ Testing webshops.storefront.cache_key and invalidate functions """
+        key = webshops.storefront.cache_key('home', 1)
+        self.assertEqual(key, webshops.storefront.cache_key('home', 1))
+        self.assertNotEqual(key, webshops.storefront.cache_key('home', 2))
+        webshops.storefront.invalidate(1)
+        self.assertNotEqual(key, webshops.storefront.cache_key('home', 1))
+
+    @override_settings(WEBSHOPS_HOME_CACHE_SECONDS=600, WEBSHOPS_STOREFRONT_LOCAL_CACHE_SECONDS=5)
+    def test_cache_timeout(self):
+        """ Testing webshops.storefront.cache_timeout function """
+        self.assertEqual(webshops.storefront.cache_timeout(), 5)
+        with self.settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertEqual(webshops.storefront.cache_timeout(), 600)
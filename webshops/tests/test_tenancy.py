@@ -0,0 +1,98 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from simpleAPI.testtools import BaseTest
+
+import webshops.factories
+import webshops.middleware
+import webshops.models
+import webshops.tenancy
+
+__author__ = 'smirnov.ev'
+
+
+class TenancyTestCase(BaseTest):
+
+    def setUp(self):
+        self.webshop1 = webshops.factories.WebshopFactory.create()
+        self.webshop2 = webshops.factories.WebshopFactory.create()
+        self.category1 = webshops.factories.CategoryFactory.create(webshop=self.webshop1)
+        self.product1 = webshops.factories.ProductFactory.create(
+            webshop=self.webshop1, category=self.category1)
+        self.product2 = webshops.factories.ProductFactory.create(
+            webshop=self.webshop2,
+            category=webshops.factories.CategoryFactory.create(webshop=self.webshop2))
+
+    def tearDown(self):
+        self.product1.delete()
+        self.product2.delete()
+
+    @transaction.atomic()
+    def test_scoped(self):
+        """ Testing webshops.tenancy.scoped context manager """
+        _model = webshops.models.Product
+        self.assertIsNone(webshops.tenancy.get_current_webshop_id())
+        self.assertEqual(_model.objects.filter(
+            pk__in=(self.product1.pk, self.product2.pk)).count(), 2)
+
+        with webshops.tenancy.scoped(self.webshop1.pk):
+            self.assertEqual(webshops.tenancy.get_current_webshop_id(), self.webshop1.pk)
+            self.assertEqual(list(_model.objects.all()), [self.product1])
+            self.assertEqual(
+                list(webshops.models.Webshop.objects.all()), [self.webshop1])
+            self.assertEqual(
+                list(webshops.models.Category.objects.all()), [self.category1])
+            self.assertIsNone(_model.objects.filter(pk=self.product2.pk).last())
+
+        self.assertIsNone(webshops.tenancy.get_current_webshop_id())
+
+    def test_cache_key(self):
+        """ Testing webshops.tenancy.cache_key function """
+        self.assertEqual(webshops.tenancy.cache_key('home'), 'webshop:*:home')
+        self.assertEqual(webshops.tenancy.cache_key('home', 3), 'webshop:3:home')
+        with webshops.tenancy.scoped(self.webshop1.pk):
+            self.assertEqual(
+                webshops.tenancy.cache_key('home'),
+                'webshop:{}:home'.format(self.webshop1.pk))
+
+    def test_tenant_middleware(self):
+        """ Testing webshops.middleware.TenantMiddleware """
+        seen = []
+
+        def view(request):
+            seen.append(webshops.tenancy.get_current_webshop_id())
+            return HttpResponse()
+
+        middleware = webshops.middleware.TenantMiddleware(view)
+        factory = RequestFactory()
+
+        middleware(factory.get('/', HTTP_X_WEBSHOP='{}'.format(self.webshop2.pk)))
+        self.assertEqual(seen, [self.webshop2.pk])
+
+        response = middleware(factory.get('/', HTTP_X_WEBSHOP='shop'))
+        self.assertEqual(response.status_code, 400)
+
+        self.webshop1.active = True
+        self.webshop1.save()
+        with self.settings(ALLOWED_HOSTS=[self.webshop1.site.domain]):
+            middleware(factory.get('/', HTTP_HOST=self.webshop1.site.domain))
+        self.assertEqual(seen, [self.webshop2.pk, self.webshop1.pk])
+        self.assertIsNone(webshops.tenancy.get_current_webshop_id())
+
+    @transaction.atomic()
+    def test_tenant_host_invalidation(self):
+        """ Testing webshops.middleware.TenantMiddleware host cache invalidation """
+        middleware = webshops.middleware.TenantMiddleware(lambda request: None)
+        host = self.webshop1.site.domain
+
+        self.webshop1.active = True
+        self.webshop1.save()
+        self.assertEqual(middleware.get_webshop_id_for_host(host), self.webshop1.pk)
+
+        self.webshop1.active = False
+        self.webshop1.save()
+        self.assertIsNone(middleware.get_webshop_id_for_host(host))
@@ -0,0 +1,82 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from rest_framework.test import APIClient
+
+from simpleAPI.testtools import BaseTest
+
+import webshops.coalescing
+
+__author__ = 'smirnov.ev'
+
+
+class ThrottlingTestCase(BaseTest):
+
+    def setUp(self):
+        caches['throttle'].clear()
+
+    @transaction.atomic()
+    @override_settings(WEBSHOPS_THROTTLE_RATES={'catalog': (2, 0.001)})
+    def test_catalog_throttle(self):
+        """ Testing webshops.throttling.CatalogThrottle token bucket """
+        apiclient = APIClient()
+        url = reverse('webshops:api_category-list')
+        self.assertEqual(apiclient.get(url).status_code, 200)
+        self.assertEqual(apiclient.get(url).status_code, 200)
+        res = apiclient.get(url)
+        self.assertEqual(res.status_code, 429)
+        self.assertTrue(int(res['Retry-After']) > 0)
+
+        # other clients have their own bucket
+        res = apiclient.get(url, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(res.status_code, 200)
+
+
+class SingleFlightTestCase(SimpleTestCase):
+
+    def test_do(self):
+        """ Testing webshops.coalescing.SingleFlight do method """
+        group = webshops.coalescing.SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def _expensive():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 42
+
+        leader = threading.Thread(target=lambda: results.append(group.do('key', _expensive)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(group.do('key', _expensive)))
+        follower.start()
+        time.sleep(.1)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(results, [42, 42])
+        self.assertEqual(len(calls), 1)
+
+        # finished calls aren't shared
+        self.assertEqual(group.do('key', lambda: 7), 7)
+
+    def test_do_error(self):
+        """ Testing webshops.coalescing.SingleFlight do method errors """
+        group = webshops.coalescing.SingleFlight()
+
+        def _fail():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            group.do('key', _fail)
+        self.assertEqual(group.do('key', lambda: 1), 1)
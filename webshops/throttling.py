@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+    Per-client token bucket throttles. Buckets live in the ``throttle`` cache
+    (local memory, i.e. per process); ``settings.WEBSHOPS_THROTTLE_RATES``
+    maps a scope to (burst, tokens per second), scopes without a rate aren't
+    throttled.
+"""
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import throttling
+
+_lock = threading.Lock()
+
+
+class TokenBucketThrottle(throttling.BaseThrottle):
+    scope = None
+    cache_alias = 'throttle'
+
+    def get_rate(self):
+        return settings.WEBSHOPS_THROTTLE_RATES.get(self.scope)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = 'user:{}'.format(request.user.pk)
+        else:
+            ident = self.get_ident(request)
+        return 'throttle:{}:{}'.format(self.scope, ident)
+
+    def allow_request(self, request, view):
+        rate = self.get_rate()
+        if not rate:
+            return True
+        burst, per_second = rate
+        key = self.get_cache_key(request, view)
+        cache = caches[self.cache_alias]
+        # a full bucket is the same as no bucket
+        timeout = int(burst / float(per_second)) + 1
+
+        with _lock:
+            now = time.time()
+            tokens, stamp = cache.get(key) or (burst, now)
+            tokens = min(burst, tokens + (now - stamp) * per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            cache.set(key, (tokens, now), timeout)
+        self.wait_seconds = None if allowed else (1 - tokens) / per_second
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class CatalogThrottle(TokenBucketThrottle):
+    scope = 'catalog'
@@ -4,10 +4,12 @@ from webshops import apis
 
 router = DefaultRouter()
 
+router.register(r'api/cart', apis.CartViewSet, basename='api_cart')
 router.register(r'api/category', apis.CategoryViewSet, basename='api_category')
 router.register(r'api/order', apis.OrderViewSet, basename='api_order')
 router.register(
     r'api/idonly/product', apis.ProductIdOnlyViewSet, basename='api_idonly_product')
 router.register(r'api/product', apis.ProductViewSet, basename='api_product')
+router.register(r'api/webshop', apis.WebshopViewSet, basename='api_webshop')
 
 urlpatterns = router.urls